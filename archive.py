@@ -0,0 +1,78 @@
+# archive.py
+# تراکنش‌های تمام‌شده قدیمی به archive.transactions منتقل می‌شوند تا جدول و ایندکس‌های زنده کوچک بمانند
+#
+#   python archive.py --after-days 30 --batch-size 500 --vacuum incremental
+import argparse
+import datetime
+import threading
+import time
+import db
+
+AFTER_DAYS = 30
+BATCH_SIZE = 500
+# پیام‌های ارسال‌شده outbox بعد از این مدت پاک می‌شوند
+OUTBOX_DAYS = 7
+# مکث کوتاه بین دسته‌ها تا نوشتن‌های ربات پشت قفل نوشتن نمانند
+BATCH_PAUSE = 0.05
+
+
+def run_archive(after_days=AFTER_DAYS, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    before = (datetime.datetime.utcnow() - datetime.timedelta(days=after_days)).isoformat()
+    total = 0
+    while True:
+        moved = db.archive_transactions(before, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def purge_outbox(outbox_days=OUTBOX_DAYS):
+    before = (datetime.datetime.utcnow() - datetime.timedelta(days=outbox_days)).isoformat()
+    return db.purge_outbox(before)
+
+
+def start_archiver(interval, after_days=AFTER_DAYS, batch_size=BATCH_SIZE, outbox_days=OUTBOX_DAYS):
+    def loop():
+        while True:
+            try:
+                moved = run_archive(after_days, batch_size)
+                purge_outbox(outbox_days)
+                freed = db.incremental_vacuum()
+                if moved or freed:
+                    print(f"archived {moved} transactions, freed {freed} pages")
+            except Exception as e:
+                print(f"archive run failed: {e!r}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="archiver", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old terminal transactions into the archive database")
+    parser.add_argument("--after-days", type=int, default=AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--outbox-days", type=int, default=OUTBOX_DAYS)
+    parser.add_argument(
+        "--vacuum",
+        choices=("none", "incremental", "full"),
+        default="incremental",
+        help="full یک بار لازم است تا فایل‌های قدیمی auto_vacuum=INCREMENTAL بگیرند",
+    )
+    args = parser.parse_args()
+
+    db.init_db()
+    moved = run_archive(args.after_days, args.batch_size)
+    print(f"archived {moved:,} transactions")
+    print(f"purged {purge_outbox(args.outbox_days):,} sent outbox rows")
+    if args.vacuum == "incremental":
+        print(f"freed {db.incremental_vacuum():,} pages")
+    elif args.vacuum == "full":
+        db.vacuum()
+        print("vacuumed")
+
+
+if __name__ == "__main__":
+    main()
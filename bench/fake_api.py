@@ -0,0 +1,113 @@
+# bench/fake_api.py
+# سرور محلی که به جای api.telegram.org جواب می‌دهد؛ فقط شمارش و تأخیر مصنوعی، بدون منطق تلگرام
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# متدهایی که به جای Message مقدار دیگری برمی‌گردانند
+_TRUE_METHODS = {"answerCallbackQuery", "setWebhook", "deleteWebhook", "deleteMessage"}
+_LIST_METHODS = {"forwardMessages", "copyMessages", "sendMediaGroup"}
+
+
+class FakeBotApi:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, record=False):
+        self.latency = latency
+        self.counts = Counter()
+        # record=True: هر درخواست به صورت (method, params) نگه داشته می‌شود (برای تست‌ها)
+        self.record = record
+        self.calls = []
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def api_url(self):
+        # قالب apihelper.API_URL و asyncio_helper.API_URL
+        return self.url + "/bot{0}/{1}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.calls.clear()
+
+    def total(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _result(self, method, params):
+        chat_id = params.get("chat_id") or 0
+        try:
+            chat_id = int(chat_id)
+        except ValueError:
+            chat_id = 0
+        if method in _TRUE_METHODS:
+            return True
+        message_id = next(self._message_ids)
+        if method in _LIST_METHODS:
+            return [{"message_id": message_id}]
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": "",
+        }
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                content_type = self.headers.get("Content-Type", "")
+                if "json" in content_type and body:
+                    params.update(json.loads(body))
+                elif "urlencoded" in content_type:
+                    params.update({k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()})
+
+                with api._lock:
+                    api.counts[method] += 1
+                    if api.record:
+                        api.calls.append((method, params))
+                if api.latency:
+                    time.sleep(api.latency)
+
+                out = json.dumps({"ok": True, "result": api._result(method, params)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,387 @@
+# bench/load.py
+# بنچمارک کامل جریان حواله: N مشتری و M ادمین روی یک Bot API جعلی محلی
+#
+#   python bench/load.py --customers 200 --admins 3
+#   python bench/load.py --runtime async --customers 200 --compare bench/results/<old>.json
+#
+# هر مشتری به ترتیب: /start، دکمه حواله، مبلغ، confirm_uk، admin_sendacc، admin_chooseacc،
+# عکس رسید، confirm_tx، اطلاعات گیرنده، done_tx. نتیجه در bench/results/ به صورت JSON ذخیره می‌شود.
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_api import FakeBotApi  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+CUSTOMER_BASE_ID = 100000
+UK_START_TEXT = "💸 حواله از انگلستان به ایران"
+
+STEPS = (
+    "start",
+    "uk_start",
+    "amount",
+    "confirm_uk",
+    "admin_sendacc",
+    "admin_chooseacc",
+    "receipt",
+    "confirm_tx",
+    "recipient_info",
+    "done_tx",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark against a fake Bot API")
+    parser.add_argument("--runtime", choices=("sync", "async"), default="sync")
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=None, help="مشتری‌های هم‌زمان (پیش‌فرض: همه)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="تأخیر مصنوعی هر درخواست API به میلی‌ثانیه")
+    parser.add_argument("--db", default=None, help="مسیر فایل SQLite (پیش‌فرض: فایل موقت)")
+    parser.add_argument("--out", default=None, help="مسیر فایل JSON نتیجه")
+    parser.add_argument("--compare", default=None, help="نتیجه قبلی برای مقایسه")
+    return parser.parse_args()
+
+
+def configure_env(args):
+    # config.py در import مقدارها را می‌خواند؛ پس قبل از import bot تنظیم می‌شوند
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="sarafi-bench-"), "bench.db")
+    os.environ["DB_NAME"] = db_path
+    os.environ["BOT_TOKEN"] = "1:bench"
+    os.environ["ADMIN_IDS"] = ",".join(str(i) for i in range(1, args.admins + 1))
+    os.environ["BOT_RUNTIME"] = args.runtime
+    # محدودیت نرخ واقعی تلگرام اینجا فقط زمان تخلیه صف را زیاد می‌کند
+    os.environ.setdefault("BROADCAST_GLOBAL_RATE", "100000")
+    os.environ.setdefault("BROADCAST_PER_CHAT_RATE", "100000")
+    return db_path
+
+
+class Updates:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, chat_id, **fields):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+        }
+        message.update(fields)
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def text(self, chat_id, text):
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._message(chat_id, **fields)
+
+    def photo(self, chat_id, file_id):
+        return self._message(chat_id, photo=[{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}])
+
+    def callback(self, user_id, data):
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                },
+            },
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = 0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+
+    def trace(self, sql):
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+        with self._lock:
+            self.statements[keyword] += 1
+
+    def record(self, step, seconds, failed=False):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if failed:
+                self.errors += 1
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3),
+    }
+
+
+def latest_tx_id(db_path, user_id):
+    # اتصال جدا و بدون trace تا شمارش statementهای خود ربات دست نخورد
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT id FROM transactions WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def customer_steps(updates, db_path, customer_id, admin_id, account_id):
+    # generator: هر yield یک (step, update) است؛ tx_id بعد از confirm_uk از DB خوانده می‌شود
+    yield "start", updates.text(customer_id, "/start")
+    yield "uk_start", updates.text(customer_id, UK_START_TEXT)
+    yield "amount", updates.text(customer_id, str(100 + customer_id % 900))
+    yield "confirm_uk", updates.callback(customer_id, "confirm_uk")
+    tx_id = latest_tx_id(db_path, customer_id)
+    if tx_id is None:
+        return
+    yield "admin_sendacc", updates.callback(admin_id, f"admin_sendacc_{tx_id}")
+    yield "admin_chooseacc", updates.callback(admin_id, f"admin_chooseacc_{tx_id}_{account_id}")
+    yield "receipt", updates.photo(customer_id, f"receipt-{customer_id}")
+    yield "confirm_tx", updates.callback(admin_id, f"confirm_tx_{tx_id}")
+    yield "recipient_info", updates.text(customer_id, f"Recipient {customer_id}\n6037990000000000\nIR000000000000000000000000")
+    yield "done_tx", updates.callback(admin_id, f"done_tx_{tx_id}")
+
+
+def outbox_pending():
+    import db
+
+    return db.outbox_counts().get("PENDING", 0)
+
+
+def run_sync(args, db_path, recorder, customers, account_id):
+    import bot
+    from telebot import types
+
+    bot.bot.threaded = False
+    bot.broadcaster.start()
+    bot.outbox_sender.start()
+    bot.receipt_collector.start()
+    updates = Updates()
+
+    def run_customer(index):
+        customer_id = CUSTOMER_BASE_ID + index
+        admin_id = 1 + index % args.admins
+        for step, raw in customer_steps(updates, db_path, customer_id, admin_id, account_id):
+            update = types.Update.de_json(raw)
+            started = time.perf_counter()
+            failed = False
+            try:
+                bot.bot.process_new_updates([update])
+            except Exception:
+                failed = True
+            recorder.record(step, time.perf_counter() - started, failed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency or customers) as pool:
+        list(pool.map(run_customer, range(customers)))
+    handled = time.perf_counter() - started
+
+    # اعلان‌های پس‌زمینه (outbox) هم جزو کار هر تراکنش‌اند
+    bot.receipt_collector.stop()
+    while outbox_pending() or bot.outbox_sender.pending() or bot.broadcaster.pending():
+        time.sleep(0.05)
+    bot.outbox_sender.stop()
+    bot.broadcaster.stop()
+    return handled, time.perf_counter() - started
+
+
+def run_async(args, db_path, recorder, customers, account_id):
+    import bot_async
+    from telebot import types
+
+    updates = Updates()
+
+    async def run_customer(index, semaphore):
+        customer_id = CUSTOMER_BASE_ID + index
+        admin_id = 1 + index % args.admins
+        async with semaphore:
+            steps = customer_steps(updates, db_path, customer_id, admin_id, account_id)
+            for step, raw in steps:
+                update = types.Update.de_json(raw)
+                started = time.perf_counter()
+                failed = False
+                try:
+                    await bot_async.bot.process_new_updates([update])
+                except Exception:
+                    failed = True
+                recorder.record(step, time.perf_counter() - started, failed)
+
+    async def main():
+        bot_async.outbox_sender.start()
+        semaphore = asyncio.Semaphore(args.concurrency or customers)
+        started = time.perf_counter()
+        await asyncio.gather(*(run_customer(i, semaphore) for i in range(customers)))
+        handled = time.perf_counter() - started
+        await bot_async.receipt_collector.stop()
+        while await bot_async.run_db(outbox_pending) or bot_async.outbox_sender.pending():
+            await asyncio.sleep(0.05)
+        await bot_async.outbox_sender.stop()
+        await bot_async.broadcaster.stop()
+        await bot_async.bot.close_session()
+        bot_async.db_executor.shutdown(wait=True)
+        return handled, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def count_done(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM transactions WHERE status = 'DONE'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def compare(result, previous):
+    rows = [
+        ("updates/s", result["throughput"]["updates_per_s"], previous["throughput"]["updates_per_s"]),
+        ("flows/s", result["throughput"]["flows_per_s"], previous["throughput"]["flows_per_s"]),
+        ("p50 ms", result["latency"]["all"]["p50_ms"], previous["latency"]["all"]["p50_ms"]),
+        ("p95 ms", result["latency"]["all"]["p95_ms"], previous["latency"]["all"]["p95_ms"]),
+        ("p99 ms", result["latency"]["all"]["p99_ms"], previous["latency"]["all"]["p99_ms"]),
+        ("db stmts/tx", result["db"]["statements_per_tx"], previous["db"]["statements_per_tx"]),
+        ("api calls/tx", result["api"]["calls_per_tx"], previous["api"]["calls_per_tx"]),
+    ]
+    print(f"\ncompared with {previous.get('commit')} ({previous.get('runtime')}):")
+    for name, new, old in rows:
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:<14}{old:>12,.2f} -> {new:>12,.2f}  {change}")
+
+
+def main():
+    args = parse_args()
+    db_path = configure_env(args)
+
+    import dbconn
+    import db
+
+    db.init_db()
+    account_id = db.add_uk_account("BENCH", "00-00-00", "00000000", "Bench Ltd")
+    done_before = count_done(db_path)
+
+    api = FakeBotApi(latency=args.api_latency / 1000).start()
+    from telebot import apihelper, asyncio_helper
+
+    apihelper.API_URL = api.api_url()
+    asyncio_helper.API_URL = api.api_url()
+
+    recorder = Recorder()
+    dbconn.set_trace(recorder.trace)
+
+    runner = run_async if args.runtime == "async" else run_sync
+    handled, elapsed = runner(args, db_path, recorder, args.customers, account_id)
+    dbconn.set_trace(None)
+    api.stop()
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    completed = count_done(db_path) - done_before
+    statements = sum(recorder.statements.values())
+    api_calls = api.snapshot()
+    api_total = sum(api_calls.values())
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "runtime": args.runtime,
+        "python": sys.version.split()[0],
+        "customers": args.customers,
+        "admins": args.admins,
+        "concurrency": args.concurrency or args.customers,
+        "api_latency_ms": args.api_latency,
+        "completed_flows": completed,
+        "errors": recorder.errors,
+        "updates": len(all_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "handler_elapsed_s": round(handled, 3),
+        "throughput": {
+            "updates_per_s": round(len(all_latencies) / handled, 2),
+            "flows_per_s": round(completed / elapsed, 2),
+        },
+        "latency": {
+            "all": latency_summary(all_latencies),
+            "steps": {step: latency_summary(recorder.latencies[step]) for step in STEPS if recorder.latencies[step]},
+        },
+        "db": {
+            "statements": statements,
+            "statements_per_tx": round(statements / max(completed, 1), 2),
+            "by_kind": dict(recorder.statements.most_common()),
+        },
+        "api": {
+            "calls": api_total,
+            "calls_per_tx": round(api_total / max(completed, 1), 2),
+            "by_method": dict(sorted(api_calls.items(), key=lambda item: -item[1])),
+        },
+    }
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit'] or 'nogit'}-{args.runtime}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    all_stats = result["latency"]["all"]
+    print(
+        f"{args.runtime}: {completed}/{args.customers} flows in {elapsed:.2f}s "
+        f"({result['throughput']['updates_per_s']:,.0f} updates/s, {result['throughput']['flows_per_s']:,.1f} flows/s)\n"
+        f"latency p50={all_stats['p50_ms']}ms p95={all_stats['p95_ms']}ms p99={all_stats['p99_ms']}ms\n"
+        f"db statements/tx={result['db']['statements_per_tx']} api calls/tx={result['api']['calls_per_tx']} "
+        f"errors={recorder.errors}\n"
+        f"saved {out}"
+    )
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# bot_async.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from telebot.async_telebot import AsyncTeleBot
+from config import (
+    BOT_TOKEN,
+    ADMIN_IDS,
+    DB_EXECUTOR_WORKERS,
+    BOT_MODE,
+    WEBHOOK_SECRET,
+    BROADCAST_GLOBAL_RATE,
+    BROADCAST_PER_CHAT_RATE,
+    RECEIPT_GROUP_WINDOW,
+    WORKER_PARTITIONS,
+    WORKER_QUEUE_SIZE,
+    FLOOD_RATE,
+    FLOOD_BURST,
+    FLOOD_MAX_CHATS,
+    SHED_QUEUE_DEPTH,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_MAX_ATTEMPTS,
+)
+import metrics
+from flood import FloodControl
+from dispatcher import AsyncPartitionedDispatcher
+from broadcaster import AsyncBroadcaster, RateLimits
+from handlers import Handlers, run_async
+from outbox import AsyncOutboxSender
+from receipts import AsyncReceiptCollector
+from scheduler import AsyncScheduler
+
+bot = AsyncTeleBot(BOT_TOKEN, parse_mode="HTML")
+
+broadcaster = AsyncBroadcaster(
+    bot,
+    limits=RateLimits(global_rate=BROADCAST_GLOBAL_RATE, per_chat_rate=BROADCAST_PER_CHAT_RATE),
+)
+
+# sqlite3 بلوکه می‌کند؛ همه فراخوانی‌های db.py روی این pool محدود اجرا می‌شوند تا event loop آزاد بماند
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+
+# اعلان‌های تغییر وضعیت در همان تراکنش DB در outbox نوشته می‌شوند و این sender آن‌ها را به broadcaster می‌دهد
+outbox_sender = AsyncOutboxSender(
+    broadcaster,
+    run_db,
+    batch_size=OUTBOX_BATCH_SIZE,
+    interval=OUTBOX_POLL_INTERVAL,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+)
+# یک task و یک heap برای همه مهلت‌ها؛ کلیدها ("tx", tx_id) و ("quote", chat_id)
+scheduler = AsyncScheduler(lambda keys: run_async(handlers.handle_deadlines(keys), bot, run_db))
+# منطق همه handlerها در handlers.py است؛ اینجا effectهایشان با AsyncTeleBot و روی db_executor اجرا می‌شوند
+handlers = Handlers(scheduler, outbox_sender)
+user_state = handlers.user_state
+catalog = handlers.catalog
+router = handlers.router
+
+# updateهای هر کاربر روی یک worker ثابت و به ترتیب؛ polling و وب‌هوک فقط به dispatcher تحویل می‌دهند.
+# flood قبل از صف: سیل پیام یک چت یا بار زیاد به دیتابیس و handlerها نمی‌رسد
+flood = FloodControl(ADMIN_IDS, FLOOD_RATE, FLOOD_BURST, FLOOD_MAX_CHATS, SHED_QUEUE_DEPTH)
+dispatcher = AsyncPartitionedDispatcher(
+    bot.process_new_updates, partitions=WORKER_PARTITIONS, queue_size=WORKER_QUEUE_SIZE, admit=flood.admit
+)
+
+# آلبوم‌ها روی partition همان چت flush می‌شوند
+receipt_collector = AsyncReceiptCollector(
+    lambda messages: run_async(handlers.process_receipts(messages), bot, run_db),
+    window=RECEIPT_GROUP_WINDOW,
+    submit=dispatcher.submit,
+)
+
+
+def adapt(handler):
+    # همان نام handler برای metrics
+    @functools.wraps(handler)
+    async def run(update):
+        return await run_async(handler(update), bot, run_db)
+    return run
+
+
+for commands, handler in handlers.commands:
+    bot.register_message_handler(adapt(handler), commands=commands)
+
+
+@bot.message_handler(content_types=["photo"])
+async def handle_receipt(message):
+    await receipt_collector.add(message)
+
+
+# این دو handler باید آخر ثبت شوند تا commandها (/start، /admin، ...) قبل از آن‌ها بررسی شوند
+bot.register_message_handler(adapt(handlers.route_text), content_types=["text"])
+bot.register_callback_query_handler(adapt(handlers.route_callback), func=lambda call: True)
+
+
+# --------- metrics ---------
+# بعد از ثبت همه handlerها؛ هر handler، فراخوانی API و (در db.py) هر تابع و statement زمان‌سنجی می‌شود
+if metrics.METRICS_ENABLED:
+    metrics.instrument_bot(bot)
+    handlers.instrument()
+    metrics.instrument_api()
+    metrics.registry.gauge("broadcaster_pending", broadcaster.pending, "Outgoing messages waiting to be sent")
+    metrics.registry.gauge("outbox_in_flight", outbox_sender.pending, "Outbox rows handed to the broadcaster")
+    metrics.registry.gauge("outbox_dead", lambda: outbox_sender.dead_rows, "Dead-lettered outbox rows")
+    metrics.registry.gauge("dispatcher_pending", dispatcher.pending, "Updates waiting for a partition worker")
+    metrics.registry.gauge("conversation_states", lambda: len(user_state), "Conversation states held in memory")
+    metrics.registry.gauge("scheduled_deadlines", scheduler.pending, "Quote and transaction deadlines waiting to fire")
+    metrics.registry.gauge("flood_throttled", lambda: flood.stats["throttled"], "Updates dropped by per-chat flood control")
+    metrics.registry.gauge("flood_shed", lambda: flood.stats["shed"], "Customer updates shed while a worker queue was full")
+    metrics.registry.gauge("flood_tracked_chats", lambda: len(flood), "Chats with a flood-control bucket")
+    metrics.registry.gauge("db_executor_queue", db_executor._work_queue.qsize, "DB calls waiting for a worker thread")
+
+
+# --------- run ---------
+async def _run_webhook():
+    import webhook
+
+    loop = asyncio.get_running_loop()
+
+    def dispatch(updates):
+        # worker وب‌هوک تا پایان پردازش batch منتظر می‌ماند؛ پر شدن صف همان backpressure است
+        asyncio.run_coroutine_threadsafe(bot.process_new_updates(updates), loop).result()
+
+    server = webhook.build_server(dispatch)
+    metrics.registry.gauge("webhook_queue_depth", server.queue.qsize, "Updates waiting for a webhook worker")
+    url = webhook.public_url()
+    if url:
+        await bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET or None)
+    server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await loop.run_in_executor(None, server.stop)
+
+
+async def _run():
+    await run_async(handlers.startup(), bot, run_db)
+    outbox_sender.start()
+    scheduler.start()
+    # polling برای هر batch یک task می‌سازد؛ dispatcher ترتیب هر کاربر را نگه می‌دارد
+    dispatcher.start()
+    bot.process_new_updates = dispatcher.dispatch
+    try:
+        if BOT_MODE == "webhook":
+            await _run_webhook()
+        else:
+            await bot.infinity_polling()
+    finally:
+        await dispatcher.stop()
+        await receipt_collector.stop()
+        await scheduler.stop()
+        # ردیف‌هایی که نتیجه‌شان ثبت نشده PENDING می‌مانند و بعد از restart فرستاده می‌شوند
+        await outbox_sender.stop()
+        await broadcaster.stop()
+        await bot.close_session()
+        db_executor.shutdown(wait=True)
+
+
+def main():
+    print("Bot is running (async)...")
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
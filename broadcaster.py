@@ -0,0 +1,271 @@
+# broadcaster.py
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+# محدودیت‌های اعلام‌شده تلگرام: حدود ۳۰ پیام در ثانیه کلی و ۱ پیام در ثانیه برای هر چت
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+PER_CHAT_BURST = 3
+MAX_RETRIES = 5
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now=None):
+        # اگر توکن باشد برمی‌دارد و 0 برمی‌گرداند؛ وگرنه چند ثانیه باید صبر کرد
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds, now=None):
+        # بعد از 429 تا retry_after توکنی به این bucket داده نمی‌شود
+        now = time.monotonic() if now is None else now
+        self.tokens = -seconds * self.rate
+        self.updated = now
+
+
+class RateLimits:
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE,
+                 per_chat_burst=PER_CHAT_BURST, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def reserve(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            chat = self._chat_bucket(chat_id)
+            # اول bucket چت: اگر خود چت محدود است توکن کلی را هدر نمی‌دهیم
+            wait = chat.reserve(now)
+            if wait:
+                return wait
+            wait = self.global_bucket.reserve(now)
+            if wait:
+                chat.tokens += 1
+            return wait
+
+    def pause_chat(self, chat_id, seconds):
+        with self._lock:
+            self._chat_bucket(chat_id).pause(seconds)
+
+
+def retry_after(error):
+    # ApiTelegramException نسخه sync و async کلاس‌های جدا هستند؛ هر دو error_code و result_json دارند
+    if getattr(error, "error_code", None) != 429:
+        return None
+    parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return float(parameters.get("retry_after") or 1)
+
+
+def is_permanent(error):
+    code = getattr(error, "error_code", None)
+    return code is not None and code != 429 and code < 500
+
+
+class Job:
+    __slots__ = ("chat_id", "steps", "position", "attempts", "on_done")
+
+    def __init__(self, chat_id, steps, on_done=None):
+        self.chat_id = chat_id
+        # هر step یک (method, args, kwargs) است؛ stepهای یک job به ترتیب برای همان چت ارسال می‌شوند
+        self.steps = steps
+        self.position = 0
+        self.attempts = 0
+        self.on_done = on_done
+
+
+class Broadcaster:
+    def __init__(self, bot, workers=4, limits=None, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.limits = limits or RateLimits()
+        self.max_retries = max_retries
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "throttled": 0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"broadcaster-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        self._running = True
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def submit(self, chat_id, steps, on_done=None):
+        self._schedule(Job(chat_id, steps, on_done), 0)
+
+    def send(self, method, chat_id, *args, on_done=None, **kwargs):
+        self.submit(chat_id, [(method, (chat_id,) + args, kwargs)], on_done)
+
+    def broadcast(self, method, chat_ids, *args, **kwargs):
+        for chat_id in chat_ids:
+            self.send(method, chat_id, *args, **kwargs)
+
+    def _schedule(self, job, delay):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+
+    def _next_job(self):
+        with self._cond:
+            while self._running:
+                if self._heap:
+                    ready_at = self._heap[0][0]
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def _finish(self, job, error=None):
+        self._count("failed" if error else "sent")
+        if job.on_done:
+            try:
+                job.on_done(job, error)
+            except Exception as e:
+                print(f"broadcaster on_done failed: {e!r}")
+
+    def _count(self, key):
+        with self._cond:
+            self.stats[key] += 1
+
+    def _run(self, job):
+        while job.position < len(job.steps):
+            wait = self.limits.reserve(job.chat_id)
+            if wait:
+                self._count("throttled")
+                self._schedule(job, wait)
+                return
+
+            method, args, kwargs = job.steps[job.position]
+            try:
+                getattr(self.bot, method)(*args, **kwargs)
+            except Exception as e:
+                job.attempts += 1
+                if is_permanent(e) or job.attempts > self.max_retries:
+                    self._finish(job, e)
+                    return
+                delay = retry_after(e)
+                if delay is not None:
+                    self.limits.pause_chat(job.chat_id, delay)
+                else:
+                    delay = min(60, 2 ** job.attempts)
+                self._count("retried")
+                self._schedule(job, delay)
+                return
+            job.position += 1
+        self._finish(job)
+
+
+class AsyncBroadcaster:
+    def __init__(self, bot, concurrency=16, limits=None, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.limits = limits or RateLimits()
+        self.max_retries = max_retries
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "throttled": 0}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    def pending(self):
+        return len(self._tasks)
+
+    def submit(self, chat_id, steps, on_done=None):
+        task = asyncio.get_running_loop().create_task(self._run(Job(chat_id, steps, on_done)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def send(self, method, chat_id, *args, on_done=None, **kwargs):
+        self.submit(chat_id, [(method, (chat_id,) + args, kwargs)], on_done)
+
+    def broadcast(self, method, chat_ids, *args, **kwargs):
+        for chat_id in chat_ids:
+            self.send(method, chat_id, *args, **kwargs)
+
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, job):
+        error = None
+        while job.position < len(job.steps):
+            wait = self.limits.reserve(job.chat_id)
+            if wait:
+                self.stats["throttled"] += 1
+                await asyncio.sleep(wait)
+                continue
+
+            method, args, kwargs = job.steps[job.position]
+            try:
+                async with self._semaphore:
+                    await getattr(self.bot, method)(*args, **kwargs)
+            except Exception as e:
+                job.attempts += 1
+                if is_permanent(e) or job.attempts > self.max_retries:
+                    error = e
+                    break
+                delay = retry_after(e)
+                if delay is not None:
+                    self.limits.pause_chat(job.chat_id, delay)
+                else:
+                    delay = min(60, 2 ** job.attempts)
+                self.stats["retried"] += 1
+                await asyncio.sleep(delay)
+                continue
+            job.position += 1
+
+        self.stats["failed" if error else "sent"] += 1
+        if job.on_done:
+            try:
+                job.on_done(job, error)
+            except Exception as e:
+                print(f"broadcaster on_done failed: {e!r}")
@@ -0,0 +1,78 @@
+# catalog.py
+# متن پیام‌ها یک بار از locales/<locale>.json خوانده می‌شود و کیبوردهای ثابت یک بار ساخته و به JSON
+# تبدیل می‌شوند؛ telebot رشته JSON را بدون ساختن دوباره شیء markup می‌فرستد
+import json
+import os
+from string import Template
+from telebot import types
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+DEFAULT_LOCALE = "fa"
+
+
+def _read(locale):
+    with open(os.path.join(LOCALES_DIR, f"{locale}.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    # پیام چندخطی در فایل به صورت لیست خط‌ها نوشته می‌شود
+    return {key: "\n".join(value) if isinstance(value, list) else value for key, value in data.items()}
+
+
+def load_messages(locale=DEFAULT_LOCALE):
+    # کلیدهایی که در زبان انتخابی ترجمه نشده‌اند از fa برداشته می‌شوند
+    messages = _read(DEFAULT_LOCALE)
+    if locale != DEFAULT_LOCALE:
+        messages.update(_read(locale))
+    return messages
+
+
+def _inline(*rows):
+    # هر row لیست (متن، callback_data)؛ callback_data می‌تواند $tx_id داشته باشد
+    kb = types.InlineKeyboardMarkup()
+    for row in rows:
+        kb.row(*(types.InlineKeyboardButton(label, callback_data=data) for label, data in row))
+    return kb.to_json()
+
+
+class Catalog:
+    def __init__(self, locale=DEFAULT_LOCALE):
+        self.locale = locale
+        self.messages = load_messages(locale)
+        m = self.messages
+
+        main_menu = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        for key in ("btn_rates", "btn_uk_to_ir", "btn_ir_to_uk", "btn_help"):
+            main_menu.add(m[key])
+
+        # کیبوردهای ثابت: رشته JSON آماده
+        self.keyboards = {
+            "main_menu": main_menu.to_json(),
+            "rate_kinds": _inline([("CASH", "rate_cash"), ("TRANSFER", "rate_transfer")]),
+            "confirm_quote": _inline([(m["btn_confirm"], "confirm_uk")], [(m["btn_cancel"], "cancel_uk")]),
+            "admin_menu": _inline(
+                [(m["btn_admin_pending"], "admin_pending")],
+                [(m["btn_admin_add_account"], "admin_add_uk_account")],
+                [(m["btn_admin_accounts"], "admin_list_uk_accounts")],
+                [(m["btn_admin_bulk"], "admin_bulk")],
+            ),
+        }
+        # کیبوردهای یک تراکنش: JSON آماده با $tx_id؛ فقط جایگذاری عدد لازم است
+        self.templates = {
+            "tx_actions": Template(_inline(
+                [(m["btn_send_account"], "admin_sendacc_$tx_id")],
+                [(m["btn_cancel_tx"], "admin_cancel_$tx_id")],
+            )),
+            "receipt_review": Template(_inline(
+                [(m["btn_approve_receipt"], "confirm_tx_$tx_id")],
+                [(m["btn_reject_receipt"], "reject_tx_$tx_id")],
+            )),
+            "transfer_done": Template(_inline([(m["btn_transfer_done"], "done_tx_$tx_id")])),
+        }
+
+    def text(self, key, **values):
+        template = self.messages[key]
+        return template.format(**values) if values else template
+
+    def keyboard(self, key, **values):
+        if values:
+            return self.templates[key].substitute(values)
+        return self.keyboards[key]
@@ -6,8 +6,106 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
 
+# sync: telebot.TeleBot  |  async: telebot.async_telebot.AsyncTeleBot
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "sync").lower()
+# حداکثر threadهایی که فراخوانی‌های db.py در حالت async روی آن‌ها اجرا می‌شوند
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+# polling: infinity_polling  |  webhook: سرور HTTP داخلی که تلگرام update را به آن POST می‌کند
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# آدرس عمومی برای setWebhook؛ اگر خالی باشد setWebhook صدا زده نمی‌شود (مثلاً پشت reverse proxy یا در تست محلی)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "32"))
+
+# updateها بر اساس chat_id بین WORKER_PARTITIONS worker پخش می‌شوند؛ ترتیب هر کاربر حفظ می‌شود
+WORKER_PARTITIONS = int(os.getenv("WORKER_PARTITIONS", "4"))
+# حداکثر update منتظر در صف هر worker؛ پر شدن آن polling یا وب‌هوک را عقب نگه می‌دارد
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "100"))
+# هر چت (غیر ادمین) حداکثر FLOOD_RATE update در ثانیه با حداکثر FLOOD_BURST پشت سر هم؛ بقیه قبل از صف دور ریخته می‌شوند
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "12"))
+FLOOD_MAX_CHATS = int(os.getenv("FLOOD_MAX_CHATS", "10000"))
+# وقتی صف یک worker به این عدد برسد updateهای مشتری‌ها دور ریخته می‌شوند و بقیه صف برای ادمین‌ها می‌ماند
+SHED_QUEUE_DEPTH = int(os.getenv("SHED_QUEUE_DEPTH", str(WORKER_QUEUE_SIZE * 3 // 4)))
+
+# ارسال موازی اعلان‌های ادمین با محدودیت نرخ کلی و برای هر چت (پیام در ثانیه)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "4"))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_PER_CHAT_RATE = float(os.getenv("BROADCAST_PER_CHAT_RATE", "1"))
+
+# پیام‌های outbox: هر دسته چند ردیف، فاصله بررسی جدول، تعداد تلاش قبل از dead-letter و مدت نگهداری ارسال‌شده‌ها
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+# منبع نرخ‌ها: فایل JSON در شروع، و/یا آدرس HTTP که هر RATES_REFRESH_SECONDS دوباره خوانده می‌شود
+RATES_FILE = os.getenv("RATES_FILE", "")
+RATES_URL = os.getenv("RATES_URL", "")
+RATES_REFRESH_SECONDS = int(os.getenv("RATES_REFRESH_SECONDS", "60"))
+# مدت اعتبار نرخی که بعد از وارد کردن مبلغ به مشتری اعلام می‌شود
+QUOTE_TTL_SECONDS = int(os.getenv("QUOTE_TTL_SECONDS", "600"))
+
+# مهلت ادمین برای اعلام شماره حساب (0 یعنی بدون انقضا) و اعتبار شماره حساب اعلام‌شده تا رسیدن رسید؛
+# بعد از آن تراکنش EXPIRED می‌شود
+ACCOUNT_WAIT_TTL_SECONDS = int(os.getenv("ACCOUNT_WAIT_TTL_SECONDS", "3600"))
+ACCOUNT_OFFER_TTL_SECONDS = int(os.getenv("ACCOUNT_OFFER_TTL_SECONDS", "1800"))
+
+# وضعیت گفتگو (مرحله مبلغ/تأیید): حداکثر تعداد، مدت اعتبار و ذخیره اختیاری در SQLite برای ماندن بعد از restart.
+# ذخیره پیش‌فرض خاموش است چون هر دکمه یک نوشتن (BEGIN IMMEDIATE پشت قفل نوشتن) اضافه می‌کند
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "10000"))
+STATE_TTL_SECONDS = int(os.getenv("STATE_TTL_SECONDS", "3600"))
+STATE_PERSIST = os.getenv("STATE_PERSIST", "0") == "1"
+
+# عکس‌های یک آلبوم (media_group_id یکسان) تا این چند ثانیه جمع می‌شوند و یک‌جا ثبت می‌شوند
+RECEIPT_GROUP_WINDOW = float(os.getenv("RECEIPT_GROUP_WINDOW", "1.5"))
+
+# تراکنش‌های تمام‌شده قدیمی‌تر از ARCHIVE_AFTER_DAYS هر ARCHIVE_INTERVAL_SECONDS به دیتابیس آرشیو می‌روند (0 یعنی خاموش)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# زبان پیام‌ها و دکمه‌ها: locales/<BOT_LOCALE>.json؛ کلیدهای ترجمه‌نشده از fa برداشته می‌شوند
+BOT_LOCALE = os.getenv("BOT_LOCALE", "fa")
+
+# تعداد ردیف در هر صفحه صف درخواست‌های ادمین
+PENDING_PAGE_SIZE = int(os.getenv("PENDING_PAGE_SIZE", "10"))
+# حداکثر تراکنش قابل انتخاب در هر صفحه /bulk (هر کدام یک دکمه؛ تلگرام حداکثر ۱۰۰ دکمه می‌پذیرد)
+BULK_PAGE_SIZE = int(os.getenv("BULK_PAGE_SIZE", "50"))
+# حداکثر نتیجه‌های /find (هر کدام یک دکمه)
+FIND_RESULTS = int(os.getenv("FIND_RESULTS", "20"))
+
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set")
 
 if not ADMIN_IDS:
     raise RuntimeError("ADMIN_IDS is not set (comma-separated)")
+
+if BOT_RUNTIME not in ("sync", "async"):
+    raise RuntimeError("BOT_RUNTIME must be 'sync' or 'async'")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise RuntimeError("BOT_MODE must be 'polling' or 'webhook'")
+
+if WORKER_PARTITIONS < 1:
+    raise RuntimeError("WORKER_PARTITIONS must be at least 1")
+
+if FLOOD_RATE <= 0 or FLOOD_BURST < 1:
+    raise RuntimeError("FLOOD_RATE must be positive and FLOOD_BURST at least 1")
+
+if not 1 <= SHED_QUEUE_DEPTH < WORKER_QUEUE_SIZE:
+    raise RuntimeError("SHED_QUEUE_DEPTH must be between 1 and WORKER_QUEUE_SIZE - 1")
+
+if ACCOUNT_OFFER_TTL_SECONDS < 60:
+    raise RuntimeError("ACCOUNT_OFFER_TTL_SECONDS must be at least 60")
+
+if not 1 <= BULK_PAGE_SIZE <= 90:
+    raise RuntimeError("BULK_PAGE_SIZE must be between 1 and 90")
+
+if not 1 <= FIND_RESULTS <= 90:
+    raise RuntimeError("FIND_RESULTS must be between 1 and 90")
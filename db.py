@@ -1,164 +1,709 @@
 # db.py
-import sqlite3
 import datetime
+import heapq
+import json
+import threading
+import time
+from collections import namedtuple
+import dbconn
+import metrics
+from dbconn import get_connection, unit_of_work
+from migrations import migrate, check_query_plans
 
-DB_NAME = "database.db"
 
+SQL_PENDING_TRANSACTIONS = """
+    SELECT id, username, final_pence, amount_toman
+    FROM transactions
+    WHERE status = 'WAITING_FOR_ACCOUNT'
+    ORDER BY id DESC
+"""
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            username TEXT,
-            fullname TEXT,
-            amount_gbp REAL,
-            final_gbp REAL,
-            amount_irt REAL,
-            status TEXT,
-            uk_account_text TEXT,
-            receipt_file_id TEXT,
-            created_at TEXT,
-            recipient_name TEXT,
-            recipient_account TEXT,
-            recipient_iban TEXT
-        )
-    """)
+SQL_LATEST_TX_BY_USER_AND_STATUS = """
+    SELECT id, user_id, final_pence, amount_toman
+    FROM transactions
+    WHERE user_id = ? AND status = ?
+    ORDER BY id DESC
+    LIMIT 1
+"""
 
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS uk_accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            bank TEXT,
-            sort_code TEXT,
-            account_number TEXT,
-            name TEXT
-        )
+SQL_TRANSACTIONS_PAGE = """
+    SELECT id, username, final_pence, amount_toman
+    FROM transactions
+    WHERE {where}
+    ORDER BY id {order}
+    LIMIT ?
+"""
+
+# فقط تراکنش‌هایی که مشتری واقعاً رسید فرستاده است (ایندکس یکتای receipts روی tx_id شروع می‌شود)
+SQL_HAS_RECEIPT = "EXISTS (SELECT 1 FROM receipts WHERE receipts.tx_id = transactions.id)"
+
+SQL_GET_TRANSACTION = """
+    SELECT id, user_id, username, fullname, final_pence, amount_toman, status
+    FROM all_transactions
+    WHERE id = ?
+"""
+
+# جستجوی /find در ایندکس FTS5 یک schema (main یا archive)؛ جدیدترها اول، بدون مرتب‌سازی نتیجه
+SQL_SEARCH_TRANSACTIONS = """
+    SELECT t.id, t.user_id, t.username, t.fullname, t.final_pence, t.status
+    FROM {schema}.transactions_fts AS f
+    JOIN {schema}.transactions AS t ON t.id = f.rowid
+    WHERE f.transactions_fts MATCH ?
+    ORDER BY f.rowid DESC
+    LIMIT ?
+"""
+
+# ردیفی که پیام قبلی همان چت هنوز در انتظار retry است برداشته نمی‌شود تا ترتیب پیام‌ها به هم نخورد
+SQL_OUTBOX_DUE = """
+    SELECT id, chat_id, steps, position, attempts
+    FROM outbox AS o
+    WHERE status = 'PENDING' AND next_attempt_at <= ?1
+      AND NOT EXISTS (
+          SELECT 1 FROM outbox AS w
+          WHERE w.chat_id = o.chat_id AND w.status = 'PENDING' AND w.id < o.id AND w.next_attempt_at > ?1
+      )
+    ORDER BY id
+    LIMIT ?2
+"""
+
+# کوئری‌هایی که در مسیر هر پیام اجرا می‌شوند؛ check_query_plans نباید برای آن‌ها full scan ببیند
+HOT_QUERIES = [
+    ("get_pending_transactions", SQL_PENDING_TRANSACTIONS, ()),
+    ("get_latest_tx_by_user_and_status", SQL_LATEST_TX_BY_USER_AND_STATUS, (0, "WAITING_FOR_RECEIPT")),
+    (
+        "get_transactions_page",
+        SQL_TRANSACTIONS_PAGE.format(where="status = ? AND id < ? AND final_pence >= ?", order="DESC"),
+        ("WAITING_FOR_ACCOUNT", 1000, 100, 11),
+    ),
+    (
+        "get_transactions_page (with_receipt)",
+        SQL_TRANSACTIONS_PAGE.format(where=f"status = ? AND {SQL_HAS_RECEIPT}", order="DESC"),
+        ("WAITING_FOR_RECEIPT", 51),
+    ),
+    ("get_transaction", SQL_GET_TRANSACTION, (1,)),
+    ("claim_outbox", SQL_OUTBOX_DUE, (0.0, 50)),
+    *(
+        (f"search_transactions ({schema})", SQL_SEARCH_TRANSACTIONS.format(schema=schema), ('"ali"*', 20))
+        for schema in ("main", "archive")
+    ),
+]
+
+
+# گراف مجاز وضعیت‌ها: from -> {to, ...}؛ status فقط از transition_transaction(s) و expire_transactions عوض می‌شود
+STATUS_TRANSITIONS = {
+    "WAITING_FOR_ACCOUNT": {"WAITING_FOR_RECEIPT", "CANCELLED_BY_ADMIN", "EXPIRED"},
+    "WAITING_FOR_RECEIPT": {"WAITING_FOR_IR_INFO", "RECEIPT_REJECTED", "CANCELLED_BY_ADMIN", "EXPIRED"},
+    "WAITING_FOR_IR_INFO": {"READY_TO_SEND_IR"},
+    "READY_TO_SEND_IR": {"DONE"},
+}
+
+TX_STATUSES = (
+    "WAITING_FOR_ACCOUNT",
+    "WAITING_FOR_RECEIPT",
+    "WAITING_FOR_IR_INFO",
+    "READY_TO_SEND_IR",
+    "DONE",
+    "CANCELLED_BY_ADMIN",
+    "RECEIPT_REJECTED",
+    "EXPIRED",
+)
+
+# وضعیت‌های پایانی؛ بعد از ARCHIVE_AFTER_DAYS به archive.transactions منتقل می‌شوند
+TERMINAL_STATUSES = ("DONE", "CANCELLED_BY_ADMIN", "RECEIPT_REJECTED", "EXPIRED")
+
+# وضعیت‌هایی که با گذشتن expires_at به EXPIRED می‌روند
+EXPIRABLE_STATUSES = tuple(status for status, targets in STATUS_TRANSITIONS.items() if "EXPIRED" in targets)
+
+TRANSACTION_COLUMNS = (
+    "id", "user_id", "username", "fullname", "amount_pence", "final_pence", "amount_toman", "status",
+    "uk_account_text", "receipt_file_id", "created_at", "recipient_name", "recipient_account",
+    "recipient_iban", "rate", "rate_version", "expires_at",
+)
+
+RECEIPT_COLUMNS = ("id", "tx_id", "user_id", "file_id", "file_unique_id", "message_id", "media_group_id", "created_at")
+
+# ستون‌هایی که می‌توانند همراه تغییر وضعیت در همان UPDATE نوشته شوند
+TRANSITION_FIELDS = {
+    "uk_account_text", "receipt_file_id", "recipient_name", "recipient_account", "recipient_iban", "expires_at",
+}
+
+
+def _create_views(conn):
+    # TEMP VIEW مال همان اتصال است؛ چون archive attach شده، view دائمی نمی‌تواند به آن اشاره کند
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    conn.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS all_transactions AS
+        SELECT {columns} FROM main.transactions
+        UNION ALL
+        SELECT {columns} FROM archive.transactions
     """)
 
-    conn.commit()
-    conn.close()
-
-
-def create_transaction(user_id, username, fullname, amount_gbp, final_gbp, amount_irt):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO transactions
-        (user_id, username, fullname, amount_gbp, final_gbp, amount_irt, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        user_id,
-        username,
-        fullname,
-        amount_gbp,
-        final_gbp,
-        amount_irt,
-        "WAITING_FOR_ACCOUNT",
-        datetime.datetime.utcnow().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+
+dbconn.on_connect(_create_views)
+
+
+def init_db():
+    migrate()
+    check_query_plans(HOT_QUERIES)
+
+
+def _enqueue_outbox(conn, messages):
+    # messages: [(idempotency_key, chat_id, steps)]؛ کلید تکراری (مثلاً update دوباره) نادیده گرفته می‌شود
+    now = time.time()
+    created_at = datetime.datetime.utcnow().isoformat()
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, steps, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(key, chat_id, json.dumps(steps, ensure_ascii=False), now, created_at) for key, chat_id, steps in messages],
+    )
+
+
+def create_transaction(user_id, username, fullname, amount_pence, final_pence, amount_toman,
+                       rate=None, rate_version=None, expires_at=None, outbox=None):
+    # outbox(tx_id) پیام‌های اعلان را می‌سازد؛ در همان تراکنش INSERT نوشته می‌شوند
+    with unit_of_work() as conn:
+        cur = conn.execute("""
+            INSERT INTO transactions
+            (user_id, username, fullname, amount_pence, final_pence, amount_toman, status, created_at,
+             rate, rate_version, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            user_id,
+            username,
+            fullname,
+            amount_pence,
+            final_pence,
+            amount_toman,
+            "WAITING_FOR_ACCOUNT",
+            datetime.datetime.utcnow().isoformat(),
+            rate,
+            rate_version,
+            expires_at,
+        ))
+        if outbox:
+            _enqueue_outbox(conn, outbox(cur.lastrowid))
+        return cur.lastrowid
 
 
 def get_pending_transactions():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, username, final_gbp, amount_irt
-        FROM transactions
-        WHERE status = 'WAITING_FOR_ACCOUNT'
-        ORDER BY id DESC
-    """)
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    return get_connection().execute(SQL_PENDING_TRANSACTIONS).fetchall()
+
+
+def get_transactions_page(status="WAITING_FOR_ACCOUNT", before_id=None, after_id=None, limit=10,
+                          min_pence=None, max_pence=None, since=None, with_receipt=False):
+    # keyset روی (status, id): هر صفحه یک کوئری با LIMIT، مستقل از اندازه جدول
+    conditions = ["status = ?"]
+    params = [status]
+    if with_receipt:
+        conditions.append(SQL_HAS_RECEIPT)
+    if before_id is not None:
+        conditions.append("id < ?")
+        params.append(before_id)
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+    if min_pence is not None:
+        conditions.append("final_pence >= ?")
+        params.append(min_pence)
+    if max_pence is not None:
+        conditions.append("final_pence <= ?")
+        params.append(max_pence)
+    if since is not None:
+        conditions.append("created_at >= ?")
+        params.append(since.isoformat())
+
+    # صفحه‌ها همیشه جدیدترین اول‌اند؛ برای صفحه قبلی صعودی می‌خوانیم و برمی‌گردانیم
+    order = "ASC" if after_id is not None else "DESC"
+    sql = SQL_TRANSACTIONS_PAGE.format(where=" AND ".join(conditions), order=order)
+    rows = get_connection().execute(sql, (*params, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+UkAccount = namedtuple("UkAccount", ["id", "bank", "sort_code", "account_number", "name", "enabled"])
+
+# کش درون‌پردازه‌ای حساب‌ها؛ هر تابعی که uk_accounts را تغییر می‌دهد باید _invalidate_uk_accounts را صدا بزند
+_uk_accounts = None
+_uk_accounts_generation = 0
+_uk_accounts_lock = threading.Lock()
+# زمان آخرین انتخاب هر حساب برای یک تراکنش (فقط در حافظه)
+_uk_accounts_last_used = {}
+
+
+def _invalidate_uk_accounts():
+    global _uk_accounts, _uk_accounts_generation
+    with _uk_accounts_lock:
+        _uk_accounts_generation += 1
+        _uk_accounts = None
+
+
+def _load_uk_accounts():
+    global _uk_accounts
+    cached = _uk_accounts
+    if cached is not None:
+        return cached
+
+    generation = _uk_accounts_generation
+    rows = get_connection().execute(
+        "SELECT id, bank, sort_code, account_number, name, enabled FROM uk_accounts ORDER BY id"
+    ).fetchall()
+    cached = {row[0]: UkAccount(*row[:5], bool(row[5])) for row in rows}
+    with _uk_accounts_lock:
+        # اگر وسط خواندن حسابی تغییر کرده باشد نتیجه کهنه را نگه نمی‌داریم
+        if generation == _uk_accounts_generation:
+            _uk_accounts = cached
+    return cached
 
 
 def add_uk_account(bank, sort_code, account_number, name):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO uk_accounts (bank, sort_code, account_number, name)
-        VALUES (?, ?, ?, ?)
-    """, (bank, sort_code, account_number, name))
-    conn.commit()
-    conn.close()
-
-
-def get_uk_accounts():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, bank, sort_code, account_number, name FROM uk_accounts")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with unit_of_work() as conn:
+        cur = conn.execute("""
+            INSERT INTO uk_accounts (bank, sort_code, account_number, name)
+            VALUES (?, ?, ?, ?)
+        """, (bank, sort_code, account_number, name))
+    _invalidate_uk_accounts()
+    return cur.lastrowid
+
+
+def update_uk_account(acc_id, bank, sort_code, account_number, name):
+    with unit_of_work() as conn:
+        cur = conn.execute("""
+            UPDATE uk_accounts SET bank = ?, sort_code = ?, account_number = ?, name = ?
+            WHERE id = ?
+        """, (bank, sort_code, account_number, name, acc_id))
+    _invalidate_uk_accounts()
+    return cur.rowcount > 0
+
+
+def set_uk_account_enabled(acc_id, enabled):
+    with unit_of_work() as conn:
+        cur = conn.execute("UPDATE uk_accounts SET enabled = ? WHERE id = ?", (int(enabled), acc_id))
+    _invalidate_uk_accounts()
+    return cur.rowcount > 0
+
+
+def delete_uk_account(acc_id):
+    with unit_of_work() as conn:
+        cur = conn.execute("DELETE FROM uk_accounts WHERE id = ?", (acc_id,))
+    _invalidate_uk_accounts()
+    return cur.rowcount > 0
+
+
+def get_uk_accounts(enabled_only=False):
+    accounts = _load_uk_accounts().values()
+    if enabled_only:
+        return [acc for acc in accounts if acc.enabled]
+    return list(accounts)
+
+
+def get_uk_account(acc_id):
+    return _load_uk_accounts().get(acc_id)
+
+
+def next_uk_account():
+    # حسابی که از همه دیرتر به تراکنشی داده شده؛ پرداخت‌ها به نوبت بین حساب‌های فعال پخش می‌شوند
+    accounts = get_uk_accounts(enabled_only=True)
+    if not accounts:
+        return None
+    return min(accounts, key=lambda acc: _uk_accounts_last_used.get(acc.id, 0))
+
+
+def mark_uk_account_used(acc_id):
+    _uk_accounts_last_used[acc_id] = time.monotonic()
 
 
 def get_transaction(tx_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, user_id, username, fullname, final_gbp, amount_irt, status
-        FROM transactions
-        WHERE id = ?
-    """, (tx_id,))
-    row = c.fetchone()
-    conn.close()
-    return row
-
-
-def set_transaction_status(tx_id, status):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE transactions SET status = ? WHERE id = ?", (status, tx_id))
-    conn.commit()
-    conn.close()
-
-
-def set_transaction_account_text(tx_id, text):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE transactions SET uk_account_text = ? WHERE id = ?", (text, tx_id))
-    conn.commit()
-    conn.close()
-
-
-def save_receipt_file_id(tx_id, file_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE transactions SET receipt_file_id = ? WHERE id = ?", (file_id, tx_id))
-    conn.commit()
-    conn.close()
+    # تراکنش‌های آرشیوشده هم پیدا می‌شوند؛ هر دو طرف view با کلید اصلی جستجو می‌شوند
+    return get_connection().execute(SQL_GET_TRANSACTION, (tx_id,)).fetchone()
+
+
+def _check_transition(from_status, to_status):
+    from_statuses = (from_status,) if isinstance(from_status, str) else tuple(from_status)
+    for status in from_statuses:
+        if to_status not in STATUS_TRANSITIONS.get(status, ()):
+            raise ValueError(f"transition {status} -> {to_status} is not allowed")
+    return from_statuses
+
+
+def transition_transaction(tx_id, from_status, to_status, outbox=None, **fields):
+    # یک UPDATE شرطی: اگر وضعیت فعلی from_status نباشد (مثلاً ادمین دیگری زودتر زده) None برمی‌گردد
+    from_statuses = _check_transition(from_status, to_status)
+    unknown = set(fields) - TRANSITION_FIELDS
+    if unknown:
+        raise ValueError(f"unknown transaction fields: {', '.join(sorted(unknown))}")
+    # مهلت هر وضعیت مال همان وضعیت است؛ اگر وضعیت جدید مهلت نداشته باشد پاک می‌شود
+    fields.setdefault("expires_at", None)
+
+    columns = sorted(fields)
+    assignments = "".join(f", {column} = ?" for column in columns)
+    placeholders = ", ".join("?" for _ in from_statuses)
+    with unit_of_work() as conn:
+        tx = conn.execute(f"""
+            UPDATE transactions
+            SET status = ?{assignments}
+            WHERE id = ? AND status IN ({placeholders})
+            RETURNING id, user_id, username, fullname, final_pence, amount_toman, status
+        """, (to_status, *(fields[c] for c in columns), tx_id, *from_statuses)).fetchone()
+        # اعلان‌ها فقط وقتی نوشته می‌شوند که تغییر وضعیت واقعاً انجام شده باشد
+        if tx and outbox:
+            _enqueue_outbox(conn, outbox(tx))
+        return tx
+
+
+def transition_transactions(tx_ids, from_status, to_status, outbox=None, with_receipt=False):
+    # نسخه دسته‌ای transition_transaction برای عملیات گروهی ادمین: همه UPDATEها و همه اعلان‌ها در یک
+    # تراکنش؛ فقط ردیف‌هایی که هنوز در from_status هستند (و با with_receipt رسید دارند) عوض می‌شوند
+    # و همان‌ها برگردانده می‌شوند
+    from_statuses = _check_transition(from_status, to_status)
+    if not tx_ids:
+        return []
+    ids = ", ".join("?" for _ in tx_ids)
+    placeholders = ", ".join("?" for _ in from_statuses)
+    receipt = f"AND {SQL_HAS_RECEIPT}" if with_receipt else ""
+    with unit_of_work() as conn:
+        rows = conn.execute(f"""
+            SELECT id, user_id, username, fullname, final_pence, amount_toman, status
+            FROM transactions
+            WHERE id IN ({ids}) AND status IN ({placeholders}) {receipt}
+            ORDER BY id
+        """, (*tx_ids, *from_statuses)).fetchall()
+        if not rows:
+            return []
+        # قفل نوشتن از BEGIN IMMEDIATE گرفته شده، پس وضعیت‌ها بین SELECT و UPDATE عوض نمی‌شوند
+        conn.executemany(
+            "UPDATE transactions SET status = ?, expires_at = NULL WHERE id = ? AND status = ?",
+            [(to_status, row[0], row[6]) for row in rows],
+        )
+        changed = [(*row[:6], to_status) for row in rows]
+        if outbox:
+            _enqueue_outbox(conn, outbox(changed))
+        return changed
+
+
+def add_receipts(tx_id, user_id, photos, outbox=None):
+    # photos: [(file_id, file_unique_id, message_id, media_group_id)]؛ تکراری‌ها با ایندکس یکتا کنار می‌روند.
+    # اگر تراکنش دیگر منتظر رسید نباشد (منقضی، لغو یا بررسی‌شده) چیزی ثبت نمی‌شود و None برمی‌گردد
+    now = datetime.datetime.utcnow().isoformat()
+    added = []
+    with unit_of_work() as conn:
+        # با رسیدن رسید مهلت پرداخت دیگر لازم نیست
+        cur = conn.execute(
+            "UPDATE transactions SET expires_at = NULL WHERE id = ? AND status = 'WAITING_FOR_RECEIPT'", (tx_id,)
+        )
+        if not cur.rowcount:
+            return None
+        for file_id, file_unique_id, message_id, media_group_id in photos:
+            cur = conn.execute(
+                """
+                INSERT OR IGNORE INTO receipts
+                    (tx_id, user_id, file_id, file_unique_id, message_id, media_group_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (tx_id, user_id, file_id, file_unique_id, message_id, media_group_id, now),
+            )
+            if cur.rowcount:
+                added.append((file_id, message_id))
+        if added:
+            # ستون قدیمی همچنان آخرین رسید را نگه می‌دارد
+            conn.execute("UPDATE transactions SET receipt_file_id = ? WHERE id = ?", (added[-1][0], tx_id))
+            if outbox:
+                _enqueue_outbox(conn, outbox(added))
+    return added
 
 
 def get_latest_tx_by_user_and_status(user_id, status):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, user_id, final_gbp, amount_irt
-        FROM transactions
-        WHERE user_id = ? AND status = ?
-        ORDER BY id DESC
-        LIMIT 1
-    """, (user_id, status))
-    row = c.fetchone()
-    conn.close()
+    row = get_connection().execute(SQL_LATEST_TX_BY_USER_AND_STATUS, (user_id, status)).fetchone()
     if not row:
         return None
-    return {"id": row[0], "user_id": row[1], "final_gbp": row[2], "amount_irt": row[3]}
+    return {"id": row[0], "user_id": row[1], "final_pence": row[2], "amount_toman": row[3]}
+
+
+def save_recipient_info(tx_id, name, account, iban, outbox=None):
+    return transition_transaction(
+        tx_id,
+        "WAITING_FOR_IR_INFO",
+        "READY_TO_SEND_IR",
+        outbox=outbox,
+        recipient_name=name,
+        recipient_account=account,
+        recipient_iban=iban,
+    )
+
+
+def expire_transactions(tx_ids, now=None, outbox=None):
+    # فقط ردیف‌هایی که هنوز در وضعیت انتظارند و مهلتشان واقعاً گذشته؛ اگر در این فاصله رسید رسیده
+    # یا ادمین کاری کرده، expires_at عوض شده و ردیف دست نمی‌خورد
+    if not tx_ids:
+        return []
+    now = time.time() if now is None else now
+    ids = ", ".join("?" for _ in tx_ids)
+    statuses = ", ".join("?" for _ in EXPIRABLE_STATUSES)
+    with unit_of_work() as conn:
+        rows = conn.execute(f"""
+            SELECT id, user_id, final_pence, status
+            FROM transactions
+            WHERE id IN ({ids}) AND status IN ({statuses}) AND expires_at <= ?
+        """, (*tx_ids, *EXPIRABLE_STATUSES, now)).fetchall()
+        if not rows:
+            return []
+        conn.execute(
+            f"UPDATE transactions SET status = 'EXPIRED', expires_at = NULL WHERE id IN ({', '.join('?' for _ in rows)})",
+            [row[0] for row in rows],
+        )
+        if outbox:
+            _enqueue_outbox(conn, outbox(rows))
+        return rows
+
+
+def get_transaction_deadlines():
+    # برای ساختن دوباره scheduler بعد از restart
+    return get_connection().execute(
+        "SELECT id, expires_at FROM transactions WHERE expires_at IS NOT NULL"
+    ).fetchall()
+
+
+def get_user_ids_by_status(status):
+    rows = get_connection().execute(
+        "SELECT DISTINCT user_id FROM transactions WHERE status = ?", (status,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def save_conversation_state(chat_id, data, updated_at, deleted_chat_ids=()):
+    with unit_of_work() as conn:
+        if deleted_chat_ids:
+            conn.executemany(
+                "DELETE FROM conversation_state WHERE chat_id = ?",
+                [(c,) for c in deleted_chat_ids],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO conversation_state (chat_id, data, updated_at) VALUES (?, ?, ?)",
+            (chat_id, data, updated_at),
+        )
+
+
+def delete_conversation_states(chat_ids):
+    with unit_of_work() as conn:
+        conn.executemany("DELETE FROM conversation_state WHERE chat_id = ?", [(c,) for c in chat_ids])
+
+
+def purge_conversation_states(before):
+    with unit_of_work() as conn:
+        conn.execute("DELETE FROM conversation_state WHERE updated_at < ?", (before,))
+
+
+def load_conversation_states(since, limit):
+    rows = get_connection().execute("""
+        SELECT chat_id, data, updated_at
+        FROM conversation_state
+        WHERE updated_at >= ?
+        ORDER BY updated_at DESC
+        LIMIT ?
+    """, (since, limit)).fetchall()
+    rows.reverse()
+    return rows
+
+
+def enqueue_outbox(messages):
+    with unit_of_work() as conn:
+        _enqueue_outbox(conn, messages)
+
+
+def claim_outbox(limit, now=None):
+    # فقط خواندن؛ sender ردیف‌های در حال ارسال را در حافظه نگه می‌دارد و تا نتیجه ثبت نشده دوباره نمی‌فرستد
+    now = time.time() if now is None else now
+    rows = get_connection().execute(SQL_OUTBOX_DUE, (now, limit)).fetchall()
+    return [(row_id, chat_id, json.loads(steps), position, attempts)
+            for row_id, chat_id, steps, position, attempts in rows]
+
+
+def finish_outbox(sent=(), retries=(), dead=()):
+    # نتیجه یک دسته در یک تراکنش
+    # sent: [id]، retries: [(id, position, attempts, next_attempt_at, error)]، dead: [(id, position, attempts, error)]
+    now = datetime.datetime.utcnow().isoformat()
+    with unit_of_work() as conn:
+        conn.executemany(
+            "UPDATE outbox SET status = 'SENT', sent_at = ? WHERE id = ?",
+            [(now, row_id) for row_id in sent],
+        )
+        conn.executemany(
+            "UPDATE outbox SET position = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            [(position, attempts, next_at, error, row_id) for row_id, position, attempts, next_at, error in retries],
+        )
+        conn.executemany(
+            "UPDATE outbox SET status = 'DEAD', position = ?, attempts = ?, last_error = ? WHERE id = ?",
+            [(position, attempts, error, row_id) for row_id, position, attempts, error in dead],
+        )
+
+
+def outbox_counts():
+    rows = get_connection().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+    return dict(rows)
+
+
+def count_dead_outbox():
+    # فقط بازه DEAD در idx_outbox_status_id شمرده می‌شود
+    return get_connection().execute("SELECT COUNT(*) FROM outbox WHERE status = 'DEAD'").fetchone()[0]
+
+
+def requeue_dead_outbox():
+    # ارسال دوباره از همان stepی که خطا داده بود
+    with unit_of_work() as conn:
+        return conn.execute(
+            "UPDATE outbox SET status = 'PENDING', attempts = 0, next_attempt_at = ? WHERE status = 'DEAD'",
+            (time.time(),),
+        ).rowcount
+
+
+def purge_outbox(before):
+    # پیام‌های ارسال‌شده فقط برای یکتا بودن کلید نگه داشته می‌شوند
+    with unit_of_work() as conn:
+        return conn.execute("DELETE FROM outbox WHERE status = 'SENT' AND sent_at < ?", (before,)).rowcount
+
+
+def _transaction_batches(table, where, params, batch_size):
+    cursor = get_connection().execute(
+        f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM {table} {where} ORDER BY id", params
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def iter_transactions(status=None, since=None, until=None, batch_size=500):
+    # generator: ردیف‌ها با fetchmany دسته‌دسته خوانده می‌شوند، پس حافظه به اندازه جدول بستگی ندارد
+    conditions = []
+    params = []
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(status)
+    if since is not None:
+        conditions.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < ?")
+        params.append(until)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    # جدول زنده و آرشیو هر کدام مرتب بر اساس id خوانده و با merge یکی می‌شوند؛ بدون مرتب‌سازی در حافظه
+    yield from heapq.merge(
+        _transaction_batches("main.transactions", where, params, batch_size),
+        _transaction_batches("archive.transactions", where, params, batch_size),
+        key=lambda row: row[0],
+    )
+
+
+def search_transactions(terms, limit=20):
+    # همه کلمه‌ها باید باشند و هر کدام پیشوند است ("ali"* "6037"*)؛ کوتیشن داخل کلمه دوتایی می‌شود
+    match = " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+    conn = get_connection()
+    results = [
+        conn.execute(SQL_SEARCH_TRANSACTIONS.format(schema=schema), (match, limit)).fetchall()
+        for schema in ("main", "archive")
+    ]
+    # هر دو لیست بر اساس id نزولی‌اند
+    return list(heapq.merge(*results, key=lambda row: row[0], reverse=True))[:limit]
+
+
+def get_report(start_day, end_day):
+    # فقط جدول‌های rollup خوانده می‌شوند (چند ردیف برای هر روز)، نه کل transactions
+    conn = get_connection()
+    volume = conn.execute("""
+        SELECT
+            COALESCE(SUM(created_count), 0), COALESCE(SUM(created_pence), 0), COALESCE(SUM(created_toman), 0),
+            COALESCE(SUM(done_count), 0), COALESCE(SUM(done_pence), 0), COALESCE(SUM(done_toman), 0),
+            COALESCE(SUM(done_seconds), 0)
+        FROM daily_volume
+        WHERE day BETWEEN ? AND ?
+    """, (start_day, end_day)).fetchone()
+    entered = conn.execute("""
+        SELECT status, SUM(entered)
+        FROM daily_status
+        WHERE day BETWEEN ? AND ?
+        GROUP BY status
+    """, (start_day, end_day)).fetchall()
+    # status_counts عمداً تراکنش‌های آرشیوشده را هم می‌شمارد (archive_transactions آن را کم نمی‌کند)؛
+    # پس «وضعیت فعلی» یعنی main + archive، و برچسب report_current در catalog همین را می‌گوید
+    current = conn.execute("SELECT status, count FROM status_counts WHERE count > 0").fetchall()
+
+    created_count, created_pence, created_toman, done_count, done_pence, done_toman, done_seconds = volume
+    return {
+        "start": start_day,
+        "end": end_day,
+        "created_count": created_count,
+        "created_pence": created_pence,
+        "created_toman": created_toman,
+        "done_count": done_count,
+        "done_pence": done_pence,
+        "done_toman": done_toman,
+        "avg_done_seconds": done_seconds / done_count if done_count else None,
+        "entered": dict(entered),
+        "current": dict(current),
+    }
+
+
+def archive_transactions(before, limit=500):
+    # یک دسته در یک تراکنش: کپی به archive و حذف از جدول زنده؛ تعداد منتقل‌شده را برمی‌گرداند.
+    # rollupها (daily_volume، daily_status، status_counts) عمداً دست نمی‌خورند: آرشیو فقط جای ردیف را
+    # عوض می‌کند و گزارش‌ها همچنان همه تراکنش‌ها را، چه زنده و چه آرشیوشده، می‌شمارند
+    placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+    tx_columns = ", ".join(TRANSACTION_COLUMNS)
+    receipt_columns = ", ".join(RECEIPT_COLUMNS)
+    with unit_of_work() as conn:
+        ids = [row[0] for row in conn.execute(f"""
+            SELECT id FROM main.transactions
+            WHERE status IN ({placeholders}) AND created_at < ?
+            ORDER BY id
+            LIMIT ?
+        """, (*TERMINAL_STATUSES, before, limit))]
+        if not ids:
+            return 0
+
+        id_list = ", ".join("?" for _ in ids)
+        now = datetime.datetime.utcnow().isoformat()
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.transactions ({tx_columns}, archived_at)
+            SELECT {tx_columns}, ? FROM main.transactions WHERE id IN ({id_list})
+        """, (now, *ids))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO archive.receipts ({receipt_columns})
+            SELECT {receipt_columns} FROM main.receipts WHERE tx_id IN ({id_list})
+        """, ids)
+        conn.execute(f"DELETE FROM main.receipts WHERE tx_id IN ({id_list})", ids)
+        conn.execute(f"DELETE FROM main.transactions WHERE id IN ({id_list})", ids)
+        return len(ids)
+
+
+def incremental_vacuum(pages=None):
+    # صفحه‌های آزادشده را به سیستم‌عامل برمی‌گرداند؛ کوتاه است و می‌تواند کنار ربات اجرا شود
+    conn = get_connection()
+    free_before = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    # هر step فقط یک صفحه آزاد می‌کند و execute فقط یک step می‌رود؛ executescript تا آخر اجرا می‌کند
+    limit = "" if pages is None else f"({int(pages)})"
+    conn.executescript(f"PRAGMA main.incremental_vacuum{limit};")
+    conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchall()
+    return free_before - conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
 
+def vacuum():
+    # VACUUM کامل؛ فایل‌های قدیمی فقط از این راه به auto_vacuum=INCREMENTAL می‌رسند
+    conn = get_connection()
+    conn.execute("PRAGMA main.auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM main")
+    conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchall()
+    return conn.execute("PRAGMA main.auto_vacuum").fetchone()[0]
 
-def save_recipient_info(tx_id, name, account, iban):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("""
-        UPDATE transactions
-        SET recipient_name = ?, recipient_account = ?, recipient_iban = ?, status = 'READY_TO_SEND_IR'
-        WHERE id = ?
-    """, (name, account, iban, tx_id))
-    conn.commit()
-    conn.close()
 
+if metrics.METRICS_ENABLED:
+    metrics.instrument_functions(globals(), "db", __name__)
+    dbconn.set_observer(metrics.observe_sql)
@@ -0,0 +1,166 @@
+# dbconn.py
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_NAME = os.getenv("DB_NAME", "database.db")
+# OFF / NORMAL / FULL / EXTRA — NORMAL is durable enough under WAL and skips the fsync per commit
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _archive_name(db_name):
+    return os.path.splitext(db_name)[0] + "_archive.db"
+
+
+# تراکنش‌های قدیمی تمام‌شده در یک فایل جدا نگه داشته می‌شوند و با نام archive به هر اتصال attach می‌شوند
+ARCHIVE_DB_NAME = os.getenv("ARCHIVE_DB_NAME") or _archive_name(DB_NAME)
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+_trace = None
+_observer = None
+_connect_hooks = []
+# یک نویسنده در هر لحظه: threadهای همین پروسه پشت این قفل صف می‌کشند به جای busy-wait روی فایل
+_write_lock = threading.Lock()
+
+
+def configure(db_name=None, synchronous=None, archive_db_name=None):
+    global DB_NAME, DB_SYNCHRONOUS, ARCHIVE_DB_NAME
+    if db_name is not None:
+        DB_NAME = db_name
+        ARCHIVE_DB_NAME = archive_db_name or _archive_name(db_name)
+    elif archive_db_name is not None:
+        ARCHIVE_DB_NAME = archive_db_name
+    if synchronous is not None:
+        DB_SYNCHRONOUS = synchronous.upper()
+    close_all()
+
+
+def set_trace(callback):
+    # callback(sql) برای هر statement روی اتصال‌های بعدی؛ None یعنی خاموش (برای bench و metrics)
+    global _trace
+    _trace = callback
+    close_all()
+
+
+def on_connect(hook):
+    # hook(conn) روی هر اتصال تازه اجرا می‌شود؛ مثلاً ساخت TEMP VIEWها
+    _connect_hooks.append(hook)
+
+
+def set_observer(callback):
+    # callback(sql, seconds, error) بعد از هر execute؛ برای metrics
+    global _observer
+    _observer = callback
+    close_all()
+
+
+class _ObservedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        error = True
+        try:
+            cursor = super().execute(sql, parameters)
+            error = False
+            return cursor
+        finally:
+            _observer(sql, time.perf_counter() - started, error)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        error = True
+        try:
+            cursor = super().executemany(sql, parameters)
+            error = False
+            return cursor
+        finally:
+            _observer(sql, time.perf_counter() - started, error)
+
+
+def _open():
+    conn = sqlite3.connect(
+        DB_NAME,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE,
+        factory=_ObservedConnection if _observer is not None else sqlite3.Connection,
+    )
+    # روی فایل تازه فوراً اعمال می‌شود؛ روی فایل قدیمی فقط بعد از یک VACUUM کامل
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_NAME,))
+    conn.execute("PRAGMA archive.journal_mode=WAL")
+    conn.execute(f"PRAGMA archive.synchronous={DB_SYNCHRONOUS}")
+    for hook in _connect_hooks:
+        hook(conn)
+    if _trace is not None:
+        conn.set_trace_callback(_trace)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def get_connection():
+    # هر thread یک اتصال ماندگار دارد؛ statement cache روی همین اتصال نگه داشته می‌شود
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _open()
+        _local.conn = conn
+        _local.generation = _generation
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def unit_of_work():
+    conn = get_connection()
+    if _local.depth:
+        # داخل یک unit of work دیگر: به همان تراکنش بیرونی می‌پیوندد
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    # busy_timeout فقط برای پروسه‌های دیگر (مثل archive.py) لازم می‌شود
+    _write_lock.acquire()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    except BaseException:
+        _write_lock.release()
+        raise
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+    finally:
+        _local.depth = 0
+        _write_lock.release()
+
+
+def close_all():
+    global _generation
+    with _connections_lock:
+        conns = list(_connections)
+        _connections.clear()
+        # threadهای دیگر با دیدن generation جدید در فراخوانی بعدی اتصال تازه می‌گیرند
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
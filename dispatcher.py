@@ -0,0 +1,139 @@
+# dispatcher.py
+# updateها بر اساس chat_id بین K صف پخش می‌شوند؛ هر صف یک worker دارد، پس updateهای یک کاربر
+# (مبلغ، تأیید، رسید، اطلاعات گیرنده) به ترتیب اجرا می‌شوند و کاربرهای مختلف موازی
+import asyncio
+import queue
+import threading
+
+
+def update_chat_id(update):
+    # دکمه‌ها بر اساس کسی که زده مرتب می‌شوند (ادمین یا مشتری)، پیام‌ها بر اساس چت
+    if update.callback_query is not None:
+        return update.callback_query.from_user.id
+    for message in (update.message, update.edited_message):
+        if message is not None:
+            return message.chat.id
+    return update.update_id
+
+
+def partition_of(update, partitions):
+    return update_chat_id(update) % partitions
+
+
+class PartitionedDispatcher:
+    def __init__(self, handle, partitions=4, queue_size=100, admit=None):
+        # handle([update]) همان bot.process_new_updates است؛ هر بار فقط یک update چون telebot
+        # داخل یک batch پیام‌ها را قبل از callbackها پردازش می‌کند
+        self.handle = handle
+        # admit(update, depth) قبل از صف؛ False یعنی update دور ریخته می‌شود
+        self.admit = admit
+        self.partitions = partitions
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(partitions)]
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), name=f"partition-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        # submit و stop با هم مسابقه ندهند: کاری که بعد از sentinel در صف بماند اجرا نمی‌شود
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=5):
+        with self._lock:
+            self._running = False
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.join(timeout)
+
+    def pending(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def dispatch(self, updates):
+        # صف پر یعنی put منتظر می‌ماند؛ همین backpressure به polling یا صف وب‌هوک برمی‌گردد
+        for update in updates:
+            q = self._queues[partition_of(update, self.partitions)]
+            if self.admit is None or self.admit(update, q.qsize()):
+                q.put(update)
+
+    def submit(self, key, task):
+        # task() روی partition همان chat_id و به ترتیب با updateهای آن اجرا می‌شود (مثلاً flush آلبوم رسید)؛
+        # قبل از start یا بعد از stop همین‌جا اجرا می‌شود
+        with self._lock:
+            if self._running:
+                self._queues[key % self.partitions].put(task)
+                return
+        task()
+
+    def _work(self, q):
+        while True:
+            update = q.get()
+            if update is None:
+                return
+            try:
+                if callable(update):
+                    update()
+                else:
+                    self.handle([update])
+            except Exception as e:
+                print(f"partition worker failed: {e!r}")
+
+
+class AsyncPartitionedDispatcher:
+    def __init__(self, handle, partitions=4, queue_size=100, admit=None):
+        self.handle = handle
+        self.admit = admit
+        self.partitions = partitions
+        self.queue_size = queue_size
+        self._queues = []
+        self._tasks = []
+        self._order = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.partitions)]
+        self._tasks = [asyncio.get_running_loop().create_task(self._work(q)) for q in self._queues]
+        # polling برای هر batch یک task می‌سازد؛ Lock به ترتیب FIFO batchها را پشت سر هم در صف‌ها می‌گذارد
+        self._order = asyncio.Lock()
+
+    async def stop(self):
+        self._running = False
+        for q in self._queues:
+            await q.put(None)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def pending(self):
+        return sum(q.qsize() for q in self._queues)
+
+    async def dispatch(self, updates):
+        async with self._order:
+            for update in updates:
+                q = self._queues[partition_of(update, self.partitions)]
+                if self.admit is None or self.admit(update, q.qsize()):
+                    await q.put(update)
+
+    async def submit(self, key, task):
+        # مثل PartitionedDispatcher.submit؛ task() یک coroutine برمی‌گرداند
+        if self._running:
+            await self._queues[key % self.partitions].put(task)
+        else:
+            await task()
+
+    async def _work(self, q):
+        while True:
+            update = await q.get()
+            if update is None:
+                return
+            try:
+                if callable(update):
+                    await update()
+                else:
+                    await self.handle([update])
+            except Exception as e:
+                print(f"partition worker failed: {e!r}")
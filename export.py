@@ -0,0 +1,76 @@
+# export.py
+# خروجی کامل تراکنش‌ها برای حسابداری: CSV یا JSONL فشرده با gzip، بدون بار کردن کل جدول در حافظه
+#
+#   python export.py --format csv --status DONE --since 2026-01-01 --until 2026-01-31 -o done.csv.gz
+import argparse
+import csv
+import datetime
+import gzip
+import json
+from db import TRANSACTION_COLUMNS, TX_STATUSES, iter_transactions
+
+FORMATS = ("csv", "jsonl")
+
+
+def date_bounds(since=None, until=None):
+    # تاریخ‌ها شامل هر دو سر هستند؛ created_at به صورت ISO و UTC ذخیره شده است
+    start = since.isoformat() if since else None
+    end = (until + datetime.timedelta(days=1)).isoformat() if until else None
+    return start, end
+
+
+def write_csv(rows, f):
+    writer = csv.writer(f)
+    writer.writerow(TRANSACTION_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(rows, f):
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(TRANSACTION_COLUMNS, row)), ensure_ascii=False))
+        f.write("\n")
+        count += 1
+    return count
+
+
+def export_transactions(path, fmt="csv", status=None, since=None, until=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    start, end = date_bounds(since, until)
+    rows = iter_transactions(status=status, since=start, until=end)
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            return write_csv(rows, f)
+        return write_jsonl(rows, f)
+
+
+def export_filename(fmt, status=None, since=None, until=None):
+    parts = ["transactions"]
+    if status:
+        parts.append(status.lower())
+    if since or until:
+        parts.append(f"{since or ''}_{until or ''}")
+    return "-".join(parts) + f".{fmt}.gz"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export transactions as gzip-compressed CSV or JSONL")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--status", choices=TX_STATUSES, default=None)
+    parser.add_argument("--since", type=datetime.date.fromisoformat, default=None, help="YYYY-MM-DD (UTC)")
+    parser.add_argument("--until", type=datetime.date.fromisoformat, default=None, help="YYYY-MM-DD (UTC)، شامل همین روز")
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args()
+
+    output = args.output or export_filename(args.format, args.status, args.since, args.until)
+    count = export_transactions(output, args.format, args.status, args.since, args.until)
+    print(f"exported {count:,} transactions to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# flood.py
+# قبل از صف dispatcher و قبل از هر کار دیتابیسی: هر چت یک token bucket دارد و updateهای بیش از حد
+# همان‌جا دور ریخته می‌شوند. وقتی صف یک partition از shed_depth پر شود updateهای مشتری‌ها کنار
+# گذاشته می‌شوند تا بقیه صف برای دکمه‌ها و پیام‌های ادمین بماند؛ ادمین‌ها هیچ‌وقت محدود نمی‌شوند
+import threading
+from collections import OrderedDict
+from broadcaster import TokenBucket
+from dispatcher import update_chat_id
+
+# یک آلبوم رسید تا ۱۰ عکس است که با هم می‌رسند
+FLOOD_RATE = 1
+FLOOD_BURST = 12
+
+
+class FloodControl:
+    def __init__(self, admin_ids, rate=FLOOD_RATE, burst=FLOOD_BURST, max_chats=10000, shed_depth=None):
+        self.admin_ids = frozenset(admin_ids)
+        self.rate = rate
+        self.burst = burst
+        self.max_chats = max_chats
+        # None یعنی بدون load shedding
+        self.shed_depth = shed_depth
+        self.stats = {"throttled": 0, "shed": 0}
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._chats)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def admit(self, update, depth):
+        # depth: تعداد updateهای منتظر در صف partitionی که این update به آن می‌رود
+        chat_id = update_chat_id(update)
+        if chat_id in self.admin_ids:
+            return True
+        with self._lock:
+            if self.shed_depth is not None and depth >= self.shed_depth:
+                self.stats["shed"] += 1
+                return False
+            if self._chat_bucket(chat_id).reserve():
+                self.stats["throttled"] += 1
+                return False
+            return True
@@ -0,0 +1,1026 @@
+# handlers.py
+# منطق همه handlerها یک بار برای هر دو runtime. هر handler یک generator است که کارهای I/O را yield
+# می‌کند و نتیجه‌شان را پس می‌گیرد: db_call(...) برای db.py و StateStore، bot_call(...) برای Bot API.
+# bot.py (TeleBot روی thread) و bot_async.py (AsyncTeleBot، DB روی db_executor) فقط این effectها را
+# اجرا و handlerها را ثبت می‌کنند؛ رفتار ربات فقط همین‌جا عوض می‌شود
+import html
+import os
+import tempfile
+import time
+from collections import namedtuple
+from telebot import types
+from config import (
+    ADMIN_IDS,
+    QUOTE_TTL_SECONDS,
+    RATES_FILE,
+    RATES_URL,
+    RATES_REFRESH_SECONDS,
+    STATE_MAX_ENTRIES,
+    STATE_TTL_SECONDS,
+    STATE_PERSIST,
+    PENDING_PAGE_SIZE,
+    BULK_PAGE_SIZE,
+    FIND_RESULTS,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_INTERVAL_SECONDS,
+    BOT_LOCALE,
+    OUTBOX_RETENTION_DAYS,
+    ACCOUNT_WAIT_TTL_SECONDS,
+    ACCOUNT_OFFER_TTL_SECONDS,
+)
+import archive
+from catalog import Catalog
+from money import parse_gbp, transfer_fee, format_gbp, format_toman
+import metrics
+from export import export_transactions, export_filename
+import outbox
+import rates
+from helpers import (
+    format_user,
+    is_admin,
+    parse_pending_filter,
+    describe_pending_filter,
+    parse_find_args,
+    pending_query,
+    report_range,
+    format_report,
+    parse_export_args,
+    DEFAULT_PENDING_FILTER,
+    BULK_ACTIONS,
+)
+from receipts import receipt_photos
+from router import Router
+from state_store import StateStore, ConversationState, WAITING_UK_AMOUNT, CONFIRM
+from db import (
+    init_db,
+    create_transaction,
+    get_transactions_page,
+    search_transactions,
+    add_uk_account,
+    get_uk_accounts,
+    get_uk_account,
+    next_uk_account,
+    mark_uk_account_used,
+    update_uk_account,
+    set_uk_account_enabled,
+    delete_uk_account,
+    get_transaction,
+    transition_transaction,
+    transition_transactions,
+    add_receipts,
+    get_latest_tx_by_user_and_status,
+    save_recipient_info,
+    get_user_ids_by_status,
+    get_report,
+    outbox_counts,
+    requeue_dead_outbox,
+    expire_transactions,
+    get_transaction_deadlines,
+    enqueue_outbox,
+)
+
+DbCall = namedtuple("DbCall", ["fn", "args", "kwargs"])
+BotCall = namedtuple("BotCall", ["method", "args", "kwargs"])
+
+
+def db_call(fn, *args, **kwargs):
+    # کار blocking روی SQLite؛ در async روی db_executor اجرا می‌شود
+    return DbCall(fn, args, kwargs)
+
+
+def bot_call(method, *args, **kwargs):
+    # متد TeleBot/AsyncTeleBot با همان آرگومان‌ها
+    return BotCall(method, args, kwargs)
+
+
+def send(chat_id, text, **kwargs):
+    return bot_call("send_message", chat_id, text, **kwargs)
+
+
+def edit(call, text, **kwargs):
+    return bot_call("edit_message_text", text, call.message.chat.id, call.message.message_id, **kwargs)
+
+
+def answer(call, *args, **kwargs):
+    return bot_call("answer_callback_query", call.id, *args, **kwargs)
+
+
+def run_sync(handler, bot):
+    # خطای هر effect داخل handler پرتاب می‌شود، مثل فراخوانی مستقیم
+    resume, value = handler.send, None
+    while True:
+        try:
+            effect = resume(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            if isinstance(effect, BotCall):
+                value = getattr(bot, effect.method)(*effect.args, **effect.kwargs)
+            else:
+                value = effect.fn(*effect.args, **effect.kwargs)
+            resume = handler.send
+        except Exception as e:
+            resume, value = handler.throw, e
+
+
+async def run_async(handler, bot, run_db):
+    resume, value = handler.send, None
+    while True:
+        try:
+            effect = resume(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            if isinstance(effect, BotCall):
+                value = await getattr(bot, effect.method)(*effect.args, **effect.kwargs)
+            else:
+                value = await run_db(effect.fn, *effect.args, **effect.kwargs)
+            resume = handler.send
+        except Exception as e:
+            resume, value = handler.throw, e
+
+
+class Handlers:
+    def __init__(self, scheduler, outbox_sender):
+        # scheduler و outbox_sender مال runtime هستند؛ schedule، cancel و wake در هر دو همگام‌اند
+        self.scheduler = scheduler
+        self.outbox_sender = outbox_sender
+        self.user_state = StateStore(max_entries=STATE_MAX_ENTRIES, ttl=STATE_TTL_SECONDS, persist=STATE_PERSIST)
+        # متن پیام‌ها و کیبوردهای آماده برای زبان BOT_LOCALE
+        self.catalog = Catalog(BOT_LOCALE)
+        # chat_idهایی که ممکن است تراکنش WAITING_FOR_IR_INFO داشته باشند؛ در شروع از DB پر می‌شود
+        self.awaiting_ir_info = set()
+        # فیلتر صف درخواست‌ها برای هر ادمین؛ با /pending تنظیم می‌شود و دکمه‌های صفحه از آن استفاده می‌کنند
+        self.pending_filters = {}
+        # انتخاب‌های /bulk برای هر ادمین: action، idهای صفحه فعلی و idهای انتخاب‌شده
+        self.bulk_selections = {}
+
+        text = self.catalog.text
+        router = self.router = Router()
+        router.text(text("btn_rates"))(self.show_rates)
+        router.text(text("btn_ir_to_uk"))(self.ir_to_uk_demo)
+        router.text(text("btn_help"))(self.help_menu)
+        router.text(text("btn_uk_to_ir"))(self.uk_to_ir_start)
+        router.callback("rate_", str)(self.process_rate_callback)
+        router.callback("confirm_uk")(self.confirm_or_cancel)
+        router.callback("cancel_uk")(self.confirm_or_cancel)
+        router.callback("admin_list_uk_accounts")(self.admin_list_uk_accounts)
+        router.callback("admin_add_uk_account")(self.admin_add_uk_account_help)
+        router.callback("admin_pending")(self.admin_show_pending)
+        router.callback("admin_pg_", str, int)(self.admin_pending_page)
+        router.callback("admin_tx_", int)(self.admin_tx_detail)
+        router.callback("admin_cancel_", int)(self.admin_cancel_tx)
+        router.callback("admin_sendacc_", int)(self.admin_send_account)
+        router.callback("admin_chooseacc_", int, int)(self.admin_choose_account)
+        router.callback("confirm_tx_", int)(self.admin_handle_receipt_decision)
+        router.callback("reject_tx_", int)(self.admin_handle_receipt_decision)
+        router.callback("done_tx_", int)(self.admin_mark_done)
+        router.callback("admin_bulk")(self.admin_bulk_menu)
+        router.callback("bulk_a_", str)(self.admin_bulk_open)
+        router.callback("bulk_t_", int)(self.admin_bulk_toggle)
+        router.callback("bulk_all")(self.admin_bulk_select_all)
+        router.callback("bulk_none")(self.admin_bulk_select_all)
+        router.callback("bulk_go")(self.admin_bulk_apply)
+
+        # (commands، handler) به ترتیب ثبت در telebot؛ route_text بعد از همه ثبت می‌شود
+        self.commands = [
+            (["start"], self.cmd_start),
+            (["admin"], self.admin_menu),
+            (["add_uk_account"], self.admin_add_uk_account_cmd),
+            (["edit_uk_account"], self.admin_edit_uk_account_cmd),
+            (["disable_uk_account", "enable_uk_account", "del_uk_account"], self.admin_uk_account_state_cmd),
+            (["set_rate"], self.admin_set_rate_cmd),
+            (["state_stats"], self.admin_state_stats_cmd),
+            (["stats"], self.admin_stats_cmd),
+            (["outbox"], self.admin_outbox_cmd),
+            (["report"], self.admin_report_cmd),
+            (["export"], self.admin_export_cmd),
+            (["pending"], self.admin_pending_cmd),
+            (["find"], self.admin_find_cmd),
+            (["bulk"], self.admin_bulk_cmd),
+        ]
+
+    def instrument(self):
+        # handlerهای router و مرحله‌هایی که مستقیم از route_text و receipt_collector صدا زده می‌شوند
+        metrics.instrument_router(self.router)
+        for name in ("uk_to_ir_amount", "handle_iran_account", "process_receipts"):
+            setattr(self, name, metrics.timed("handler", name, getattr(self, name)))
+
+    # --------- /start ---------
+    def cmd_start(self, message):
+        yield send(message.chat.id, self.catalog.text("welcome"), reply_markup=self.catalog.keyboard("main_menu"))
+
+    # --------- نرخ روز ---------
+    def show_rates(self, message):
+        yield send(message.chat.id, self.catalog.text("choose_rate_kind"), reply_markup=self.catalog.keyboard("rate_kinds"))
+
+    def process_rate_callback(self, call, kind):
+        snapshot = rates.engine.current()
+        if kind == "cash":
+            buy, sell = snapshot.cash_buy, snapshot.cash_sell
+        else:
+            buy, sell = snapshot.transfer_buy, snapshot.transfer_sell
+
+        yield edit(call, self.catalog.text("rate", kind=kind.upper(), buy=buy, sell=sell))
+        yield answer(call)
+
+    # --------- راهنما / ایران->انگلیس (دمو) ---------
+    def ir_to_uk_demo(self, message):
+        yield send(message.chat.id, self.catalog.text("ir_to_uk_demo"))
+
+    def help_menu(self, message):
+        yield send(message.chat.id, self.catalog.text("help"))
+
+    # ================= UK -> IR =================
+    def uk_to_ir_start(self, message):
+        yield send(message.chat.id, self.catalog.text("ask_amount"))
+        yield db_call(self.user_state.set, message.chat.id, ConversationState(WAITING_UK_AMOUNT))
+
+    def uk_to_ir_amount(self, message):
+        # همه مبلغ‌ها به پنی و تومان (عدد صحیح)
+        try:
+            amount = parse_gbp(message.text)
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("amount_not_number"))
+            return
+
+        fee = transfer_fee(amount)
+        final_amount = amount + fee
+
+        quote = rates.engine.quote(final_amount, QUOTE_TTL_SECONDS)
+        amount_toman = quote.amount_toman
+
+        state = ConversationState(CONFIRM, amount=amount, fee=fee, final=final_amount, irt=amount_toman, quote=quote)
+        yield db_call(self.user_state.set, message.chat.id, state)
+        self.scheduler.schedule(("quote", message.chat.id), quote.expires_at)
+
+        text = self.catalog.text(
+            "quote",
+            amount=format_gbp(amount),
+            fee=format_gbp(fee),
+            final=format_gbp(final_amount),
+            irt=format_toman(amount_toman),
+            minutes=QUOTE_TTL_SECONDS // 60,
+        )
+        yield send(message.chat.id, text, reply_markup=self.catalog.keyboard("confirm_quote"))
+
+    def confirm_or_cancel(self, call):
+        chat_id = call.message.chat.id
+        state = self.user_state.get(chat_id)
+
+        if call.data == "cancel_uk":
+            yield edit(call, self.catalog.text("cancelled"))
+            yield db_call(self.user_state.pop, chat_id)
+            return
+
+        if state is None or state.step != CONFIRM:
+            yield answer(call, self.catalog.text("request_state_missing"), show_alert=True)
+            return
+
+        # نرخ همان است که به مشتری اعلام شد؛ در این مرحله نه DB و نه منبع نرخ خوانده نمی‌شود
+        quote = state.quote
+        if rates.quote_expired(quote):
+            yield db_call(self.user_state.pop, chat_id)
+            yield edit(call, self.catalog.text("quote_expired"))
+            return
+
+        # از دو «تأیید» هم‌زمان فقط یکی وضعیت را برمی‌دارد؛ دیگری None می‌گیرد و تراکنش دوم ساخته نمی‌شود
+        if (yield db_call(self.user_state.pop, chat_id)) is None:
+            return
+        self.scheduler.cancel(("quote", chat_id))
+
+        final, irt = format_gbp(state.final), format_toman(state.irt)
+        customer_text = self.catalog.text("request_registered", final=final, irt=irt)
+        display = format_user(call.from_user.username, call.from_user.full_name, chat_id)
+        admin_text = self.catalog.text("admin_new_request", customer=display, final=final, irt=irt)
+        expires_at = time.time() + ACCOUNT_WAIT_TTL_SECONDS if ACCOUNT_WAIT_TTL_SECONDS else None
+
+        tx_id = yield db_call(
+            create_transaction,
+            user_id=chat_id,
+            username=call.from_user.username,
+            fullname=call.from_user.full_name,
+            amount_pence=state.amount,
+            final_pence=state.final,
+            amount_toman=state.irt,
+            rate=quote.rate,
+            rate_version=quote.rate_version,
+            expires_at=expires_at,
+            outbox=lambda tx_id: [
+                outbox.message(
+                    f"tx{tx_id}:created:customer",
+                    chat_id,
+                    outbox.step("edit_message_text", customer_text, chat_id, call.message.message_id),
+                ),
+                *outbox.broadcast(f"tx{tx_id}:created:admin", ADMIN_IDS, admin_text),
+            ],
+        )
+        self.outbox_sender.wake()
+        if expires_at:
+            self.scheduler.schedule(("tx", tx_id), expires_at)
+
+    # ================= Admin Panel =================
+    def admin_menu(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        yield send(message.chat.id, self.catalog.text("admin_panel"), reply_markup=self.catalog.keyboard("admin_menu"))
+
+    def admin_list_uk_accounts(self, call):
+        if not is_admin(call.from_user.id):
+            return
+
+        accounts = yield db_call(get_uk_accounts)
+        text = self.catalog.text
+        if not accounts:
+            yield answer(call, text("uk_accounts_empty"), show_alert=True)
+            return
+
+        lines = [
+            text(
+                "uk_account",
+                id=acc.id,
+                bank=acc.bank,
+                state="" if acc.enabled else text("uk_account_disabled_mark"),
+                name=acc.name,
+                sort_code=acc.sort_code,
+                account_number=acc.account_number,
+            )
+            for acc in accounts
+        ]
+        yield send(call.message.chat.id, text("uk_accounts", accounts="\n\n".join(lines)))
+        yield answer(call)
+
+    def admin_add_uk_account_help(self, call):
+        if not is_admin(call.from_user.id):
+            return
+        yield send(call.message.chat.id, self.catalog.text("uk_account_help"))
+        yield answer(call)
+
+    def admin_add_uk_account_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            _, bank, sort_code, account_number, name = message.text.split(maxsplit=4)
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("uk_account_add_usage"))
+            return
+
+        yield db_call(add_uk_account, bank, sort_code, account_number, name)
+        yield send(message.chat.id, self.catalog.text("uk_account_saved"))
+
+    def admin_edit_uk_account_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            _, acc_id, bank, sort_code, account_number, name = message.text.split(maxsplit=5)
+            acc_id = int(acc_id)
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("uk_account_edit_usage"))
+            return
+
+        if (yield db_call(update_uk_account, acc_id, bank, sort_code, account_number, name)):
+            yield send(message.chat.id, self.catalog.text("uk_account_edited", acc_id=acc_id))
+        else:
+            yield send(message.chat.id, self.catalog.text("uk_account_not_found"))
+
+    def admin_uk_account_state_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        command = message.text.split()[0].lstrip("/").split("@")[0]
+        try:
+            acc_id = int(message.text.split()[1])
+        except (IndexError, ValueError):
+            yield send(message.chat.id, self.catalog.text("uk_account_state_usage", command=command))
+            return
+
+        if command == "del_uk_account":
+            ok, done = (yield db_call(delete_uk_account, acc_id)), "uk_account_deleted"
+        else:
+            enabled = command == "enable_uk_account"
+            ok = yield db_call(set_uk_account_enabled, acc_id, enabled)
+            done = "uk_account_enabled" if enabled else "uk_account_disabled"
+
+        if ok:
+            yield send(message.chat.id, self.catalog.text(done, acc_id=acc_id))
+        else:
+            yield send(message.chat.id, self.catalog.text("uk_account_not_found"))
+
+    def admin_set_rate_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            _, kind, buy, sell = message.text.split()
+            if kind not in ("cash", "transfer"):
+                raise ValueError(kind)
+            snapshot = rates.engine.publish(
+                f"admin:{message.from_user.id}",
+                **{f"{kind}_buy": int(buy.replace(",", "")), f"{kind}_sell": int(sell.replace(",", ""))},
+            )
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("set_rate_usage"))
+            return
+
+        buy, sell = getattr(snapshot, f"{kind}_buy"), getattr(snapshot, f"{kind}_sell")
+        text = self.catalog.text("rate_updated", kind=kind.upper(), version=snapshot.version, buy=buy, sell=sell)
+        yield send(message.chat.id, text)
+
+    def admin_state_stats_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        stats = "\n".join(f"{key}: {value:,}" for key, value in self.user_state.stats().items())
+        yield send(message.chat.id, self.catalog.text("state_stats", stats=stats))
+
+    def admin_stats_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        yield send(message.chat.id, metrics.format_stats(self.catalog.text("stats_empty"), html.escape))
+
+    def admin_outbox_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        # /outbox retry پیام‌های dead-letter را دوباره در صف می‌گذارد
+        if message.text.split()[1:] == ["retry"]:
+            count = yield db_call(requeue_dead_outbox)
+            self.outbox_sender.dead_changed()
+            yield send(message.chat.id, self.catalog.text("outbox_requeued", count=count))
+            return
+
+        counts = yield db_call(outbox_counts)
+        text = self.catalog.text(
+            "outbox_stats",
+            counts="\n".join(f"{status}: {counts.get(status, 0):,}" for status in ("PENDING", "SENT", "DEAD")),
+            in_flight=self.outbox_sender.pending(),
+            **self.outbox_sender.stats,
+        )
+        yield send(message.chat.id, text)
+
+    def admin_report_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        parts = message.text.split()
+        try:
+            start, end, title_key = report_range(parts[1] if len(parts) > 1 else "today")
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("report_usage"))
+            return
+
+        report = yield db_call(get_report, start, end)
+        yield send(message.chat.id, format_report(report, self.catalog.text(title_key), self.catalog.text))
+
+    def admin_export_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            fmt, status, since, until = parse_export_args(message.text.split()[1:])
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("export_usage"))
+            return
+
+        # فایل روی دیسک ساخته و همان فایل آپلود می‌شود؛ کل خروجی هیچ‌وقت در حافظه نیست
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, export_filename(fmt, status, since, until))
+            count = yield db_call(export_transactions, path, fmt, status, since, until)
+            with open(path, "rb") as f:
+                yield bot_call(
+                    "send_document",
+                    message.chat.id,
+                    f,
+                    visible_file_name=os.path.basename(path),
+                    caption=self.catalog.text("export_caption", count=count),
+                )
+
+    def pending_page(self, admin_id, before_id=None, after_id=None):
+        flt = self.pending_filters.get(admin_id, DEFAULT_PENDING_FILTER)
+        rows, has_more = yield db_call(
+            get_transactions_page,
+            before_id=before_id,
+            after_id=after_id,
+            limit=PENDING_PAGE_SIZE,
+            **pending_query(flt),
+        )
+        if not rows:
+            return None, None
+
+        # جهت حرکت معلوم است، پس یک کوئری کافی است: صفحه‌ای که از آن آمده‌ایم حتماً وجود دارد
+        if after_id is not None:
+            has_newer, has_older = has_more, True
+        elif before_id is not None:
+            has_newer, has_older = True, has_more
+        else:
+            has_newer, has_older = False, has_more
+
+        text = self.catalog.text
+        kb = types.InlineKeyboardMarkup()
+        for tx_id, username, final_pence, _ in rows:
+            label = f"#{tx_id} {('@'+username) if username else ''} - £{format_gbp(final_pence)}"
+            kb.add(types.InlineKeyboardButton(label, callback_data=f"admin_tx_{tx_id}"))
+
+        nav = []
+        if has_newer:
+            nav.append(types.InlineKeyboardButton(text("btn_pending_newer"), callback_data=f"admin_pg_p_{rows[0][0]}"))
+        if has_older:
+            nav.append(types.InlineKeyboardButton(text("btn_pending_older"), callback_data=f"admin_pg_n_{rows[-1][0]}"))
+        if nav:
+            kb.row(*nav)
+
+        return text("pending_title", filter=describe_pending_filter(flt, text)), kb
+
+    def admin_pending_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            self.pending_filters[message.from_user.id] = parse_pending_filter(message.text.split()[1:])
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("pending_usage"))
+            return
+
+        text, kb = yield from self.pending_page(message.from_user.id)
+        if text is None:
+            yield send(message.chat.id, self.catalog.text("pending_filter_empty"))
+            return
+        yield send(message.chat.id, text, reply_markup=kb)
+
+    def admin_find_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+
+        try:
+            terms = parse_find_args(message.text.split()[1:])
+        except ValueError:
+            yield send(message.chat.id, self.catalog.text("find_usage"))
+            return
+
+        # نام کاربری، نام، نام گیرنده، شماره حساب و شبا؛ تراکنش‌های آرشیوشده هم پیدا می‌شوند
+        rows = yield db_call(search_transactions, terms, FIND_RESULTS)
+        if not rows:
+            yield send(message.chat.id, self.catalog.text("find_empty"))
+            return
+
+        kb = types.InlineKeyboardMarkup()
+        for tx_id, user_id, username, fullname, final_pence, status in rows:
+            label = f"#{tx_id} {format_user(username, fullname, user_id)} - £{format_gbp(final_pence)} - {status}"
+            kb.add(types.InlineKeyboardButton(label, callback_data=f"admin_tx_{tx_id}"))
+        yield send(message.chat.id, self.catalog.text("find_results", query=html.escape(" ".join(terms))), reply_markup=kb)
+
+    def admin_show_pending(self, call):
+        if not is_admin(call.from_user.id):
+            return
+
+        self.pending_filters.pop(call.from_user.id, None)
+        text, kb = yield from self.pending_page(call.from_user.id)
+        if text is None:
+            yield answer(call, self.catalog.text("pending_empty"))
+            return
+
+        yield send(call.message.chat.id, text, reply_markup=kb)
+        yield answer(call)
+
+    def admin_pending_page(self, call, direction, cursor):
+        if not is_admin(call.from_user.id) or direction not in ("n", "p"):
+            return
+
+        if direction == "n":
+            text, kb = yield from self.pending_page(call.from_user.id, before_id=cursor)
+        else:
+            text, kb = yield from self.pending_page(call.from_user.id, after_id=cursor)
+        if text is None:
+            yield answer(call, self.catalog.text("pending_no_more"))
+            return
+
+        yield edit(call, text, reply_markup=kb)
+        yield answer(call)
+
+    def admin_tx_detail(self, call, tx_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        tx = yield db_call(get_transaction, tx_id)
+        if not tx:
+            yield answer(call, self.catalog.text("tx_not_found"), show_alert=True)
+            return
+
+        _, user_id, username, fullname, final_pence, amount_toman, status = tx
+        display = format_user(username, fullname, user_id)
+
+        text = self.catalog.text(
+            "tx_detail",
+            tx_id=tx_id,
+            customer=display,
+            final=format_gbp(final_pence),
+            irt=format_toman(amount_toman),
+            status=status,
+        )
+        yield send(call.message.chat.id, text, reply_markup=self.catalog.keyboard("tx_actions", tx_id=tx_id))
+        yield answer(call)
+
+    def admin_cancel_tx(self, call, tx_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        tx = yield db_call(
+            transition_transaction,
+            tx_id,
+            ("WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT"),
+            "CANCELLED_BY_ADMIN",
+            outbox=lambda tx: [
+                outbox.send(f"tx{tx_id}:cancelled:customer", tx[1], self.catalog.text("cancelled_by_admin")),
+                outbox.send(
+                    f"tx{tx_id}:cancelled:admin",
+                    call.message.chat.id,
+                    self.catalog.text("admin_tx_cancelled", tx_id=tx_id),
+                ),
+            ],
+        )
+        if not tx:
+            yield answer(call, self.catalog.text("tx_not_cancellable"), show_alert=True)
+            return
+
+        self.outbox_sender.wake()
+        self.scheduler.cancel(("tx", tx_id))
+        yield answer(call, self.catalog.text("admin_cancel_done"))
+
+    def admin_send_account(self, call, tx_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        suggested = yield db_call(next_uk_account)
+        if not suggested:
+            yield answer(call, self.catalog.text("no_enabled_accounts"), show_alert=True)
+            return
+
+        # حساب بعدی در چرخش اول و با ⭐ نمایش داده می‌شود
+        kb = types.InlineKeyboardMarkup()
+        kb.add(types.InlineKeyboardButton(
+            f"⭐ {suggested.bank} - {suggested.name}", callback_data=f"admin_chooseacc_{tx_id}_{suggested.id}"
+        ))
+        for acc in (yield db_call(get_uk_accounts, enabled_only=True)):
+            if acc.id != suggested.id:
+                kb.add(types.InlineKeyboardButton(f"{acc.bank} - {acc.name}", callback_data=f"admin_chooseacc_{tx_id}_{acc.id}"))
+
+        yield send(call.message.chat.id, self.catalog.text("choose_account"), reply_markup=kb)
+        yield answer(call)
+
+    def admin_choose_account(self, call, tx_id, acc_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        acc = yield db_call(get_uk_account, acc_id)
+        if not acc or not acc.enabled:
+            yield answer(call, self.catalog.text("account_unavailable"), show_alert=True)
+            return
+
+        account_text = (
+            f"BANK: {acc.bank}\n"
+            f"Sort code: {acc.sort_code}\n"
+            f"Account number: {acc.account_number}\n"
+            f"Name: {acc.name}"
+        )
+        catalog = self.catalog
+
+        def messages(tx):
+            user_id, final = tx[1], format_gbp(tx[4])
+            return [
+                outbox.message(
+                    f"tx{tx_id}:account:customer",
+                    user_id,
+                    outbox.step("send_message", user_id, catalog.text("account_details", final=final, account=account_text)),
+                    outbox.step(
+                        "send_message", user_id, catalog.text("account_instructions", minutes=ACCOUNT_OFFER_TTL_SECONDS // 60)
+                    ),
+                ),
+                outbox.send(f"tx{tx_id}:account:admin", call.message.chat.id, catalog.text("admin_account_sent", tx_id=tx_id)),
+            ]
+
+        # متن حساب، وضعیت جدید، مهلت پرداخت و پیام‌ها در یک تراکنش؛ اگر ادمین دیگری زودتر حساب فرستاده باشد None برمی‌گردد
+        expires_at = time.time() + ACCOUNT_OFFER_TTL_SECONDS
+        tx = yield db_call(
+            transition_transaction, tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT", outbox=messages,
+            uk_account_text=account_text, expires_at=expires_at,
+        )
+        if not tx:
+            yield answer(call, self.catalog.text("account_already_sent"), show_alert=True)
+            return
+
+        mark_uk_account_used(acc.id)
+        self.outbox_sender.wake()
+        self.scheduler.schedule(("tx", tx_id), expires_at)
+        yield answer(call)
+
+    # --------- دریافت رسید ---------
+    def process_receipts(self, messages):
+        user_id = messages[0].chat.id
+        tx = yield db_call(get_latest_tx_by_user_and_status, user_id, "WAITING_FOR_RECEIPT")
+        if not tx:
+            return
+
+        tx_id = tx["id"]
+        catalog = self.catalog
+        kb = catalog.keyboard("receipt_review", tx_id=tx_id)
+
+        def receipt_messages(added):
+            message_ids = [message_id for _, message_id in added]
+            key = f"tx{tx_id}:receipt{message_ids[0]}"
+            text = catalog.text("admin_new_receipt", tx_id=tx_id, count=len(added))
+            return [
+                outbox.send(f"{key}:customer", user_id, catalog.text("receipt_received")),
+                # همه عکس‌های جدید با یک forward و دکمه‌ها در یک پیام؛ برای هر ادمین به همین ترتیب
+                *(outbox.message(
+                    f"{key}:admin",
+                    admin,
+                    outbox.step("forward_messages", admin, user_id, message_ids),
+                    outbox.step("send_message", admin, text, reply_markup=kb),
+                ) for admin in ADMIN_IDS),
+            ]
+
+        added = yield db_call(add_receipts, tx_id, user_id, receipt_photos(messages), outbox=receipt_messages)
+        if added is None:
+            # بین خواندن تراکنش و ثبت رسید منقضی یا لغو شد
+            yield send(user_id, catalog.text("receipt_tx_closed"))
+            return
+        if not added:
+            yield send(user_id, catalog.text("receipt_duplicate"))
+            return
+        self.outbox_sender.wake()
+        # رسید رسید؛ add_receipts مهلت پرداخت را هم پاک کرده است
+        self.scheduler.cancel(("tx", tx_id))
+
+    def admin_handle_receipt_decision(self, call, tx_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        approved = call.data.startswith("confirm_tx_")
+        new_status = "WAITING_FOR_IR_INFO" if approved else "RECEIPT_REJECTED"
+        text = self.catalog.text("payment_approved" if approved else "payment_rejected")
+        tx = yield db_call(
+            transition_transaction,
+            tx_id,
+            "WAITING_FOR_RECEIPT",
+            new_status,
+            outbox=lambda tx: [outbox.send(f"tx{tx_id}:{new_status}:customer", tx[1], text)],
+        )
+        if not tx:
+            yield answer(call, self.catalog.text("receipt_already_reviewed"), show_alert=True)
+            return
+
+        self.outbox_sender.wake()
+        if approved:
+            self.awaiting_ir_info.add(tx[1])
+            yield answer(call, self.catalog.text("admin_receipt_approved"))
+        else:
+            yield answer(call, self.catalog.text("admin_receipt_rejected"))
+
+    # --------- دریافت اطلاعات گیرنده ایران ---------
+    def handle_iran_account(self, message):
+        user_id = message.chat.id
+
+        tx = yield db_call(get_latest_tx_by_user_and_status, user_id, "WAITING_FOR_IR_INFO")
+        if not tx:
+            self.awaiting_ir_info.discard(user_id)
+            return
+
+        tx_id = tx["id"]
+        lines = [l.strip() for l in message.text.strip().splitlines() if l.strip()]
+        if not lines:
+            yield send(user_id, self.catalog.text("recipient_empty"))
+            return
+
+        name = lines[0]
+        account = lines[1] if len(lines) > 1 else ""
+        iban = lines[2] if len(lines) > 2 else ""
+
+        kb = self.catalog.keyboard("transfer_done", tx_id=tx_id)
+        admin_text = self.catalog.text("admin_recipient_info", tx_id=tx_id, name=name, account=account, iban=iban)
+
+        if not (yield db_call(save_recipient_info, tx_id, name, account, iban, outbox=lambda tx: [
+            outbox.send(f"tx{tx_id}:recipient:customer", user_id, self.catalog.text("recipient_saved")),
+            *outbox.broadcast(f"tx{tx_id}:recipient:admin", ADMIN_IDS, admin_text, reply_markup=kb),
+        ])):
+            return
+        self.outbox_sender.wake()
+
+    def admin_mark_done(self, call, tx_id):
+        if not is_admin(call.from_user.id):
+            return
+
+        tx = yield db_call(transition_transaction, tx_id, "READY_TO_SEND_IR", "DONE", outbox=lambda tx: [
+            outbox.send(f"tx{tx_id}:done:customer", tx[1], self.catalog.text("transfer_done")),
+            outbox.send(f"tx{tx_id}:done:admin", call.message.chat.id, self.catalog.text("admin_tx_done", tx_id=tx_id)),
+        ])
+        if not tx:
+            yield answer(call, self.catalog.text("tx_already_done"), show_alert=True)
+            return
+
+        self.outbox_sender.wake()
+        yield answer(call, self.catalog.text("admin_done_ack"))
+
+    # --------- عملیات گروهی ---------
+    def bulk_page(self, admin_id):
+        selection = self.bulk_selections[admin_id]
+        from_status, to_status, _, title_key, with_receipt = BULK_ACTIONS[selection["action"]]
+        rows, has_more = yield db_call(
+            get_transactions_page, status=from_status, limit=BULK_PAGE_SIZE, with_receipt=with_receipt
+        )
+        if not rows:
+            return None, None
+
+        # انتخاب‌هایی که دیگر در این وضعیت نیستند (مثلاً ادمین دیگری انجامشان داده) کنار می‌روند
+        selection["shown"] = [row[0] for row in rows]
+        selected = selection["selected"] & set(selection["shown"])
+        selection["selected"] = selected
+
+        text = self.catalog.text
+        kb = types.InlineKeyboardMarkup()
+        for tx_id, username, final_pence, _ in rows:
+            mark = "☑" if tx_id in selected else "☐"
+            label = f"{mark} #{tx_id} {('@'+username) if username else ''} - £{format_gbp(final_pence)}"
+            kb.add(types.InlineKeyboardButton(label, callback_data=f"bulk_t_{tx_id}"))
+        kb.row(
+            types.InlineKeyboardButton(text("btn_bulk_all"), callback_data="bulk_all"),
+            types.InlineKeyboardButton(text("btn_bulk_none"), callback_data="bulk_none"),
+        )
+        kb.add(types.InlineKeyboardButton(text("btn_bulk_go", count=len(selected)), callback_data="bulk_go"))
+
+        page = text("bulk_page", title=text(title_key), from_status=from_status, to_status=to_status)
+        if has_more:
+            page += "\n" + text("bulk_page_more", count=len(rows))
+        return page, kb
+
+    def bulk_menu(self):
+        kb = types.InlineKeyboardMarkup()
+        for action, (_, _, _, title_key, _) in BULK_ACTIONS.items():
+            kb.add(types.InlineKeyboardButton(self.catalog.text(title_key), callback_data=f"bulk_a_{action}"))
+        return kb
+
+    def admin_bulk_cmd(self, message):
+        if not is_admin(message.from_user.id):
+            return
+        yield send(message.chat.id, self.catalog.text("bulk_menu"), reply_markup=self.bulk_menu())
+
+    def admin_bulk_menu(self, call):
+        if not is_admin(call.from_user.id):
+            return
+        yield send(call.message.chat.id, self.catalog.text("bulk_menu"), reply_markup=self.bulk_menu())
+        yield answer(call)
+
+    def admin_bulk_open(self, call, action):
+        if not is_admin(call.from_user.id) or action not in BULK_ACTIONS:
+            return
+
+        self.bulk_selections[call.from_user.id] = {"action": action, "shown": [], "selected": set()}
+        text, kb = yield from self.bulk_page(call.from_user.id)
+        if text is None:
+            self.bulk_selections.pop(call.from_user.id, None)
+            yield answer(call, self.catalog.text("bulk_empty"), show_alert=True)
+            return
+        yield edit(call, text, reply_markup=kb)
+        yield answer(call)
+
+    def bulk_select(self, call, update):
+        selection = self.bulk_selections.get(call.from_user.id)
+        if selection is None:
+            yield answer(call, self.catalog.text("bulk_selection_expired"), show_alert=True)
+            return
+        update(selection)
+        text, kb = yield from self.bulk_page(call.from_user.id)
+        if text is None:
+            yield edit(call, self.catalog.text("bulk_none_left"))
+        else:
+            yield edit(call, text, reply_markup=kb)
+        yield answer(call)
+
+    def admin_bulk_toggle(self, call, tx_id):
+        if is_admin(call.from_user.id):
+            yield from self.bulk_select(call, lambda s: s["selected"].symmetric_difference_update({tx_id}))
+
+    def admin_bulk_select_all(self, call):
+        if not is_admin(call.from_user.id):
+            return
+        if call.data == "bulk_all":
+            yield from self.bulk_select(call, lambda s: s["selected"].update(s["shown"]))
+        else:
+            yield from self.bulk_select(call, lambda s: s["selected"].clear())
+
+    def admin_bulk_apply(self, call):
+        if not is_admin(call.from_user.id):
+            return
+
+        selection = self.bulk_selections.get(call.from_user.id)
+        if not selection or not selection["selected"]:
+            yield answer(call, self.catalog.text("bulk_nothing_selected"), show_alert=True)
+            return
+
+        from_status, to_status, text_key, _, with_receipt = BULK_ACTIONS[selection["action"]]
+        text = self.catalog.text(text_key)
+        selected = sorted(selection["selected"])
+        # یک تراکنش: UPDATEها با executemany و اعلان همه مشتری‌ها با هم در outbox
+        rows = yield db_call(transition_transactions, selected, from_status, to_status, outbox=lambda rows: [
+            outbox.send(f"tx{row[0]}:{to_status}:customer", row[1], text) for row in rows
+        ], with_receipt=with_receipt)
+        selection["selected"] = set()
+        if rows:
+            self.outbox_sender.wake()
+        for row in rows:
+            self.scheduler.cancel(("tx", row[0]))
+        if to_status == "WAITING_FOR_IR_INFO":
+            self.awaiting_ir_info.update(row[1] for row in rows)
+
+        summary = self.catalog.text("bulk_applied", count=len(rows), from_status=from_status, to_status=to_status)
+        if len(rows) < len(selected):
+            summary += "\n" + self.catalog.text("bulk_skipped", count=len(selected) - len(rows))
+        yield send(call.message.chat.id, summary)
+        yield answer(call)
+
+        # صفحه بعدی همین عمل (اگر موردی مانده)
+        next_text, kb = yield from self.bulk_page(call.from_user.id)
+        if next_text is None:
+            self.bulk_selections.pop(call.from_user.id, None)
+            yield edit(call, self.catalog.text("bulk_none_left"))
+        else:
+            yield edit(call, next_text, reply_markup=kb)
+
+    # --------- مهلت‌ها ---------
+    def expiry_messages(self, rows):
+        messages = [
+            outbox.send(
+                f"tx{tx_id}:expired:customer",
+                user_id,
+                self.catalog.text("expired_" + status.lower(), tx_id=tx_id, final=format_gbp(final_pence)),
+            )
+            for tx_id, user_id, final_pence, status in rows
+        ]
+        # برای ادمین‌ها یک پیام برای کل دسته
+        ids = ", ".join(f"#{row[0]}" for row in rows)
+        text = self.catalog.text("admin_expired", count=len(rows), ids=ids)
+        return messages + outbox.broadcast(f"tx{rows[0][0]}:expired:admin", ADMIN_IDS, text)
+
+    def expire_quote(self, chat_id):
+        # فقط اگر هنوز همان مرحله تأیید با نرخ منقضی‌شده است؛ مبلغ جدید نرخ و مهلت جدید دارد
+        state = yield db_call(
+            self.user_state.pop_if, chat_id, lambda s: s.step == CONFIRM and rates.quote_expired(s.quote)
+        )
+        if state is None:
+            return False
+        yield db_call(
+            enqueue_outbox, [outbox.send(f"quote{state.quote.expires_at:.0f}", chat_id, self.catalog.text("quote_expired"))]
+        )
+        return True
+
+    def handle_deadlines(self, keys):
+        # کلیدهای scheduler: ("tx", tx_id) و ("quote", chat_id)
+        tx_ids = [value for kind, value in keys if kind == "tx"]
+        notified = bool(tx_ids) and bool((yield db_call(expire_transactions, tx_ids, outbox=self.expiry_messages)))
+        for kind, chat_id in keys:
+            if kind == "quote":
+                notified = (yield from self.expire_quote(chat_id)) or notified
+        if notified:
+            self.outbox_sender.wake()
+
+    def load_deadlines(self):
+        # بعد از restart: مهلت تراکنش‌ها از expires_at و مهلت نرخ‌ها از وضعیت‌های ذخیره‌شده
+        for tx_id, expires_at in (yield db_call(get_transaction_deadlines)):
+            self.scheduler.schedule(("tx", tx_id), expires_at)
+        for chat_id, state in self.user_state.items():
+            if state.step == CONFIRM and state.quote:
+                self.scheduler.schedule(("quote", chat_id), state.quote.expires_at)
+
+    def startup(self):
+        yield db_call(init_db)
+        self.awaiting_ir_info.update((yield db_call(get_user_ids_by_status, "WAITING_FOR_IR_INFO")))
+        yield db_call(self.user_state.load)
+        yield from self.load_deadlines()
+        yield db_call(rates.start_sources, rates.engine, RATES_FILE, RATES_URL, RATES_REFRESH_SECONDS)
+        if ARCHIVE_INTERVAL_SECONDS:
+            archive.start_archiver(
+                ARCHIVE_INTERVAL_SECONDS, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, OUTBOX_RETENTION_DAYS
+            )
+        if metrics.METRICS_ENABLED:
+            metrics.start_server()
+
+    # --------- مسیریابی ---------
+    def route_text(self, message):
+        handler = self.router.resolve_text(message.text)
+        if handler:
+            yield from handler(message)
+        elif self.user_state.step(message.chat.id) == WAITING_UK_AMOUNT:
+            yield from self.uk_to_ir_amount(message)
+        elif message.chat.id in self.awaiting_ir_info:
+            # فقط کاربرانی که تراکنش منتظر اطلاعات گیرنده دارند به DB می‌رسند
+            yield from self.handle_iran_account(message)
+
+    def route_callback(self, call):
+        route = self.router.resolve_callback(call.data)
+        if route:
+            handler, args = route
+            yield from handler(call, *args)
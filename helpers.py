@@ -0,0 +1,153 @@
+# helpers.py
+import datetime
+from collections import namedtuple
+from config import ADMIN_IDS
+from db import TX_STATUSES
+from money import parse_gbp, format_gbp, format_toman
+
+# دوره‌های /report: (تعداد روز شامل امروز، کلید عنوان در catalog)
+REPORT_PERIODS = {
+    "today": (1, "report_today"),
+    "yesterday": (1, "report_yesterday"),
+    "week": (7, "report_week"),
+    "month": (30, "report_month"),
+}
+
+# عملیات گروهی /bulk: action -> (وضعیت فعلی، وضعیت جدید، کلید پیام مشتری، کلید عنوان دکمه، فقط با رسید)
+# تأیید گروهی فقط تراکنش‌هایی را نشان می‌دهد و جابه‌جا می‌کند که مشتری برایشان رسید فرستاده است
+BULK_ACTIONS = {
+    "done": ("READY_TO_SEND_IR", "DONE", "transfer_done", "btn_bulk_done", False),
+    "approve": ("WAITING_FOR_RECEIPT", "WAITING_FOR_IR_INFO", "payment_approved", "btn_bulk_approve", True),
+    "cancel": ("WAITING_FOR_ACCOUNT", "CANCELLED_BY_ADMIN", "cancelled_by_admin", "btn_bulk_cancel", False),
+}
+
+# حداکثر کلمه‌های یک جستجوی /find
+FIND_MAX_TERMS = 5
+
+PendingFilter = namedtuple("PendingFilter", ["status", "min_pence", "max_pence", "max_age_hours"])
+DEFAULT_PENDING_FILTER = PendingFilter("WAITING_FOR_ACCOUNT", None, None, None)
+
+
+def format_user(username, fullname, user_id):
+    if username:
+        return f"@{username}"
+    if fullname:
+        return f"{fullname} (ID: {user_id})"
+    return f"ID: {user_id}"
+
+
+def is_admin(user_id):
+    return user_id in ADMIN_IDS
+
+
+def parse_pending_filter(args):
+    # /pending [STATUS] [min-max] [Nh|Nd] — ترتیب آرگومان‌ها مهم نیست
+    status, min_pence, max_pence, max_age_hours = DEFAULT_PENDING_FILTER
+    for arg in args:
+        upper = arg.upper()
+        if upper in TX_STATUSES:
+            status = upper
+        elif "-" in arg:
+            low, _, high = arg.partition("-")
+            min_pence = parse_gbp(low) if low else None
+            max_pence = parse_gbp(high) if high else None
+        elif arg[-1:].lower() in ("h", "d"):
+            hours = int(arg[:-1])
+            max_age_hours = hours * 24 if arg[-1].lower() == "d" else hours
+        else:
+            raise ValueError(f"unknown filter: {arg}")
+    return PendingFilter(status, min_pence, max_pence, max_age_hours)
+
+
+def parse_find_args(args):
+    # /find ali 6037 — @ و # اول کلمه حذف می‌شوند؛ هر کلمه حداقل دو حرف یا رقم
+    terms = [arg.lstrip("@#") for arg in args]
+    if not terms or len(terms) > FIND_MAX_TERMS:
+        raise ValueError(f"expected 1 to {FIND_MAX_TERMS} search terms")
+    for term in terms:
+        if sum(ch.isalnum() for ch in term) < 2:
+            raise ValueError(f"search term too short: {term}")
+    return terms
+
+
+def describe_pending_filter(flt, text):
+    # text همان catalog.text است
+    parts = [flt.status]
+    if flt.min_pence is not None or flt.max_pence is not None:
+        low = "" if flt.min_pence is None else f"£{format_gbp(flt.min_pence)}"
+        high = "" if flt.max_pence is None else f"£{format_gbp(flt.max_pence)}"
+        parts.append(f"{low}-{high}")
+    if flt.max_age_hours is not None:
+        parts.append(text("pending_filter_hours", hours=flt.max_age_hours))
+    return " | ".join(parts)
+
+
+def pending_query(flt):
+    # آرگومان‌های get_transactions_page برای یک فیلتر
+    since = None
+    if flt.max_age_hours is not None:
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=flt.max_age_hours)
+    return {"status": flt.status, "min_pence": flt.min_pence, "max_pence": flt.max_pence, "since": since}
+
+
+def report_range(period, today=None):
+    # روزها به UTC هستند، مثل created_at تراکنش‌ها
+    if period not in REPORT_PERIODS:
+        raise ValueError(f"unknown period: {period}")
+    days, title_key = REPORT_PERIODS[period]
+    end = today or datetime.datetime.utcnow().date()
+    if period == "yesterday":
+        end -= datetime.timedelta(days=1)
+    start = end - datetime.timedelta(days=days - 1)
+    return start.isoformat(), end.isoformat(), title_key
+
+
+def format_report(report, title, text):
+    # title متن عنوان دوره و text همان catalog.text است
+    lines = [
+        text("report_header", title=title, start=report["start"], end=report["end"]),
+        text(
+            "report_created",
+            count=report["created_count"],
+            pence=format_gbp(report["created_pence"]),
+            toman=format_toman(report["created_toman"]),
+        ),
+        text(
+            "report_done",
+            count=report["done_count"],
+            pence=format_gbp(report["done_pence"]),
+            toman=format_toman(report["done_toman"]),
+        ),
+    ]
+    if report["avg_done_seconds"] is not None:
+        seconds = report["avg_done_seconds"]
+        if seconds < 3600:
+            duration = text("report_minutes", value=seconds / 60)
+        else:
+            duration = text("report_hours", value=seconds / 3600)
+        lines.append(text("report_avg_done", duration=duration))
+
+    if report["entered"]:
+        lines.append("\n" + text("report_entered"))
+        lines.extend(f"{status}: {count:,}" for status, count in sorted(report["entered"].items()))
+    if report["current"]:
+        lines.append("\n" + text("report_current"))
+        lines.extend(f"{status}: {count:,}" for status, count in sorted(report["current"].items()))
+    return "\n".join(lines)
+
+
+def parse_export_args(args):
+    # /export [csv|jsonl] [STATUS] [از YYYY-MM-DD] [تا YYYY-MM-DD]
+    fmt, status, dates = "csv", None, []
+    for arg in args:
+        if arg.lower() in ("csv", "jsonl"):
+            fmt = arg.lower()
+        elif arg.upper() in TX_STATUSES:
+            status = arg.upper()
+        else:
+            dates.append(datetime.date.fromisoformat(arg))
+    if len(dates) > 2:
+        raise ValueError("too many dates")
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    return fmt, status, since, until
@@ -0,0 +1,343 @@
+# metrics.py
+# هیستوگرام زمان اجرای handlerها، توابع db.py، statementهای SQL و درخواست‌های Bot API
+# خروجی به فرمت متنی Prometheus روی یک پورت محلی و خلاصه برای دستور /stats
+import bisect
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+# 0 یعنی endpoint خاموش؛ جمع‌آوری و /stats همچنان کار می‌کنند
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# مرز bucketها به ثانیه
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# family -> (نام متریک، نام label، توضیح)
+FAMILIES = {
+    "handler": ("sarafi_handler_seconds", "handler", "Bot handler latency"),
+    "db": ("sarafi_db_call_seconds", "function", "db.py function latency"),
+    "sql": ("sarafi_sql_seconds", "statement", "SQL statement latency"),
+    "api": ("sarafi_api_seconds", "method", "Telegram Bot API request latency"),
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "errors", "in_flight")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.in_flight = 0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        # تقریبی: مرز بالای bucketی که رتبه q در آن می‌افتد
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if cumulative >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    def copy(self):
+        h = Histogram()
+        h.counts = list(self.counts)
+        h.count, h.sum, h.errors, h.in_flight = self.count, self.sum, self.errors, self.in_flight
+        return h
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, family, label):
+        key = (family, label)
+        h = self._histograms.get(key)
+        if h is None:
+            h = self._histograms[key] = Histogram()
+        return h
+
+    def begin(self, family, label):
+        with self._lock:
+            self._histogram(family, label).in_flight += 1
+
+    def end(self, family, label, seconds, error=False):
+        with self._lock:
+            h = self._histogram(family, label)
+            h.in_flight -= 1
+            h.observe(seconds, error)
+
+    def observe(self, family, label, seconds, error=False):
+        with self._lock:
+            self._histogram(family, label).observe(seconds, error)
+
+    def gauge(self, name, fn, help=""):
+        # fn موقع خواندن صدا زده می‌شود؛ مثل طول صف broadcaster
+        self._gauges[name] = (fn, help)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: h.copy() for key, h in self._histograms.items()}
+
+    def gauges(self):
+        values = {}
+        for name, (fn, _) in list(self._gauges.items()):
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = float("nan")
+        return values
+
+    def top(self, family, n=8):
+        rows = [(label, h) for (fam, label), h in self.snapshot().items() if fam == family]
+        rows.sort(key=lambda row: row[1].sum, reverse=True)
+        return rows[:n]
+
+    def render(self):
+        snapshot = self.snapshot()
+        lines = []
+        for family, (name, label_name, help) in FAMILIES.items():
+            rows = sorted((label, h) for (fam, label), h in snapshot.items() if fam == family)
+            if not rows:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for label, h in rows:
+                base = f'{label_name}="{_escape(label)}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{base},le="+Inf"}} {h.count}')
+                lines.append(f"{name}_sum{{{base}}} {h.sum:.6f}")
+                lines.append(f"{name}_count{{{base}}} {h.count}")
+
+            errors = name.replace("_seconds", "_errors_total")
+            lines.append(f"# TYPE {errors} counter")
+            for label, h in rows:
+                lines.append(f'{errors}{{{label_name}="{_escape(label)}"}} {h.errors}')
+
+            if family in ("handler", "db"):
+                in_flight = name.replace("_seconds", "_in_flight")
+                lines.append(f"# TYPE {in_flight} gauge")
+                for label, h in rows:
+                    lines.append(f'{in_flight}{{{label_name}="{_escape(label)}"}} {h.in_flight}')
+
+        for name, value in sorted(self.gauges().items()):
+            help = self._gauges[name][1]
+            if help:
+                lines.append(f"# HELP sarafi_{name} {help}")
+            lines.append(f"# TYPE sarafi_{name} gauge")
+            lines.append(f"sarafi_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+def timed(family, label, fn):
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            registry.begin(family, label)
+            started = time.perf_counter()
+            error = True
+            try:
+                result = await fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                registry.end(family, label, time.perf_counter() - started, error)
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(fn):
+        # handlerهای handlers.py: زمان از اولین effect تا پایان، شامل اجرای effectها در runtime
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            registry.begin(family, label)
+            started = time.perf_counter()
+            error = True
+            try:
+                result = yield from fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                registry.end(family, label, time.perf_counter() - started, error)
+        return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        registry.begin(family, label)
+        started = time.perf_counter()
+        error = True
+        try:
+            result = fn(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            registry.end(family, label, time.perf_counter() - started, error)
+    return wrapper
+
+
+def instrument_functions(namespace, family, module_name):
+    # توابع عمومی تعریف‌شده در همان ماژول؛ import‌ها و توابع _خصوصی دست نمی‌خورند
+    for name, obj in list(namespace.items()):
+        if name.startswith("_") or not inspect.isfunction(obj) or obj.__module__ != module_name:
+            continue
+        namespace[name] = timed(family, name, obj)
+
+
+def instrument_bot(bot):
+    # همه لیست‌های *_handlers در TeleBot/AsyncTeleBot؛ هر عضو dict با کلید function است
+    for attr, handlers in vars(bot).items():
+        if not attr.endswith("_handlers") or not isinstance(handlers, list):
+            continue
+        for handler in handlers:
+            if isinstance(handler, dict) and "function" in handler:
+                fn = handler["function"]
+                handler["function"] = timed("handler", fn.__name__, fn)
+
+
+def instrument_router(router):
+    router.wrap_handlers(lambda fn: timed("handler", fn.__name__, fn))
+
+
+# "?, ?, ?" با هر طولی (مثل IN (...) در expire_transactions و عملیات گروهی) یک برچسب می‌شود
+_PLACEHOLDER_RUN = re.compile(r"\?\d*(?:\s*,\s*\?\d*)+")
+SQL_LABEL_CACHE = 1000
+_sql_labels = {}
+
+
+def sql_label(sql):
+    return _PLACEHOLDER_RUN.sub("?, ...", " ".join(sql.split()))[:80]
+
+
+def observe_sql(sql, seconds, error):
+    # برچسب هر متن statement یک بار ساخته و cache می‌شود؛ cache اندازه محدود دارد
+    label = _sql_labels.get(sql)
+    if label is None:
+        if len(_sql_labels) >= SQL_LABEL_CACHE:
+            _sql_labels.clear()
+        label = _sql_labels[sql] = sql_label(sql)
+    registry.observe("sql", label, seconds, error)
+
+
+_api_instrumented = False
+
+
+def instrument_api():
+    global _api_instrumented
+    if _api_instrumented:
+        return
+    _api_instrumented = True
+
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+
+    def _make_request(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        error = True
+        try:
+            result = make_request(token, method_name, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            registry.observe("api", method_name, time.perf_counter() - started, error)
+
+    apihelper._make_request = _make_request
+
+    try:
+        from telebot import asyncio_helper
+    except ImportError:
+        return
+
+    process_request = asyncio_helper._process_request
+
+    async def _process_request(token, url, *args, **kwargs):
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await process_request(token, url, *args, **kwargs)
+            error = False
+            return result
+        finally:
+            registry.observe("api", url, time.perf_counter() - started, error)
+
+    asyncio_helper._process_request = _process_request
+
+
+def format_stats(empty, escape=str):
+    # متن /stats: پرهزینه‌ترین‌ها بر اساس مجموع زمان؛ empty (از catalog) وقتی هنوز چیزی اندازه گرفته نشده
+    sections = []
+    for family, title in (("handler", "Handlers"), ("db", "DB"), ("sql", "SQL"), ("api", "API")):
+        rows = registry.top(family)
+        if not rows:
+            continue
+        lines = [f"<b>{title}</b>"]
+        for label, h in rows:
+            avg = h.sum / h.count * 1000 if h.count else 0
+            p95 = h.quantile(0.95) * 1000
+            errors = f" err={h.errors}" if h.errors else ""
+            lines.append(f"{escape(label)}: n={h.count} avg={avg:.1f}ms p95≤{p95:g}ms{errors}")
+        sections.append("\n".join(lines))
+
+    gauges = registry.gauges()
+    if gauges:
+        sections.append("<b>Queues</b>\n" + "\n".join(f"{name}: {value}" for name, value in sorted(gauges.items())))
+    return "\n\n".join(sections) or empty
+
+
+def start_server(host=METRICS_LISTEN, port=METRICS_PORT):
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        # پورت گرفته شده (مثلاً دو ربات روی یک سرور)؛ ربات بدون endpoint بالا می‌آید و /stats کار می‌کند
+        print(f"metrics server disabled, cannot listen on {host}:{port}: {e!r}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
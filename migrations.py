@@ -0,0 +1,484 @@
+# migrations.py
+import datetime
+from dbconn import get_connection, unit_of_work
+
+# هر دسته تبدیل پول در تراکنش خودش؛ قفل نوشتن بین دسته‌ها آزاد می‌شود
+MONEY_BATCH_SIZE = 5000
+
+
+def _convert_money(table, batch_size=MONEY_BATCH_SIZE):
+    # ردیف‌های تبدیل‌شده (final_pence غیر NULL) دوباره دست نمی‌خورند؛ اجرای دوباره بعد از خطا امن است
+    last_id = get_connection().execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    for start in range(0, last_id, batch_size):
+        with unit_of_work() as conn:
+            conn.execute(f"""
+                UPDATE {table} SET
+                    amount_pence = CAST(round(amount_gbp * 100) AS INTEGER),
+                    final_pence = CAST(round(final_gbp * 100) AS INTEGER),
+                    amount_toman = CAST(round(amount_irt) AS INTEGER)
+                WHERE id > ? AND id <= ? AND final_pence IS NULL
+            """, (start, start + batch_size))
+
+
+def _convert_money_columns(schema):
+    _convert_money(f"{schema}.transactions")
+
+
+# ستون‌های قابل جستجو با /find
+FTS_COLUMNS = ("username", "fullname", "recipient_name", "recipient_account", "recipient_iban")
+
+
+def _fts_columns(row=None):
+    # "username, ..." یا "NEW.username, ..."
+    return ", ".join(column if row is None else f"{row}.{column}" for column in FTS_COLUMNS)
+
+
+# (version, description, statements) — فقط به انتهای لیست اضافه کنید، نسخه‌های قبلی را تغییر ندهید.
+# هر statement یک رشته (روی main) یا (schema, sql) است؛ statementهای ("archive", ...) جدا و بر اساس
+# نسخه خود دیتابیس آرشیو اجرا می‌شوند. متن sql در انتخاب دیتابیس نقشی ندارد.
+# statements می‌تواند تابعی باشد که دسته‌دسته و با تراکنش‌های خودش کار می‌کند؛ یک بار با "main" و
+# یک بار با "archive" صدا زده می‌شود
+MIGRATIONS = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            fullname TEXT,
+            amount_gbp REAL,
+            final_gbp REAL,
+            amount_irt REAL,
+            status TEXT,
+            uk_account_text TEXT,
+            receipt_file_id TEXT,
+            created_at TEXT,
+            recipient_name TEXT,
+            recipient_account TEXT,
+            recipient_iban TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS uk_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bank TEXT,
+            sort_code TEXT,
+            account_number TEXT,
+            name TEXT
+        )
+        """,
+    ]),
+    (2, "hot path indexes on transactions", [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_status_id ON transactions (user_id, status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_status_id ON transactions (status, id)",
+    ]),
+    (3, "quoted rate on transactions", [
+        "ALTER TABLE transactions ADD COLUMN rate INTEGER",
+        "ALTER TABLE transactions ADD COLUMN rate_version INTEGER",
+    ]),
+    (4, "persistent conversation state", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            chat_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversation_state_updated_at ON conversation_state (updated_at)",
+    ]),
+    (5, "enable/disable flag on uk_accounts", [
+        "ALTER TABLE uk_accounts ADD COLUMN enabled INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (6, "receipts table with per-transaction dedupe", [
+        """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tx_id INTEGER NOT NULL,
+            user_id INTEGER,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            message_id INTEGER,
+            media_group_id TEXT,
+            created_at TEXT
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_receipts_tx_file ON receipts (tx_id, file_unique_id)",
+        # رسیدهای قبلی فقط file_id دارند؛ همان را به جای file_unique_id می‌گذاریم
+        """
+        INSERT OR IGNORE INTO receipts (tx_id, user_id, file_id, file_unique_id, created_at)
+        SELECT id, user_id, receipt_file_id, receipt_file_id, created_at
+        FROM transactions
+        WHERE receipt_file_id IS NOT NULL
+        """,
+    ]),
+    (7, "daily and per-status rollups maintained by triggers", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_volume (
+            day TEXT PRIMARY KEY,
+            created_count INTEGER NOT NULL DEFAULT 0,
+            created_gbp REAL NOT NULL DEFAULT 0,
+            created_irt REAL NOT NULL DEFAULT 0,
+            done_count INTEGER NOT NULL DEFAULT 0,
+            done_gbp REAL NOT NULL DEFAULT 0,
+            done_irt REAL NOT NULL DEFAULT 0,
+            done_seconds REAL NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_status (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            entered INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS status_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # روز بر اساس UTC، مثل created_at
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO daily_volume (day, created_count, created_gbp, created_irt)
+            VALUES (substr(NEW.created_at, 1, 10), 1, COALESCE(NEW.final_gbp, 0), COALESCE(NEW.amount_irt, 0))
+            ON CONFLICT (day) DO UPDATE SET
+                created_count = created_count + 1,
+                created_gbp = created_gbp + excluded.created_gbp,
+                created_irt = created_irt + excluded.created_irt;
+            INSERT INTO daily_status (day, status, entered)
+            VALUES (substr(NEW.created_at, 1, 10), NEW.status, 1)
+            ON CONFLICT (day, status) DO UPDATE SET entered = entered + 1;
+            INSERT INTO status_counts (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT (status) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_status
+        AFTER UPDATE OF status ON transactions
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            INSERT INTO daily_status (day, status, entered)
+            VALUES (date('now'), NEW.status, 1)
+            ON CONFLICT (day, status) DO UPDATE SET entered = entered + 1;
+            UPDATE status_counts SET count = count - 1 WHERE status = OLD.status;
+            INSERT INTO status_counts (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT (status) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_done
+        AFTER UPDATE OF status ON transactions
+        WHEN NEW.status = 'DONE' AND OLD.status IS NOT 'DONE'
+        BEGIN
+            INSERT INTO daily_volume (day, done_count, done_gbp, done_irt, done_seconds)
+            VALUES (
+                date('now'),
+                1,
+                COALESCE(NEW.final_gbp, 0),
+                COALESCE(NEW.amount_irt, 0),
+                (julianday('now') - julianday(NEW.created_at)) * 86400
+            )
+            ON CONFLICT (day) DO UPDATE SET
+                done_count = done_count + 1,
+                done_gbp = done_gbp + excluded.done_gbp,
+                done_irt = done_irt + excluded.done_irt,
+                done_seconds = done_seconds + excluded.done_seconds;
+        END
+        """,
+        # تاریخچه قبلی: زمان تغییر وضعیت‌ها ثبت نشده، پس فقط ثبت‌ها و وضعیت فعلی بازسازی می‌شوند
+        """
+        INSERT INTO daily_volume (day, created_count, created_gbp, created_irt)
+        SELECT substr(created_at, 1, 10), COUNT(*), COALESCE(SUM(final_gbp), 0), COALESCE(SUM(amount_irt), 0)
+        FROM transactions
+        WHERE created_at IS NOT NULL
+        GROUP BY substr(created_at, 1, 10)
+        """,
+        """
+        INSERT INTO daily_status (day, status, entered)
+        SELECT substr(created_at, 1, 10), 'WAITING_FOR_ACCOUNT', COUNT(*)
+        FROM transactions
+        WHERE created_at IS NOT NULL
+        GROUP BY substr(created_at, 1, 10)
+        """,
+        """
+        INSERT INTO status_counts (status, count)
+        SELECT status, COUNT(*) FROM transactions WHERE status IS NOT NULL GROUP BY status
+        """,
+    ]),
+    (8, "archive tables in the attached archive database", [
+        ("archive", """
+        CREATE TABLE IF NOT EXISTS archive.transactions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            fullname TEXT,
+            amount_gbp REAL,
+            final_gbp REAL,
+            amount_irt REAL,
+            status TEXT,
+            uk_account_text TEXT,
+            receipt_file_id TEXT,
+            created_at TEXT,
+            recipient_name TEXT,
+            recipient_account TEXT,
+            recipient_iban TEXT,
+            rate INTEGER,
+            rate_version INTEGER,
+            archived_at TEXT
+        )
+        """),
+        ("archive", """
+        CREATE TABLE IF NOT EXISTS archive.receipts (
+            id INTEGER PRIMARY KEY,
+            tx_id INTEGER NOT NULL,
+            user_id INTEGER,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            message_id INTEGER,
+            media_group_id TEXT,
+            created_at TEXT
+        )
+        """),
+        ("archive", "CREATE INDEX IF NOT EXISTS archive.idx_archive_receipts_tx_id ON receipts (tx_id)"),
+    ]),
+    (9, "outbox for outgoing messages", [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            steps TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'PENDING',
+            position INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT,
+            sent_at TEXT
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_idempotency_key ON outbox (idempotency_key)",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_id ON outbox (status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_chat_status_id ON outbox (chat_id, status, id)",
+    ]),
+    (10, "expiry deadline on transactions", [
+        "ALTER TABLE transactions ADD COLUMN expires_at REAL",
+        ("archive", "ALTER TABLE archive.transactions ADD COLUMN expires_at REAL"),
+        # فقط تراکنش‌هایی که مهلت دارند؛ بعد از هر تغییر وضعیت NULL می‌شود، پس ایندکس کوچک می‌ماند
+        "CREATE INDEX IF NOT EXISTS idx_transactions_expires_at ON transactions (expires_at) WHERE expires_at IS NOT NULL",
+    ]),
+    # ستون‌های REAL قبلی می‌مانند ولی دیگر نوشته نمی‌شوند؛ حذفشان کل جدول را یک‌جا بازنویسی می‌کند
+    (11, "integer money columns and rollups", [
+        "ALTER TABLE transactions ADD COLUMN amount_pence INTEGER",
+        "ALTER TABLE transactions ADD COLUMN final_pence INTEGER",
+        "ALTER TABLE transactions ADD COLUMN amount_toman INTEGER",
+        ("archive", "ALTER TABLE archive.transactions ADD COLUMN amount_pence INTEGER"),
+        ("archive", "ALTER TABLE archive.transactions ADD COLUMN final_pence INTEGER"),
+        ("archive", "ALTER TABLE archive.transactions ADD COLUMN amount_toman INTEGER"),
+        "ALTER TABLE daily_volume ADD COLUMN created_pence INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_volume ADD COLUMN created_toman INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_volume ADD COLUMN done_pence INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_volume ADD COLUMN done_toman INTEGER NOT NULL DEFAULT 0",
+        # یک ردیف برای هر روز؛ در همین تراکنش تبدیل می‌شود
+        """
+        UPDATE daily_volume SET
+            created_pence = CAST(round(created_gbp * 100) AS INTEGER),
+            created_toman = CAST(round(created_irt) AS INTEGER),
+            done_pence = CAST(round(done_gbp * 100) AS INTEGER),
+            done_toman = CAST(round(done_irt) AS INTEGER)
+        """,
+        "DROP TRIGGER IF EXISTS trg_transactions_rollup_insert",
+        "DROP TRIGGER IF EXISTS trg_transactions_rollup_done",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO daily_volume (day, created_count, created_pence, created_toman)
+            VALUES (substr(NEW.created_at, 1, 10), 1, COALESCE(NEW.final_pence, 0), COALESCE(NEW.amount_toman, 0))
+            ON CONFLICT (day) DO UPDATE SET
+                created_count = created_count + 1,
+                created_pence = created_pence + excluded.created_pence,
+                created_toman = created_toman + excluded.created_toman;
+            INSERT INTO daily_status (day, status, entered)
+            VALUES (substr(NEW.created_at, 1, 10), NEW.status, 1)
+            ON CONFLICT (day, status) DO UPDATE SET entered = entered + 1;
+            INSERT INTO status_counts (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT (status) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_done
+        AFTER UPDATE OF status ON transactions
+        WHEN NEW.status = 'DONE' AND OLD.status IS NOT 'DONE'
+        BEGIN
+            INSERT INTO daily_volume (day, done_count, done_pence, done_toman, done_seconds)
+            VALUES (
+                date('now'),
+                1,
+                COALESCE(NEW.final_pence, 0),
+                COALESCE(NEW.amount_toman, 0),
+                (julianday('now') - julianday(NEW.created_at)) * 86400
+            )
+            ON CONFLICT (day) DO UPDATE SET
+                done_count = done_count + 1,
+                done_pence = done_pence + excluded.done_pence,
+                done_toman = done_toman + excluded.done_toman,
+                done_seconds = done_seconds + excluded.done_seconds;
+        END
+        """,
+    ]),
+    (12, "convert transaction amounts to pence and toman", _convert_money_columns),
+    # ایندکس FTS5 با external content: متن فقط در خود transactions است و ایندکس با trigger به‌روز می‌ماند.
+    # ردیف‌های آرشیو ایندکس خودشان را در دیتابیس آرشیو دارند؛ trigger حذف جدول زنده آن‌ها را از ایندکس زنده برمی‌دارد
+    (13, "full-text search over customer and recipient fields", [
+        *((schema, f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.transactions_fts USING fts5(
+            {_fts_columns()},
+            content='transactions',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """) for schema in ("main", "archive")),
+        *((schema, f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_transactions_fts_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, {_fts_columns()})
+            VALUES (NEW.id, {_fts_columns("NEW")});
+        END
+        """) for schema in ("main", "archive")),
+        *((schema, f"""
+        CREATE TRIGGER IF NOT EXISTS {schema}.trg_transactions_fts_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, {_fts_columns()})
+            VALUES ('delete', OLD.id, {_fts_columns("OLD")});
+        END
+        """) for schema in ("main", "archive")),
+        # ردیف‌های آرشیو دیگر عوض نمی‌شوند؛ update فقط روی جدول زنده
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+        AFTER UPDATE OF {_fts_columns()} ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, {_fts_columns()})
+            VALUES ('delete', OLD.id, {_fts_columns("OLD")});
+            INSERT INTO transactions_fts (rowid, {_fts_columns()})
+            VALUES (NEW.id, {_fts_columns("NEW")});
+        END
+        """,
+        # ساختن ایندکس ردیف‌های موجود از روی جدول‌ها؛ یک بار و در همین تراکنش
+        "INSERT INTO main.transactions_fts (transactions_fts) VALUES ('rebuild')",
+        ("archive", "INSERT INTO archive.transactions_fts (transactions_fts) VALUES ('rebuild')"),
+    ]),
+]
+
+
+class QueryPlanError(RuntimeError):
+    pass
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    """)
+
+
+def current_version():
+    conn = get_connection()
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def _archive_version(conn, main_version):
+    version = conn.execute("PRAGMA archive.user_version").fetchone()[0]
+    has_tables = conn.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'transactions'").fetchone()
+    if version == 0 and has_tables:
+        # آرشیوی که قبل از نسخه‌دار شدن همراه main به‌روز شده است؛ نسخه همان main است
+        with unit_of_work():
+            _record_archive(main_version)(conn)
+        return main_version
+    # فایل آرشیو نیست یا خالی است (ATTACH فایل خالی می‌سازد): همه statementهای آرشیو از اول
+    return version if has_tables else 0
+
+
+def _apply(statements, schema, record):
+    if callable(statements):
+        # تراکنش‌ها با خود تابع است؛ نسخه فقط بعد از تمام شدن همه دسته‌ها ثبت می‌شود
+        statements(schema)
+        statements = []
+    # هر migration در تراکنش خودش؛ اگر وسط کار خطا بدهد نسخه ثبت نمی‌شود
+    with unit_of_work() as conn:
+        for statement in statements:
+            target, sql = statement if isinstance(statement, tuple) else ("main", statement)
+            if target == schema:
+                conn.execute(sql)
+        record(conn)
+
+
+def _record_main(number, description):
+    def record(conn):
+        conn.execute(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+            (number, description, datetime.datetime.utcnow().isoformat()),
+        )
+    return record
+
+
+def _record_archive(number):
+    def record(conn):
+        # user_version در هدر فایل آرشیو است و با همان تراکنش commit می‌شود
+        conn.execute(f"PRAGMA archive.user_version = {int(number)}")
+    return record
+
+
+def migrate():
+    # دیتابیس آرشیو نسخه خودش را دارد تا اگر فایلش حذف یا جایگزین شد دوباره ساخته شود
+    version = current_version()
+    archive_version = _archive_version(get_connection(), version)
+    for number, description, statements in MIGRATIONS:
+        if number > version:
+            _apply(statements, "main", _record_main(number, description))
+            version = number
+    for number, description, statements in MIGRATIONS:
+        if number > archive_version:
+            _apply(statements, "archive", _record_archive(number))
+            archive_version = number
+    return version
+
+
+def _plan_problems(detail):
+    # SCAN بدون ایندکس یعنی full scan؛ TEMP B-TREE یعنی مرتب‌سازی کل نتیجه.
+    # SCAN روی VIRTUAL TABLE جستجو در ایندکس FTS5 است
+    if detail.startswith("SCAN") and " USING " not in detail and " VIRTUAL TABLE " not in detail:
+        return True
+    return "USE TEMP B-TREE" in detail
+
+
+def check_query_plans(queries):
+    conn = get_connection()
+    problems = []
+    for name, sql, params in queries:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[-1]
+            if _plan_problems(detail):
+                problems.append(f"{name}: {detail}")
+    if problems:
+        raise QueryPlanError("hot query without index:\n" + "\n".join(problems))
+
+
+if __name__ == "__main__":
+    from db import HOT_QUERIES
+
+    print(f"schema version: {migrate()}")
+    check_query_plans(HOT_QUERIES)
+    print(f"query plans OK ({len(HOT_QUERIES)} hot queries)")
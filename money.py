@@ -0,0 +1,42 @@
+# money.py
+# مبلغ‌ها عدد صحیح‌اند: پوند به پنی و تومان به تومان. کارمزد و تبدیل با نرخ بدون float انجام می‌شود
+# و قالب‌بندی فقط موقع ساختن پیام
+PENCE_PER_POUND = 100
+
+# کارمزد ثابت حواله‌های کمتر از FEE_WAIVED_FROM (هر دو به پنی)
+TRANSFER_FEE = 1000
+FEE_WAIVED_FROM = 50000
+
+
+def parse_gbp(text):
+    # "1,250.5" -> 125050؛ حداکثر دو رقم اعشار، در غیر این صورت ValueError
+    pounds, dot, pence = text.replace(",", "").strip().partition(".")
+    if not pounds.isdigit() or (dot and not (pence.isdigit() and len(pence) <= 2)):
+        raise ValueError(f"invalid GBP amount: {text!r}")
+    return int(pounds) * PENCE_PER_POUND + (int(pence.ljust(2, "0")) if dot else 0)
+
+
+def pounds_to_pence(pounds):
+    # فقط برای مقدارهای float قدیمی
+    return round(pounds * PENCE_PER_POUND)
+
+
+def transfer_fee(amount):
+    return TRANSFER_FEE if amount < FEE_WAIVED_FROM else 0
+
+
+def to_toman(pence, rate):
+    # rate تومان به ازای هر پوند است؛ کسر تومان مثل قبل دور ریخته می‌شود
+    return pence * rate // PENCE_PER_POUND
+
+
+def format_gbp(pence):
+    # 51000 -> "510"، 51050 -> "510.50"، 125000000 -> "1,250,000"
+    pounds, rest = divmod(pence, PENCE_PER_POUND)
+    if rest:
+        return f"{pounds:,}.{rest:02d}"
+    return f"{pounds:,}"
+
+
+def format_toman(toman):
+    return f"{toman:,}"
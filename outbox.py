@@ -0,0 +1,180 @@
+# outbox.py
+# پیام‌های خروجی در همان تراکنشی نوشته می‌شوند که وضعیت را عوض می‌کند؛ sender در پس‌زمینه
+# ردیف‌های آماده را دسته‌ای برمی‌دارد و با broadcaster می‌فرستد. ارسال حداقل یک بار است:
+# اگر پروسه بین ارسال و ثبت نتیجه بمیرد، همان پیام بعد از restart دوباره فرستاده می‌شود
+import asyncio
+import threading
+import time
+from broadcaster import is_permanent
+from db import claim_outbox, count_dead_outbox, finish_outbox
+
+MAX_ATTEMPTS = 5
+# retryهای کوتاه را خود broadcaster انجام می‌دهد؛ این تأخیر برای تلاش بعدی از روی جدول است
+RETRY_BASE = 30
+RETRY_MAX = 3600
+
+
+def step(method, *args, **kwargs):
+    # reply_markup به JSON تبدیل می‌شود تا در جدول ذخیره شود؛ telebot رشته را همان‌طور می‌فرستد
+    markup = kwargs.get("reply_markup")
+    if markup is not None and not isinstance(markup, str):
+        kwargs["reply_markup"] = markup.to_json()
+    return [method, list(args), kwargs]
+
+
+def message(key, chat_id, *steps):
+    # stepهای یک پیام به ترتیب و پشت سر هم برای همان چت ارسال می‌شوند
+    return (f"{key}:{chat_id}", chat_id, list(steps))
+
+
+def send(key, chat_id, text, **kwargs):
+    return message(key, chat_id, step("send_message", chat_id, text, **kwargs))
+
+
+def broadcast(key, chat_ids, text, **kwargs):
+    return [send(key, chat_id, text, **kwargs) for chat_id in chat_ids]
+
+
+class _OutboxBatches:
+    def __init__(self, broadcaster, batch_size, interval, max_attempts):
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.stats = {"sent": 0, "retried": 0, "dead": 0}
+        # تعداد ردیف‌های DEAD جدول برای gauge؛ فقط در _cycle و وقتی عوض شده باشد دوباره شمرده می‌شود
+        self.dead_rows = 0
+        self._recount_dead = True
+        # id -> chat_id ردیف‌هایی که به broadcaster داده شده‌اند و نتیجه‌شان هنوز ثبت نشده؛ فقط زیر _lock
+        self._inflight = {}
+        self._sent = []
+        self._retries = []
+        self._dead = []
+        self._lock = threading.Lock()
+
+    def pending(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def dead_changed(self):
+        # بعد از requeue_dead_outbox؛ شمارش در cycle بعدی و در thread دیتابیس انجام می‌شود
+        self._recount_dead = True
+        self.wake()
+
+    def _on_done(self, row_id, position, attempts):
+        def on_done(job, error):
+            done = position + job.position
+            with self._lock:
+                if error is None:
+                    self._sent.append(row_id)
+                elif is_permanent(error) or attempts + 1 >= self.max_attempts:
+                    self._dead.append((row_id, done, attempts + 1, repr(error)[:500]))
+                else:
+                    delay = min(RETRY_MAX, RETRY_BASE * 2 ** attempts)
+                    self._retries.append((row_id, done, attempts + 1, time.time() + delay, repr(error)[:500]))
+            self.wake()
+        return on_done
+
+    def _cycle(self):
+        # ثبت نتیجه‌های دسته قبل و برداشتن دسته بعد؛ در thread دیتابیس اجرا می‌شود
+        with self._lock:
+            sent, retries, dead = self._sent, self._retries, self._dead
+            self._sent, self._retries, self._dead = [], [], []
+        if sent or retries or dead:
+            finish_outbox(sent, retries, dead)
+            with self._lock:
+                for row_id in [*sent, *(r[0] for r in retries), *(r[0] for r in dead)]:
+                    self._inflight.pop(row_id, None)
+                self.stats["sent"] += len(sent)
+                self.stats["retried"] += len(retries)
+                self.stats["dead"] += len(dead)
+        if dead or self._recount_dead:
+            self._recount_dead = False
+            self.dead_rows = count_dead_outbox()
+
+        with self._lock:
+            busy = set(self._inflight.values())
+            inflight = len(self._inflight)
+        jobs = []
+        for row_id, chat_id, steps, position, attempts in claim_outbox(self.batch_size + inflight):
+            # برای هر چت فقط یک ردیف در حال ارسال تا ترتیب پیام‌های یک کاربر حفظ شود
+            with self._lock:
+                if row_id in self._inflight or chat_id in busy:
+                    busy.add(chat_id)
+                    continue
+                busy.add(chat_id)
+                self._inflight[row_id] = chat_id
+            jobs.append((chat_id, steps[position:], self._on_done(row_id, position, attempts)))
+            if len(jobs) >= self.batch_size:
+                break
+        return jobs
+
+
+class OutboxSender(_OutboxBatches):
+    def __init__(self, broadcaster, batch_size=50, interval=1.0, max_attempts=MAX_ATTEMPTS):
+        super().__init__(broadcaster, batch_size, interval, max_attempts)
+        self._event = threading.Event()
+        self._running = False
+        self._thread = threading.Thread(target=self._loop, name="outbox", daemon=True)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._running = False
+        self._event.set()
+        self._thread.join(timeout)
+
+    def wake(self):
+        # handlerها بعد از commit صدا می‌زنند تا پیام بدون انتظار برای interval برداشته شود
+        self._event.set()
+
+    def _loop(self):
+        while self._running:
+            self._event.wait(self.interval)
+            self._event.clear()
+            try:
+                jobs = self._cycle()
+            except Exception as e:
+                print(f"outbox cycle failed: {e!r}")
+                continue
+            for chat_id, steps, on_done in jobs:
+                self.broadcaster.submit(chat_id, steps, on_done)
+
+
+class AsyncOutboxSender(_OutboxBatches):
+    def __init__(self, broadcaster, run_db, batch_size=50, interval=1.0, max_attempts=MAX_ATTEMPTS):
+        super().__init__(broadcaster, batch_size, interval, max_attempts)
+        self.run_db = run_db
+        self._event = None
+        self._task = None
+
+    def start(self):
+        self._event = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def wake(self):
+        # فقط از داخل event loop (handlerها و on_done broadcaster)
+        if self._event is not None:
+            self._event.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._event.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+            try:
+                jobs = await self.run_db(self._cycle)
+            except Exception as e:
+                print(f"outbox cycle failed: {e!r}")
+                continue
+            for chat_id, steps, on_done in jobs:
+                self.broadcaster.submit(chat_id, steps, on_done)
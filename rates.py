@@ -0,0 +1,127 @@
+# rates.py
+import json
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, namedtuple
+from money import to_toman
+
+RATE_FIELDS = ("cash_buy", "cash_sell", "transfer_buy", "transfer_sell")
+
+# همان نرخ‌هایی که قبلاً در bot.py ثابت بودند؛ تا اولین بارگذاری از منبع استفاده می‌شوند
+DEFAULT_RATES = {
+    "cash_buy": 130000,
+    "cash_sell": 135000,
+    "transfer_buy": 132000,
+    "transfer_sell": 137000,
+}
+
+RateSnapshot = namedtuple("RateSnapshot", ("version",) + RATE_FIELDS + ("source", "loaded_at"))
+Quote = namedtuple("Quote", ["rate", "rate_version", "amount_toman", "expires_at"])
+
+
+class RateEngine:
+    def __init__(self, history=20):
+        self.history = history
+        self._snapshot = None
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current(self):
+        # خواندن بدون قفل: snapshot تغییرناپذیر است و فقط ارجاع به آن عوض می‌شود
+        return self._snapshot
+
+    def get(self, version):
+        return self._versions.get(version)
+
+    def publish(self, source, **rates):
+        unknown = set(rates) - set(RATE_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown rate fields: {', '.join(sorted(unknown))}")
+
+        with self._lock:
+            previous = self._snapshot
+            values = dict(DEFAULT_RATES if previous is None else previous._asdict())
+            values.update({k: int(v) for k, v in rates.items()})
+            for field in RATE_FIELDS:
+                if values[field] <= 0:
+                    raise ValueError(f"{field} must be positive")
+
+            # نسخه بر اساس زمان است تا بعد از restart هم با نسخه‌های ثبت‌شده در تراکنش‌ها تداخل نکند
+            now = time.time()
+            version = int(now * 1000)
+            if previous is not None and version <= previous.version:
+                version = previous.version + 1
+
+            snapshot = RateSnapshot(
+                version=version,
+                source=source,
+                loaded_at=now,
+                **{field: values[field] for field in RATE_FIELDS},
+            )
+            self._versions[version] = snapshot
+            while len(self._versions) > self.history:
+                self._versions.popitem(last=False)
+            self._snapshot = snapshot
+            return snapshot
+
+    def load(self, source_name, fetch):
+        data = fetch()
+        return self.publish(source_name, **{k: v for k, v in data.items() if k in RATE_FIELDS})
+
+    def quote(self, final_pence, ttl):
+        snapshot = self._snapshot
+        rate = snapshot.transfer_buy
+        return Quote(
+            rate=rate,
+            rate_version=snapshot.version,
+            amount_toman=to_toman(final_pence, rate),
+            expires_at=time.time() + ttl,
+        )
+
+
+def file_source(path):
+    def fetch():
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return fetch
+
+
+def http_source(url, timeout=5):
+    def fetch():
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    return fetch
+
+
+def start_refresher(engine, source_name, fetch, interval):
+    def loop():
+        while True:
+            try:
+                engine.load(source_name, fetch)
+            except Exception as e:
+                # نرخ قبلی معتبر می‌ماند؛ فقط خطا را گزارش می‌کنیم
+                print(f"rate refresh from {source_name} failed: {e!r}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="rate-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_sources(engine, file_path=None, url=None, interval=60):
+    if file_path:
+        try:
+            engine.load(f"file:{file_path}", file_source(file_path))
+        except FileNotFoundError:
+            print(f"rates file {file_path} not found, using {engine.current().source} rates")
+    if url:
+        start_refresher(engine, f"http:{url}", http_source(url), interval)
+
+
+def quote_expired(quote):
+    return quote.expires_at < time.time()
+
+
+engine = RateEngine()
+engine.publish("default")
@@ -0,0 +1,135 @@
+# receipts.py
+# عکس‌های یک آلبوم جداجدا می‌رسند؛ اینجا بر اساس media_group_id جمع می‌شوند تا یک‌جا پردازش شوند
+import asyncio
+import functools
+import heapq
+import threading
+import time
+
+GROUP_WINDOW = 1.5
+
+
+def receipt_photos(messages):
+    # بزرگ‌ترین سایز هر عکس؛ به شکلی که db.add_receipts می‌خواهد
+    return [
+        (m.photo[-1].file_id, m.photo[-1].file_unique_id, m.message_id, m.media_group_id)
+        for m in messages
+    ]
+
+
+class ReceiptCollector:
+    def __init__(self, flush, window=GROUP_WINDOW, submit=None):
+        self.flush = flush
+        self.window = window
+        # submit(chat_id, task): آلبوم آماده روی partition همان چت در dispatcher پردازش می‌شود، نه روی
+        # thread این collector؛ پس با بقیه updateهای آن کاربر هم‌زمان اجرا نمی‌شود
+        self.submit = submit
+        self._groups = {}
+        self._deadlines = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = threading.Thread(target=self._work, name="receipt-collector", daemon=True)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def add(self, message):
+        key = message.media_group_id
+        if key is None:
+            # عکس تکی منتظر چیزی نمی‌ماند
+            self._flush([message])
+            return
+        with self._cond:
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = [message]
+                heapq.heappush(self._deadlines, (time.monotonic() + self.window, key))
+                self._cond.notify()
+            else:
+                group.append(message)
+
+    def _flush(self, messages):
+        try:
+            self.flush(messages)
+        except Exception as e:
+            print(f"receipt flush failed: {e!r}")
+
+    def _next_group(self):
+        with self._cond:
+            while True:
+                if self._deadlines:
+                    ready_at, key = self._deadlines[0]
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0 or not self._running:
+                        # موقع stop آلبوم‌های نیمه‌کاره هم پردازش می‌شوند
+                        heapq.heappop(self._deadlines)
+                        return self._groups.pop(key)
+                    self._cond.wait(delay)
+                elif self._running:
+                    self._cond.wait()
+                else:
+                    return None
+
+    def _work(self):
+        while True:
+            group = self._next_group()
+            if group is None:
+                return
+            if self.submit is None:
+                self._flush(group)
+            else:
+                self.submit(group[0].chat.id, functools.partial(self._flush, group))
+
+
+class AsyncReceiptCollector:
+    def __init__(self, flush, window=GROUP_WINDOW, submit=None):
+        self.flush = flush
+        self.window = window
+        self.submit = submit
+        self._groups = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def add(self, message):
+        key = message.media_group_id
+        if key is None:
+            await self._flush([message])
+            return
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = [message]
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._fire, key)
+        else:
+            group.append(message)
+
+    def _fire(self, key):
+        self._timers.pop(key, None)
+        task = asyncio.get_running_loop().create_task(self._dispatch(self._groups.pop(key)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, messages):
+        if self.submit is None:
+            await self._flush(messages)
+        else:
+            await self.submit(messages[0].chat.id, functools.partial(self._flush, messages))
+
+    async def _flush(self, messages):
+        try:
+            await self.flush(messages)
+        except Exception as e:
+            print(f"receipt flush failed: {e!r}")
+
+    async def stop(self):
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            self._fire(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,76 @@
+# router.py
+# جایگزین زنجیره lambdaها: متن دکمه‌ها با dict و callback_data با trie پیشوندی پیدا می‌شوند
+
+
+class Router:
+    def __init__(self):
+        self._texts = {}
+        self._trie = {}
+
+    def text(self, *texts):
+        def decorator(handler):
+            for text in texts:
+                self._texts[text] = handler
+            return handler
+        return decorator
+
+    def callback(self, prefix, *arg_types):
+        # callback("admin_chooseacc_", int, int) یعنی "admin_chooseacc_12_3" -> handler(call, 12, 3)
+        def decorator(handler):
+            node = self._trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[None] = (handler, arg_types)
+            return handler
+        return decorator
+
+    def wrap_handlers(self, wrap):
+        # wrap(handler) -> handler؛ برای اندازه‌گیری یا middleware روی همه handlerهای ثبت‌شده
+        self._texts = {text: wrap(handler) for text, handler in self._texts.items()}
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key is None:
+                    handler, arg_types = child
+                    node[None] = (wrap(handler), arg_types)
+                else:
+                    stack.append(child)
+
+    def resolve_text(self, text):
+        return self._texts.get(text)
+
+    def resolve_callback(self, data):
+        if not data:
+            return None
+
+        # همه پیشوندهای منطبق را از بلندترین به کوتاه‌ترین امتحان می‌کنیم
+        matches = []
+        node = self._trie
+        for i, ch in enumerate(data):
+            if None in node:
+                matches.append((i, node[None]))
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            if None in node:
+                matches.append((len(data), node[None]))
+
+        for end, (handler, arg_types) in reversed(matches):
+            args = parse_args(data[end:], arg_types)
+            if args is not None:
+                return handler, args
+        return None
+
+
+def parse_args(rest, arg_types):
+    if not arg_types:
+        return () if rest == "" else None
+    parts = rest.split("_", len(arg_types) - 1)
+    if len(parts) != len(arg_types):
+        return None
+    try:
+        return tuple(t(p) for t, p in zip(arg_types, parts))
+    except ValueError:
+        return None
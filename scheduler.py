@@ -0,0 +1,159 @@
+# scheduler.py
+# همه مهلت‌ها (انتظار برای حساب، اعتبار حساب اعلام‌شده، اعتبار نرخ تأییدنشده) در یک heap و یک thread؛
+# schedule و cancel با O(log n) و مهلت‌هایی که با هم سر می‌رسند یک‌جا به handle داده می‌شوند.
+# زمان‌ها epoch هستند چون از expires_at دیتابیس هم ساخته می‌شوند
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# اگر handle خطا بدهد کلیدها بعد از این چند ثانیه دوباره امتحان می‌شوند
+RETRY_DELAY = 30
+MAX_BATCH = 500
+
+
+class _Deadlines:
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self._heap = []
+        # key -> when؛ ردیف heap که با این نخواند لغو یا جابه‌جا شده و موقع pop دور ریخته می‌شود
+        self._deadlines = {}
+        self._seq = itertools.count()
+
+    def _push(self, key, when):
+        self._deadlines[key] = when
+        heapq.heappush(self._heap, (when, next(self._seq), key))
+        # ردیف‌های لغوشده زیاد شدند؛ ساختن دوباره heap از dict
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(w, next(self._seq), k) for k, w in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.max_batch:
+            when, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == when:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    def _next_at(self):
+        while self._heap:
+            when, _, key = self._heap[0]
+            if self._deadlines.get(key) == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+
+class Scheduler(_Deadlines):
+    def __init__(self, handle, max_batch=MAX_BATCH):
+        # handle(keys) در thread خود scheduler اجرا می‌شود
+        super().__init__(max_batch)
+        self.handle = handle
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = threading.Thread(target=self._work, name="scheduler", daemon=True)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def pending(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, when):
+        # کلید تکراری مهلت قبلی را جایگزین می‌کند
+        with self._cond:
+            self._push(key, when)
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running:
+                now = time.time()
+                due = self._pop_due(now)
+                if due:
+                    return due
+                next_at = self._next_at()
+                self._cond.wait(None if next_at is None else next_at - now)
+            return None
+
+    def _work(self):
+        while True:
+            due = self._next_batch()
+            if due is None:
+                return
+            try:
+                self.handle(due)
+            except Exception as e:
+                print(f"scheduler handle failed: {e!r}")
+                retry_at = time.time() + RETRY_DELAY
+                with self._cond:
+                    for key in due:
+                        # اگر در این فاصله دوباره schedule شده، مهلت جدید می‌ماند
+                        if key not in self._deadlines:
+                            self._push(key, retry_at)
+
+
+class AsyncScheduler(_Deadlines):
+    def __init__(self, handle, max_batch=MAX_BATCH):
+        # handle(keys) coroutine است و داخل event loop اجرا می‌شود
+        super().__init__(max_batch)
+        self.handle = handle
+        self._event = None
+        self._task = None
+
+    def start(self):
+        self._event = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def pending(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, when):
+        # فقط از داخل event loop
+        self._push(key, when)
+        if self._event is not None:
+            self._event.set()
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    async def _loop(self):
+        while True:
+            self._event.clear()
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    await self.handle(due)
+                except Exception as e:
+                    print(f"scheduler handle failed: {e!r}")
+                    retry_at = time.time() + RETRY_DELAY
+                    for key in due:
+                        # اگر در این فاصله دوباره schedule شده، مهلت جدید می‌ماند
+                        if key not in self._deadlines:
+                            self._push(key, retry_at)
+                continue
+            next_at = self._next_at()
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
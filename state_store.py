@@ -0,0 +1,169 @@
+# state_store.py
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+import db
+from money import pounds_to_pence
+from rates import Quote
+
+WAITING_UK_AMOUNT = "WAITING_UK_AMOUNT"
+CONFIRM = "CONFIRM"
+
+
+class ConversationState:
+    __slots__ = ("step", "amount", "fee", "final", "irt", "quote", "updated_at")
+
+    def __init__(self, step, amount=None, fee=None, final=None, irt=None, quote=None, updated_at=None):
+        self.step = step
+        self.amount = amount
+        self.fee = fee
+        self.final = final
+        self.irt = irt
+        self.quote = quote
+        self.updated_at = updated_at
+
+    def to_json(self):
+        return json.dumps({
+            "step": self.step,
+            "amount": self.amount,
+            "fee": self.fee,
+            "final": self.final,
+            "irt": self.irt,
+            "quote": list(self.quote) if self.quote else None,
+        })
+
+    @classmethod
+    def from_json(cls, data, updated_at):
+        values = json.loads(data)
+        # وضعیت‌های ذخیره‌شده قبل از مبلغ صحیح، مبلغ را به پوند (float) دارند
+        if isinstance(values.get("final"), float):
+            for key in ("amount", "fee", "final"):
+                values[key] = pounds_to_pence(values[key])
+        quote = values.pop("quote")
+        return cls(quote=Quote(*quote) if quote else None, updated_at=updated_at, **values)
+
+
+class StateStore:
+    def __init__(self, max_entries=10000, ttl=3600, persist=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        # حذف‌های ناشی از eviction/انقضا در get جمع می‌شوند تا get هیچ‌وقت به DB نرسد
+        self._pending_deletes = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def _expired(self, state, now):
+        return now - state.updated_at > self.ttl
+
+    def get(self, chat_id):
+        now = time.time()
+        with self._lock:
+            state = self._states.get(chat_id)
+            if state is None:
+                self.misses += 1
+                return None
+            if self._expired(state, now):
+                del self._states[chat_id]
+                self.expirations += 1
+                self.misses += 1
+                if self.persist:
+                    self._pending_deletes.append(chat_id)
+                return None
+            self._states.move_to_end(chat_id)
+            self.hits += 1
+            return state
+
+    def step(self, chat_id):
+        state = self.get(chat_id)
+        return state.step if state else None
+
+    def set(self, chat_id, state):
+        state.updated_at = time.time()
+        with self._lock:
+            self._states[chat_id] = state
+            self._states.move_to_end(chat_id)
+            self._trim(state.updated_at)
+            deletes = self._take_pending_deletes()
+        if self.persist:
+            db.save_conversation_state(chat_id, state.to_json(), state.updated_at, deletes)
+
+    def pop(self, chat_id):
+        with self._lock:
+            state = self._states.pop(chat_id, None)
+            deletes = self._take_pending_deletes()
+        if self.persist:
+            db.delete_conversation_states(deletes + [chat_id])
+        return state
+
+    def pop_if(self, chat_id, predicate):
+        # بررسی و حذف زیر یک lock؛ scheduler هم‌زمان با handlerهای همان چت اجرا می‌شود
+        with self._lock:
+            state = self._states.get(chat_id)
+            if state is None or not predicate(state):
+                return None
+            del self._states[chat_id]
+            deletes = self._take_pending_deletes()
+        if self.persist:
+            db.delete_conversation_states(deletes + [chat_id])
+        return state
+
+    def items(self):
+        with self._lock:
+            return list(self._states.items())
+
+    def _take_pending_deletes(self):
+        deletes, self._pending_deletes = self._pending_deletes, []
+        return deletes
+
+    def _trim(self, now):
+        # ترتیب OrderedDict همان ترتیب آخرین استفاده است؛ قدیمی‌ترین‌ها اول‌اند
+        while self._states:
+            chat_id, oldest = next(iter(self._states.items()))
+            if len(self._states) > self.max_entries:
+                self.evictions += 1
+            elif self._expired(oldest, now):
+                self.expirations += 1
+            else:
+                break
+            del self._states[chat_id]
+            if self.persist:
+                self._pending_deletes.append(chat_id)
+
+    def load(self):
+        # بعد از restart وضعیت‌های منقضی‌نشده از SQLite برگردانده می‌شوند
+        if not self.persist:
+            return 0
+        since = time.time() - self.ttl
+        db.purge_conversation_states(since)
+        rows = db.load_conversation_states(since, self.max_entries)
+        with self._lock:
+            for chat_id, data, updated_at in rows:
+                self._states[chat_id] = ConversationState.from_json(data, updated_at)
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._states)
+            approx_bytes = sys.getsizeof(self._states) + sum(
+                sys.getsizeof(state) + sys.getsizeof(state.quote or ())
+                for state in self._states.values()
+            )
+            return {
+                "size": size,
+                "max_entries": self.max_entries,
+                "approx_bytes": approx_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,37 @@
+# tests/conftest.py
+# تنظیمات مشترک تست‌ها؛ config.py و dbconn در import مقدارها را از env می‌خوانند، پس اینجا و قبل از
+# import هر تست تنظیم می‌شوند
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="sarafi-test-"), "test.db")
+os.environ["BOT_TOKEN"] = "1:test"
+os.environ["ADMIN_IDS"] = "1"
+os.environ["METRICS_ENABLED"] = "0"
+os.environ["BROADCAST_GLOBAL_RATE"] = "100000"
+os.environ["BROADCAST_PER_CHAT_RATE"] = "100000"
+
+import db  # noqa: E402
+import dbconn  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # دیتابیس و آرشیو خالی برای یک تست؛ بعد از آن اتصال‌ها به دیتابیس مشترک DB_NAME برمی‌گردند
+    previous = dbconn.DB_NAME, dbconn.ARCHIVE_DB_NAME
+    path = str(tmp_path / "test.db")
+    dbconn.configure(path)
+    yield path
+    dbconn.configure(previous[0], archive_db_name=previous[1])
+
+
+@pytest.fixture
+def fresh_db(db_path):
+    db.init_db()
+    return db
@@ -0,0 +1,88 @@
+# tests/test_flood.py
+# FloodControl: token bucket هر چت، معافیت ادمین‌ها، کنار گذاشتن مشتری‌ها در صف شلوغ و سقف تعداد چت‌ها
+from types import SimpleNamespace
+
+import pytest
+
+import broadcaster
+from flood import FloodControl
+
+ADMIN = 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(broadcaster, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def message(chat_id):
+    return SimpleNamespace(
+        update_id=chat_id, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)),
+        edited_message=None, callback_query=None,
+    )
+
+
+def click(user_id):
+    return SimpleNamespace(
+        update_id=user_id, message=None, edited_message=None,
+        callback_query=SimpleNamespace(from_user=SimpleNamespace(id=user_id)),
+    )
+
+
+def test_chat_is_throttled_after_burst(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=3)
+    assert [flood.admit(message(5), 0) for _ in range(4)] == [True, True, True, False]
+    # چت دیگر bucket خودش را دارد
+    assert flood.admit(message(6), 0)
+    clock.value += 1
+    assert flood.admit(message(5), 0)
+    assert not flood.admit(message(5), 0)
+    assert flood.stats == {"throttled": 2, "shed": 0}
+
+
+def test_messages_and_clicks_share_a_bucket(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=2)
+    assert flood.admit(message(5), 0)
+    assert flood.admit(click(5), 0)
+    assert not flood.admit(click(5), 0)
+
+
+def test_admins_are_never_limited(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=1, shed_depth=5)
+    assert all(flood.admit(message(ADMIN), 10) for _ in range(50))
+    assert all(flood.admit(click(ADMIN), 10) for _ in range(50))
+    assert len(flood) == 0
+    assert flood.stats == {"throttled": 0, "shed": 0}
+
+
+def test_customers_are_shed_when_queue_is_deep(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=10, shed_depth=5)
+    assert flood.admit(message(5), 4)
+    assert not flood.admit(message(5), 5)
+    assert not flood.admit(click(6), 9)
+    # کنار گذاشتن توکن مصرف نمی‌کند
+    assert sum(flood.admit(message(5), 0) for _ in range(10)) == 9
+    assert flood.stats["shed"] == 2
+
+
+def test_no_shedding_without_depth(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=10)
+    assert flood.admit(message(5), 10_000)
+    assert flood.stats["shed"] == 0
+
+
+def test_tracked_chats_are_bounded(clock):
+    flood = FloodControl([ADMIN], rate=1, burst=1, max_chats=3)
+    for chat_id in (10, 11, 12):
+        assert flood.admit(message(chat_id), 0)
+    # 10 دوباره استفاده شد؛ با ورود 13 قدیمی‌ترین (11) کنار می‌رود
+    assert not flood.admit(message(10), 0)
+    assert flood.admit(message(13), 0)
+    assert len(flood) == 3
+    # bucket فراموش‌شده از نو پر است
+    assert flood.admit(message(11), 0)
+    # 10 هنوز نگه داشته شده و bucketش خالی است
+    assert not flood.admit(message(10), 0)
+    assert len(flood) == 3
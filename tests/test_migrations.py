@@ -0,0 +1,122 @@
+# tests/test_migrations.py
+# مسیر ارتقای schema: دیتابیس خالی و دیتابیس قدیمی (نسخه ۱ با ردیف واقعی) هر دو به آخرین نسخه می‌رسند
+import os
+import sqlite3
+
+import pytest
+
+import dbconn
+import migrations
+from dbconn import get_connection
+
+LATEST = migrations.MIGRATIONS[-1][0]
+
+
+def _migrate_to(monkeypatch, version):
+    # فقط migrationهای تا version؛ مثل دیتابیسی که با نسخه قدیمی ربات ساخته شده
+    with monkeypatch.context() as m:
+        m.setattr(migrations, "MIGRATIONS", [entry for entry in migrations.MIGRATIONS if entry[0] <= version])
+        return migrations.migrate()
+
+
+def _archive_version():
+    return get_connection().execute("PRAGMA archive.user_version").fetchone()[0]
+
+
+def test_versions_are_sequential():
+    assert [entry[0] for entry in migrations.MIGRATIONS] == list(range(1, LATEST + 1))
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    assert migrations.migrate() == LATEST
+    assert migrations.current_version() == LATEST
+    assert _archive_version() == LATEST
+    # اجرای دوباره کاری نمی‌کند
+    assert migrations.migrate() == LATEST
+    count = get_connection().execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+    assert count == LATEST
+
+
+def test_upgrade_from_version_1_keeps_rows(db_path, monkeypatch):
+    assert _migrate_to(monkeypatch, 1) == 1
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO transactions
+        (user_id, username, fullname, amount_gbp, final_gbp, amount_irt, status, created_at)
+        VALUES (7, 'ali', 'Ali R', 100, 110, 14500000, 'DONE', '2025-01-02T10:00:00')
+    """)
+    conn.commit()
+
+    assert migrations.migrate() == LATEST
+    row = conn.execute("SELECT user_id, username, status, rate, expires_at FROM transactions").fetchone()
+    assert row == (7, "ali", "DONE", None, None)
+    # migration 7 rollupها را از ردیف‌های موجود می‌سازد
+    assert conn.execute("SELECT count FROM status_counts WHERE status = 'DONE'").fetchone() == (1,)
+    assert conn.execute("SELECT day, created_count FROM daily_volume").fetchall() == [("2025-01-02", 1)]
+    assert _archive_version() == LATEST
+
+
+def test_money_migration_converts_main_and_archive(db_path, monkeypatch):
+    assert _migrate_to(monkeypatch, 11) == 11
+    conn = get_connection()
+    legacy = [(19.99, 20.29, 2898550.4), (100, 110, 14500000), (0.29, 10.29, 42049.6)]
+    for i, (amount, final, toman) in enumerate(legacy, 1):
+        for table in ("transactions", "archive.transactions"):
+            conn.execute(f"""
+                INSERT INTO {table}
+                (id, user_id, username, fullname, amount_gbp, final_gbp, amount_irt, status, created_at)
+                VALUES (?, 7, 'ali', 'Ali', ?, ?, ?, 'DONE', '2025-01-02T10:00:00')
+            """, (i, amount, final, toman))
+    conn.commit()
+
+    # دسته‌های کوچک: مرز دسته‌ها هم پوشش داده می‌شود
+    migrations._convert_money("main.transactions", batch_size=2)
+    assert migrations.migrate() == LATEST
+    expected = [(1, 1999, 2029, 2898550), (2, 10000, 11000, 14500000), (3, 29, 1029, 42050)]
+    for table in ("transactions", "archive.transactions"):
+        rows = conn.execute(f"SELECT id, amount_pence, final_pence, amount_toman FROM {table} ORDER BY id").fetchall()
+        assert rows == expected
+
+
+def _archive_columns():
+    return {row[1] for row in get_connection().execute("PRAGMA archive.table_info(transactions)")}
+
+
+def test_missing_archive_is_recreated(db_path):
+    migrations.migrate()
+    dbconn.close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(dbconn.ARCHIVE_DB_NAME + suffix):
+            os.remove(dbconn.ARCHIVE_DB_NAME + suffix)
+
+    # ATTACH فایل خالی می‌سازد؛ همه statementهای آرشیو دوباره اجرا می‌شوند ولی main دست نمی‌خورد
+    assert _archive_version() == 0
+    assert migrations.migrate() == LATEST
+    assert _archive_version() == LATEST
+    assert {"amount_pence", "final_pence", "amount_toman", "expires_at"} <= _archive_columns()
+    tables = {row[0] for row in get_connection().execute("SELECT name FROM archive.sqlite_master")}
+    assert {"transactions", "receipts", "transactions_fts"} <= tables
+    count = get_connection().execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+    assert count == LATEST
+
+
+def test_legacy_archive_is_stamped_with_main_version(db_path):
+    migrations.migrate()
+    conn = get_connection()
+    conn.execute("PRAGMA archive.user_version = 0")
+    dbconn.close_all()
+
+    # آرشیو قبل از نسخه‌دار شدن همراه main ساخته شده بود؛ اجرای دوباره ALTERها خطای ستون تکراری می‌داد
+    assert migrations.migrate() == LATEST
+    assert _archive_version() == LATEST
+
+
+def test_failed_migration_is_not_recorded(db_path, monkeypatch):
+    broken = (LATEST + 1, "broken", ["CREATE TABLE broken_ok (id INTEGER)", "CREATE TABLE"])
+    migrations.migrate()
+    monkeypatch.setattr(migrations, "MIGRATIONS", [*migrations.MIGRATIONS, broken])
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.migrate()
+    # همه statementهای یک migration در یک تراکنش؛ نه جدول ماند و نه نسخه
+    assert migrations.current_version() == LATEST
+    assert get_connection().execute("SELECT 1 FROM sqlite_master WHERE name = 'broken_ok'").fetchone() is None
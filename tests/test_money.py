@@ -0,0 +1,60 @@
+# tests/test_money.py
+# money.py: پارس و قالب‌بندی مبلغ‌ها، کارمزد و تبدیل به تومان؛ همه با عدد صحیح
+import pytest
+
+from money import (
+    FEE_WAIVED_FROM,
+    TRANSFER_FEE,
+    format_gbp,
+    format_toman,
+    parse_gbp,
+    pounds_to_pence,
+    to_toman,
+    transfer_fee,
+)
+
+
+@pytest.mark.parametrize("text, pence", [
+    ("510", 51000),
+    ("510.5", 51050),
+    ("510.05", 51005),
+    ("0.1", 10),
+    ("1,250.50", 125050),
+    (" 19.99 ", 1999),
+])
+def test_parse_gbp(text, pence):
+    assert parse_gbp(text) == pence
+
+
+@pytest.mark.parametrize("text", ["", "abc", "-5", "1.999", "1.2.3", ".5", "1e3", "12.x", "510."])
+def test_parse_gbp_rejects_invalid_amounts(text):
+    with pytest.raises(ValueError):
+        parse_gbp(text)
+
+
+def test_fee_is_waived_from_threshold():
+    assert transfer_fee(FEE_WAIVED_FROM - 1) == TRANSFER_FEE
+    assert transfer_fee(FEE_WAIVED_FROM) == 0
+    assert transfer_fee(0) == TRANSFER_FEE
+
+
+def test_to_toman_drops_the_fraction():
+    assert to_toman(51000, 145000) == 73_950_000
+    # 0.01 پوند با نرخ 145,050 یعنی 1450.5 تومان
+    assert to_toman(1, 145050) == 1450
+    assert to_toman(1999, 1) == 19
+
+
+def test_format_amounts():
+    assert format_gbp(51000) == "510"
+    assert format_gbp(51050) == "510.50"
+    assert format_gbp(5) == "0.05"
+    assert format_gbp(125000000) == "1,250,000"
+    assert format_toman(73950000) == "73,950,000"
+
+
+def test_legacy_pounds_are_rounded_not_truncated():
+    # 19.99 * 100 در float برابر 1998.9999999999998 است
+    assert pounds_to_pence(19.99) == 1999
+    assert pounds_to_pence(0.29) == 29
+    assert parse_gbp(format_gbp(pounds_to_pence(1234.56))) == 123456
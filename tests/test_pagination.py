@@ -0,0 +1,87 @@
+# tests/test_pagination.py
+# get_transactions_page: keyset روی (status, id)؛ صفحه‌ها جدیدترین اول، بدون تکرار یا جاافتادگی
+import datetime
+
+import pytest
+
+import dbconn
+
+
+@pytest.fixture
+def waiting(fresh_db):
+    # 25 تراکنش منتظر حساب با مبلغ‌های 1.00 تا 25.00 پوند و یکی با وضعیت دیگر
+    db = fresh_db
+    ids = [db.create_transaction(100 + i, f"user{i}", "User", (i + 1) * 100, (i + 1) * 100, 1000) for i in range(25)]
+    other = db.create_transaction(200, "other", "Other", 500, 500, 1000)
+    db.transition_transaction(other, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT")
+    return db, ids
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_older_pages_cover_everything_once(waiting):
+    db, ids = waiting
+    seen = []
+    rows, has_more = db.get_transactions_page(limit=10)
+    pages = 1
+    seen += _ids(rows)
+    while has_more:
+        rows, has_more = db.get_transactions_page(before_id=rows[-1][0], limit=10)
+        pages += 1
+        seen += _ids(rows)
+    assert pages == 3
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_newer_page_returns_newest_first(waiting):
+    db, ids = waiting
+    first, _ = db.get_transactions_page(limit=10)
+    second, _ = db.get_transactions_page(before_id=first[-1][0], limit=10)
+    # برگشت از صفحه دوم همان صفحه اول را می‌دهد و بعد از آن چیز جدیدتری نیست
+    back, has_more = db.get_transactions_page(after_id=second[0][0], limit=10)
+    assert back == first
+    assert has_more is False
+    back, has_more = db.get_transactions_page(after_id=second[0][0], limit=4)
+    assert _ids(back) == _ids(first)[-4:]
+    assert has_more is True
+
+
+def test_last_page_has_no_more(waiting):
+    db, ids = waiting
+    rows, has_more = db.get_transactions_page(before_id=ids[5], limit=5)
+    assert _ids(rows) == ids[:5][::-1]
+    assert has_more is False
+    assert db.get_transactions_page(before_id=ids[0]) == ([], False)
+
+
+def test_filters_apply_to_every_page(waiting):
+    db, ids = waiting
+    rows, has_more = db.get_transactions_page(min_pence=500, max_pence=1200, limit=5)
+    assert _ids(rows) == ids[7:12][::-1]
+    assert has_more is True
+    rows, has_more = db.get_transactions_page(min_pence=500, max_pence=1200, before_id=rows[-1][0], limit=5)
+    assert _ids(rows) == ids[4:7][::-1]
+    assert has_more is False
+    # وضعیت دیگر در صفحه‌های منتظر حساب نمی‌آید
+    rows, _ = db.get_transactions_page(status="WAITING_FOR_RECEIPT")
+    assert [row[1] for row in rows] == ["other"]
+
+
+def test_since_and_receipt_filters(waiting):
+    db, ids = waiting
+    old = (datetime.datetime.utcnow() - datetime.timedelta(days=2)).isoformat()
+    with dbconn.unit_of_work() as conn:
+        conn.execute(f"UPDATE transactions SET created_at = ? WHERE id IN ({', '.join('?' for _ in ids[:20])})",
+                     (old, *ids[:20]))
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    rows, has_more = db.get_transactions_page(since=since, limit=10)
+    assert _ids(rows) == ids[20:][::-1]
+    assert has_more is False
+
+    for tx_id in ids[:3]:
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT")
+    db.add_receipts(ids[1], 101, [("file", "unique", 1, None)])
+    rows, _ = db.get_transactions_page(status="WAITING_FOR_RECEIPT", with_receipt=True)
+    assert _ids(rows) == [ids[1]]
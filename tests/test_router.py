@@ -0,0 +1,90 @@
+# tests/test_router.py
+# متن دکمه‌ها از dict و callback_data از trie: بلندترین پیشوندی که آرگومان‌هایش هم می‌خواند برنده است
+from router import Router
+
+
+def _router():
+    router = Router()
+    calls = []
+
+    def handler(name):
+        def handle(*args):
+            calls.append((name, args))
+        handle.__name__ = name
+        return handle
+
+    router.text("📊 rates", "rates")(handler("rates"))
+    router.callback("admin_tx_", int)(handler("tx"))
+    router.callback("admin_txs")(handler("txs"))
+    router.callback("admin_chooseacc_", int, int)(handler("choose"))
+    router.callback("admin_pg_", str, int)(handler("page"))
+    router.callback("bulk_all")(handler("select"))
+    router.callback("bulk_a_", str)(handler("bulk_open"))
+    return router, calls
+
+
+def _resolve(router, data):
+    route = router.resolve_callback(data)
+    if route is None:
+        return None
+    handler, args = route
+    return handler.__name__, args
+
+
+def test_text_buttons_are_exact_matches():
+    router, _ = _router()
+    assert router.resolve_text("📊 rates").__name__ == "rates"
+    assert router.resolve_text("rates").__name__ == "rates"
+    assert router.resolve_text("📊 rates ") is None
+    assert router.resolve_text(None) is None
+
+
+def test_callback_arguments_are_parsed():
+    router, _ = _router()
+    assert _resolve(router, "admin_tx_12") == ("tx", (12,))
+    assert _resolve(router, "admin_chooseacc_12_3") == ("choose", (12, 3))
+    assert _resolve(router, "admin_pg_n_40") == ("page", ("n", 40))
+    assert _resolve(router, "bulk_a_approve") == ("bulk_open", ("approve",))
+    assert _resolve(router, "bulk_all") == ("select", ())
+
+
+def test_callback_rejects_wrong_arguments():
+    router, _ = _router()
+    assert _resolve(router, "admin_tx_") is None
+    assert _resolve(router, "admin_tx_abc") is None
+    assert _resolve(router, "admin_chooseacc_12") is None
+    assert _resolve(router, "bulk_all_extra") is None
+    assert _resolve(router, "unknown") is None
+    assert _resolve(router, "") is None
+    assert _resolve(router, None) is None
+
+
+def test_overlapping_prefixes_fall_back_to_shorter_match():
+    router, _ = _router()
+    assert _resolve(router, "admin_txs") == ("txs", ())
+    assert _resolve(router, "admin_tx_5") == ("tx", (5,))
+
+    # "admin_tx_abc" با int نمی‌خواند؛ پیشوند کوتاه‌تر "admin_" با str امتحان می‌شود
+    router.callback("admin_", str)(lambda call, rest: None)
+    handler, args = router.resolve_callback("admin_tx_abc")
+    assert args == ("tx_abc",)
+    assert _resolve(router, "admin_tx_5") == ("tx", (5,))
+
+
+def test_wrap_handlers_wraps_every_route():
+    router, calls = _router()
+    wrapped = []
+
+    def wrap(fn):
+        def wrapper(*args):
+            wrapped.append(fn.__name__)
+            return fn(*args)
+        wrapper.__name__ = fn.__name__
+        return wrapper
+
+    router.wrap_handlers(wrap)
+    router.resolve_text("rates")("message")
+    handler, args = router.resolve_callback("admin_chooseacc_1_2")
+    handler("call", *args)
+    assert wrapped == ["rates", "choose"]
+    assert calls == [("rates", ("message",)), ("choose", ("call", 1, 2))]
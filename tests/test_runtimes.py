@@ -0,0 +1,125 @@
+# tests/test_runtimes.py
+# هر دو runtime (bot.py و bot_async.py) یک جریان کامل حواله را روی Bot API جعلی اجرا می‌کنند و
+# پیام‌هایی که مشتری می‌گیرد و ردیف نهایی تراکنش باید یکی باشند
+# env (DB_NAME، BOT_TOKEN، ...) در conftest.py تنظیم می‌شود
+import asyncio
+import os
+import re
+import threading
+import time
+
+from telebot import apihelper, asyncio_helper, types
+from bench.fake_api import FakeBotApi
+from bench.load import Updates, customer_steps
+import db
+
+ADMIN_ID = 1
+SYNC_CUSTOMER = 500
+# bench مبلغ را از customer_id % 900 می‌سازد؛ هر دو مشتری یک مبلغ وارد می‌کنند
+ASYNC_CUSTOMER = SYNC_CUSTOMER + 900
+
+
+def _setup():
+    db.init_db()
+    account_id = db.add_uk_account("TEST", "00-00-00", "00000000", "Test Ltd")
+    api = FakeBotApi(record=True).start()
+    apihelper.API_URL = api.api_url()
+    asyncio_helper.API_URL = api.api_url()
+    return api, account_id
+
+
+def _flow(customer_id, account_id):
+    # مثل bench، با دو «تأیید» هم‌زمان که باید فقط یک تراکنش بسازند
+    updates = Updates()
+    for step, raw in customer_steps(updates, os.environ["DB_NAME"], customer_id, ADMIN_ID, account_id):
+        if step == "confirm_uk":
+            yield [types.Update.de_json(raw), types.Update.de_json(updates.callback(customer_id, "confirm_uk"))]
+        else:
+            yield [types.Update.de_json(raw)]
+
+
+def _outbox_drained():
+    return not db.outbox_counts().get("PENDING", 0)
+
+
+def _customer_messages(api, customer_id, tx_id):
+    # شناسه‌ها بین دو اجرا فرق دارند؛ فقط متن پیام‌ها مقایسه می‌شود
+    messages = []
+    for method, params in api.calls:
+        if str(params.get("chat_id")) != str(customer_id) or method not in ("sendMessage", "editMessageText"):
+            continue
+        text = re.sub(rf"#{tx_id}\b", "#TX", params.get("text") or "")
+        messages.append((method, text))
+    return sorted(messages)
+
+
+def _transactions(customer_id):
+    return db.get_connection().execute(
+        "SELECT id, final_pence, amount_toman, status, recipient_name IS NOT NULL FROM transactions WHERE user_id = ?",
+        (customer_id,),
+    ).fetchall()
+
+
+def _run_sync(account_id):
+    import bot
+
+    bot.bot.threaded = False
+    bot.broadcaster.start()
+    bot.outbox_sender.start()
+    bot.receipt_collector.start()
+    try:
+        for batch in _flow(SYNC_CUSTOMER, account_id):
+            threads = [threading.Thread(target=bot.bot.process_new_updates, args=([u],)) for u in batch]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        deadline = time.time() + 10
+        while not _outbox_drained() or bot.outbox_sender.pending() or bot.broadcaster.pending():
+            assert time.time() < deadline, "outbox not drained"
+            time.sleep(0.05)
+    finally:
+        bot.receipt_collector.stop()
+        bot.outbox_sender.stop()
+        bot.broadcaster.stop()
+
+
+def _run_async(account_id):
+    import bot_async
+
+    async def main():
+        bot_async.outbox_sender.start()
+        try:
+            for batch in _flow(ASYNC_CUSTOMER, account_id):
+                await asyncio.gather(*(bot_async.bot.process_new_updates([u]) for u in batch))
+            deadline = time.time() + 10
+            while not await bot_async.run_db(_outbox_drained) or bot_async.outbox_sender.pending():
+                assert time.time() < deadline, "outbox not drained"
+                await asyncio.sleep(0.05)
+        finally:
+            await bot_async.receipt_collector.stop()
+            await bot_async.outbox_sender.stop()
+            await bot_async.broadcaster.stop()
+            await bot_async.bot.close_session()
+
+    asyncio.run(main())
+
+
+def test_sync_and_async_runtimes_match():
+    api, account_id = _setup()
+    try:
+        _run_sync(account_id)
+        _run_async(account_id)
+    finally:
+        api.stop()
+
+    sync_txs, async_txs = _transactions(SYNC_CUSTOMER), _transactions(ASYNC_CUSTOMER)
+    # دو «تأیید» هم‌زمان فقط یک تراکنش
+    assert len(sync_txs) == 1 and len(async_txs) == 1
+    (sync_id, *sync_tx), (async_id, *async_tx) = sync_txs[0], async_txs[0]
+    assert sync_tx == async_tx
+    assert sync_tx[2] == "DONE"
+
+    sync_messages = _customer_messages(api, SYNC_CUSTOMER, sync_id)
+    assert sync_messages
+    assert sync_messages == _customer_messages(api, ASYNC_CUSTOMER, async_id)
@@ -0,0 +1,123 @@
+# tests/test_scheduler.py
+# Scheduler و AsyncScheduler: لغو، جایگزینی مهلت، دسته‌بندی مهلت‌های هم‌زمان و تلاش دوباره بعد از خطا
+import asyncio
+import queue
+import time
+
+import pytest
+
+import scheduler
+from scheduler import AsyncScheduler, Scheduler
+
+
+@pytest.fixture
+def fired():
+    return queue.Queue()
+
+
+@pytest.fixture
+def run(fired):
+    started = []
+
+    def make(handle=None):
+        s = Scheduler(handle or (lambda keys: fired.put(sorted(keys))))
+        s.start()
+        started.append(s)
+        return s
+
+    yield make
+    for s in started:
+        s.stop()
+
+
+def test_due_keys_fire_together(run, fired):
+    s = run()
+    now = time.time()
+    s.schedule(("tx", 1), now + 0.05)
+    s.schedule(("tx", 2), now + 0.05)
+    s.schedule(("tx", 3), now + 60)
+    assert fired.get(timeout=2) == [("tx", 1), ("tx", 2)]
+    assert s.pending() == 1
+
+
+def test_cancel_prevents_firing(run, fired):
+    s = run()
+    now = time.time()
+    s.schedule(("quote", 5), now + 0.05)
+    s.schedule(("tx", 1), now + 0.1)
+    s.cancel(("quote", 5))
+    s.cancel(("quote", 404))
+    assert fired.get(timeout=2) == [("tx", 1)]
+    assert fired.empty() and s.pending() == 0
+
+
+def test_reschedule_replaces_deadline(run, fired):
+    s = run()
+    s.schedule(("tx", 1), time.time() + 60)
+    s.schedule(("tx", 1), time.time() + 0.05)
+    assert fired.get(timeout=2) == [("tx", 1)]
+    # ردیف قدیمی heap دوباره اجرا نمی‌شود
+    assert s.pending() == 0
+
+
+def test_failed_batch_is_retried(run, fired, monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_DELAY", 0.05)
+    attempts = []
+
+    def handle(keys):
+        attempts.append(time.time())
+        if len(attempts) == 1:
+            raise RuntimeError("db is locked")
+        fired.put(sorted(keys))
+
+    s = run(handle)
+    s.schedule(("tx", 1), time.time())
+    assert fired.get(timeout=2) == [("tx", 1)]
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+def test_rescheduled_key_keeps_new_deadline_after_failure(run, fired, monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_DELAY", 0.05)
+    failed = []
+
+    def handle(keys):
+        if not failed:
+            # همان کلید در این فاصله برای خیلی بعد schedule شده و بعد handle خطا می‌دهد
+            s.schedule(("tx", 1), time.time() + 60)
+            failed.append(keys)
+            raise RuntimeError("boom")
+        fired.put(sorted(keys))
+
+    s = run(handle)
+    s.schedule(("tx", 1), time.time())
+    time.sleep(0.3)
+    assert failed == [[("tx", 1)]]
+    assert fired.empty()
+    assert s.pending() == 1
+
+
+def test_async_scheduler_cancel_and_retry(monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_DELAY", 0.05)
+
+    async def scenario():
+        calls = []
+        done = asyncio.Event()
+
+        async def handle(keys):
+            calls.append(sorted(keys))
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            done.set()
+
+        s = AsyncScheduler(handle)
+        s.start()
+        now = time.time()
+        s.schedule(("quote", 1), now + 0.02)
+        s.schedule(("tx", 2), now + 0.02)
+        s.cancel(("quote", 1))
+        await asyncio.wait_for(done.wait(), 2)
+        await s.stop()
+        return calls
+
+    assert asyncio.run(scenario()) == [[("tx", 2)], [("tx", 2)]]
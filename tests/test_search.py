@@ -0,0 +1,79 @@
+# tests/test_search.py
+# /find: search_transactions در ایندکس FTS5 جدول زنده و آرشیو؛ پیشوندی، همه کلمه‌ها، جدیدترین اول
+import datetime
+
+import dbconn
+
+
+def _create(db, username, fullname, user_id=10):
+    return db.create_transaction(user_id, username, fullname, 10000, 10000, 1_000_000)
+
+
+def _archive(db, tx_ids):
+    # تراکنش‌های پایان‌یافته با created_at قدیمی به آرشیو می‌روند
+    old = (datetime.datetime.utcnow() - datetime.timedelta(days=400)).isoformat()
+    for tx_id in tx_ids:
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "CANCELLED_BY_ADMIN")
+    with dbconn.unit_of_work() as conn:
+        conn.executemany("UPDATE transactions SET created_at = ? WHERE id = ?", [(old, tx_id) for tx_id in tx_ids])
+    return db.archive_transactions(datetime.datetime.utcnow().isoformat())
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_prefix_search_newest_first(fresh_db):
+    db = fresh_db
+    first = _create(db, "ali_r", "Ali Rezaei")
+    _create(db, "mina", "Mina Karimi")
+    last = _create(db, "alireza", "Alireza Moradi")
+    assert _ids(db.search_transactions(["ali"])) == [last, first]
+    assert _ids(db.search_transactions(["rez"])) == [first]
+    # همه کلمه‌ها باید باشند
+    assert _ids(db.search_transactions(["ali", "mor"])) == [last]
+    assert db.search_transactions(["nobody"]) == []
+
+
+def test_archived_rows_are_found(fresh_db):
+    db = fresh_db
+    archived = [_create(db, "ali_old", "Ali Old"), _create(db, "sara", "Sara Old")]
+    live = _create(db, "ali_new", "Ali New")
+    assert _archive(db, archived) == 2
+    assert dbconn.get_connection().execute("SELECT COUNT(*) FROM main.transactions").fetchone() == (1,)
+
+    rows = db.search_transactions(["ali"])
+    assert _ids(rows) == [live, archived[0]]
+    assert rows[1][2] == "ali_old" and rows[1][5] == "CANCELLED_BY_ADMIN"
+    # ردیف منتقل‌شده از ایندکس زنده حذف شده و دو بار نمی‌آید
+    assert _ids(db.search_transactions(["sara"])) == [archived[1]]
+
+
+def test_limit_applies_across_main_and_archive(fresh_db):
+    db = fresh_db
+    archived = [_create(db, f"ali{i}", "Ali") for i in range(3)]
+    live = [_create(db, f"ali{i}", "Ali") for i in range(3, 6)]
+    _archive(db, archived)
+    assert _ids(db.search_transactions(["ali"], limit=4)) == [live[2], live[1], live[0], archived[2]]
+
+
+def test_recipient_fields_are_indexed_after_update(fresh_db):
+    db = fresh_db
+    tx_id = _create(db, "ali", "Ali")
+    db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT")
+    db.add_receipts(tx_id, 10, [("file", "unique", 1, None)])
+    db.transition_transaction(tx_id, "WAITING_FOR_RECEIPT", "WAITING_FOR_IR_INFO")
+    assert db.search_transactions(["6037"]) == []
+    db.save_recipient_info(tx_id, "Reza Ahmadi", "6037991234567890", "IR120000000000000000000001")
+    assert _ids(db.search_transactions(["6037"])) == [tx_id]
+    assert _ids(db.search_transactions(["ahmadi"])) == [tx_id]
+
+
+def test_query_syntax_is_escaped(fresh_db):
+    db = fresh_db
+    tx_id = _create(db, "ali", 'Ali "the" Rezaei')
+    # کوتیشن، عملگرها و پرانتز در ورودی کاربر خطای FTS نمی‌دهند
+    assert db.search_transactions(['"the']) == db.search_transactions(["the"])
+    assert _ids(db.search_transactions(["the"])) == [tx_id]
+    assert db.search_transactions(["OR"]) == []
+    assert db.search_transactions(["ali)", "NEAR("]) == []
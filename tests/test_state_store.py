@@ -0,0 +1,87 @@
+# tests/test_state_store.py
+# StateStore: ترتیب LRU، انقضای TTL، pop_if اتمیک و ذخیره در SQLite
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import state_store
+from rates import Quote
+from state_store import StateStore, ConversationState, WAITING_UK_AMOUNT, CONFIRM
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(state_store, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_least_recently_used_is_evicted(clock):
+    store = StateStore(max_entries=2, ttl=3600)
+    store.set(1, ConversationState(WAITING_UK_AMOUNT))
+    store.set(2, ConversationState(WAITING_UK_AMOUNT))
+    # خواندن 1 آن را تازه می‌کند؛ پس با ورود 3، چت 2 بیرون می‌رود
+    assert store.step(1) == WAITING_UK_AMOUNT
+    store.set(3, ConversationState(WAITING_UK_AMOUNT))
+    assert [chat_id for chat_id, _ in store.items()] == [1, 3]
+    assert store.get(2) is None
+    assert store.stats()["evictions"] == 1
+
+
+def test_expired_state_is_dropped(clock):
+    store = StateStore(max_entries=10, ttl=60)
+    store.set(1, ConversationState(WAITING_UK_AMOUNT))
+    clock.value += 30
+    store.set(2, ConversationState(WAITING_UK_AMOUNT))
+    clock.value += 31
+    assert store.get(1) is None
+    assert store.step(2) == WAITING_UK_AMOUNT
+    # set بعدی قدیمی‌ها را از سر صف هم پاک می‌کند
+    clock.value += 61
+    store.set(3, ConversationState(WAITING_UK_AMOUNT))
+    assert [chat_id for chat_id, _ in store.items()] == [3]
+    stats = store.stats()
+    assert stats["expirations"] == 2 and stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_pop_if_checks_and_removes_together():
+    store = StateStore()
+    store.set(1, ConversationState(CONFIRM, final=1000))
+    assert store.pop_if(1, lambda s: s.step == WAITING_UK_AMOUNT) is None
+    assert store.step(1) == CONFIRM
+    assert store.pop_if(1, lambda s: s.step == CONFIRM).final == 1000
+    assert store.pop_if(1, lambda s: True) is None
+    assert store.pop(1) is None
+
+
+def test_concurrent_pops_return_the_state_once():
+    store = StateStore()
+    store.set(1, ConversationState(CONFIRM))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def pop():
+        barrier.wait()
+        results.append(store.pop_if(1, lambda s: s.step == CONFIRM))
+
+    threads = [threading.Thread(target=pop) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(state is not None for state in results) == 1
+
+
+def test_persisted_states_survive_restart(fresh_db):
+    store = StateStore(ttl=3600, persist=True)
+    quote = Quote(rate=145000, rate_version=3, amount_toman=15950000, expires_at=2e9)
+    store.set(1, ConversationState(CONFIRM, amount=10000, fee=1000, final=11000, irt=15950000, quote=quote))
+    store.set(2, ConversationState(WAITING_UK_AMOUNT))
+    store.pop(2)
+
+    restarted = StateStore(ttl=3600, persist=True)
+    assert restarted.load() == 1
+    state = restarted.get(1)
+    assert (state.step, state.final, state.quote) == (CONFIRM, 11000, quote)
+    assert restarted.get(2) is None
@@ -0,0 +1,117 @@
+# tests/test_transitions.py
+# transition_transaction(s): UPDATE شرطی روی وضعیت فعلی؛ از دو کلیک همزمان فقط یکی اثر دارد
+import threading
+
+import pytest
+
+import dbconn
+
+
+def _new_tx(db, user_id=10):
+    return db.create_transaction(user_id, "user", "User", 10000, 10200, 2_000_000)
+
+
+def _status(db, tx_id):
+    return db.get_transaction(tx_id)[6]
+
+
+def _outbox_keys():
+    return [row[0] for row in dbconn.get_connection().execute("SELECT idempotency_key FROM outbox ORDER BY id")]
+
+
+def test_transition_checks_current_status(fresh_db):
+    db = fresh_db
+    tx_id = _new_tx(db)
+    assert db.transition_transaction(tx_id, "WAITING_FOR_RECEIPT", "WAITING_FOR_IR_INFO") is None
+    tx = db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT", uk_account_text="acc")
+    assert tx[0] == tx_id and tx[6] == "WAITING_FOR_RECEIPT"
+    # کلیک دوم روی همان دکمه
+    assert db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT") is None
+    conn = dbconn.get_connection()
+    assert conn.execute("SELECT uk_account_text FROM transactions WHERE id = ?", (tx_id,)).fetchone() == ("acc",)
+
+
+def test_invalid_transitions_are_rejected(fresh_db):
+    db = fresh_db
+    tx_id = _new_tx(db)
+    with pytest.raises(ValueError):
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "DONE")
+    with pytest.raises(ValueError):
+        db.transition_transactions([tx_id], ("WAITING_FOR_ACCOUNT", "DONE"), "EXPIRED")
+    with pytest.raises(ValueError):
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT", status="DONE")
+    assert _status(db, tx_id) == "WAITING_FOR_ACCOUNT"
+
+
+def test_outbox_is_written_only_when_the_transition_happens(fresh_db):
+    db = fresh_db
+    tx_id = _new_tx(db)
+
+    def outbox(tx):
+        return [(f"account:{tx[0]}", tx[1], [{"text": "ok"}])]
+
+    assert db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT", outbox=outbox)
+    assert db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT", outbox=outbox) is None
+    assert _outbox_keys() == [f"account:{tx_id}"]
+
+
+def test_concurrent_transitions_let_one_through(fresh_db):
+    db = fresh_db
+    tx_id = _new_tx(db)
+    start = threading.Barrier(8)
+    results = []
+
+    def click(to_status):
+        start.wait()
+        results.append(db.transition_transaction(
+            tx_id, "WAITING_FOR_ACCOUNT", to_status,
+            outbox=lambda tx: [(f"{to_status}:{threading.get_ident()}", tx[1], [])],
+        ))
+
+    threads = [
+        threading.Thread(target=click, args=("WAITING_FOR_RECEIPT" if i % 2 else "CANCELLED_BY_ADMIN",))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    winners = [tx for tx in results if tx is not None]
+    assert len(winners) == 1
+    assert _status(db, tx_id) == winners[0][6]
+    assert len(_outbox_keys()) == 1
+
+
+def test_batch_skips_rows_that_already_moved(fresh_db):
+    db = fresh_db
+    ids = [_new_tx(db, user_id=10 + i) for i in range(3)]
+    for tx_id in ids:
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT")
+    # ادمین دیگری یکی را زودتر رد کرده
+    db.transition_transaction(ids[1], "WAITING_FOR_RECEIPT", "RECEIPT_REJECTED")
+
+    messages = []
+
+    def outbox(rows):
+        messages.extend(rows)
+        return [(f"cancel:{row[0]}", row[1], []) for row in rows]
+
+    changed = db.transition_transactions(ids, "WAITING_FOR_RECEIPT", "CANCELLED_BY_ADMIN", outbox=outbox)
+    assert [row[0] for row in changed] == [ids[0], ids[2]]
+    assert all(row[6] == "CANCELLED_BY_ADMIN" for row in changed)
+    assert [row[0] for row in messages] == [ids[0], ids[2]]
+    assert _outbox_keys() == [f"cancel:{ids[0]}", f"cancel:{ids[2]}"]
+    assert _status(db, ids[1]) == "RECEIPT_REJECTED"
+    # دور دوم چیزی برای تغییر پیدا نمی‌کند و outbox هم صدا زده نمی‌شود
+    assert db.transition_transactions(ids, "WAITING_FOR_RECEIPT", "CANCELLED_BY_ADMIN", outbox=outbox) == []
+    assert len(messages) == 2
+
+
+def test_batch_with_receipt_only_touches_rows_with_a_receipt(fresh_db):
+    db = fresh_db
+    ids = [_new_tx(db, user_id=20 + i) for i in range(2)]
+    for tx_id in ids:
+        db.transition_transaction(tx_id, "WAITING_FOR_ACCOUNT", "WAITING_FOR_RECEIPT")
+    assert db.add_receipts(ids[0], 20, [("file-a", "unique-a", 1, None)]) == [("file-a", 1)]
+    changed = db.transition_transactions(ids, "WAITING_FOR_RECEIPT", "WAITING_FOR_IR_INFO", with_receipt=True)
+    assert [row[0] for row in changed] == [ids[0]]
@@ -0,0 +1,90 @@
+# tests/test_webhook.py
+# WebhookServer.receive: حذف updateهای تکراری، 429 وقتی صف پر است و ورودی‌های نامعتبر
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from webhook import UpdateDeduplicator, WebhookServer
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(dispatch=lambda updates: None, **kwargs):
+        server = WebhookServer(dispatch, host="127.0.0.1", port=0, **kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.httpd.server_close()
+
+
+def _body(*update_ids):
+    updates = [{"update_id": update_id} for update_id in update_ids]
+    return json.dumps(updates[0] if len(updates) == 1 else updates).encode()
+
+
+def test_duplicate_update_is_accepted_once(make_server):
+    server = make_server()
+    assert server.receive("/telegram", {}, _body(10)) == (200, {})
+    assert server.receive("/telegram", {}, _body(10)) == (200, {})
+    assert server.queue.qsize() == 1
+    assert server.stats["accepted"] == 1 and server.stats["duplicates"] == 1
+
+
+def test_full_queue_returns_429_and_forgets_rejected_updates(make_server):
+    server = make_server(queue_size=2, retry_after=3)
+    status, headers = server.receive("/telegram", {}, _body(1, 2, 3))
+    assert (status, headers) == (429, {"Retry-After": "3"})
+    assert server.stats["accepted"] == 2 and server.stats["rejected_full"] == 1
+
+    # تلگرام همان update را دوباره می‌فرستد؛ نباید تکراری حساب شود
+    server.queue.get_nowait()
+    assert server.receive("/telegram", {}, _body(3)) == (200, {})
+    assert server.stats["duplicates"] == 0
+    assert [server.queue.get_nowait()["update_id"] for _ in range(2)] == [2, 3]
+
+
+def test_invalid_requests_are_rejected(make_server):
+    server = make_server(secret="s3cret")
+    good = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+    assert server.receive("/other", good, _body(1))[0] == 404
+    assert server.receive("/telegram", {"X-Telegram-Bot-Api-Secret-Token": "nope"}, _body(1))[0] == 403
+    assert server.receive("/telegram", {}, _body(1))[0] == 403
+    assert server.receive("/telegram", good, b"{not json")[0] == 400
+    assert server.receive("/telegram", good, b"[1, null]")[0] == 400
+    assert server.queue.qsize() == 0
+
+
+def test_deduplicator_forgets_oldest_ids():
+    dedup = UpdateDeduplicator(capacity=2)
+    assert dedup.add(1) and dedup.add(2) and dedup.add(3)
+    assert not dedup.add(3)
+    # 1 از پنجره بیرون رفته است
+    assert dedup.add(1)
+
+
+def test_posted_update_reaches_dispatch(make_server):
+    received = []
+    done = threading.Event()
+
+    def dispatch(updates):
+        received.extend(update.update_id for update in updates)
+        done.set()
+
+    server = make_server(dispatch, workers=1)
+    server.start()
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.port}/telegram", data=_body(42), method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.status == 200
+        assert done.wait(5)
+    finally:
+        server.stop()
+    assert received == [42]
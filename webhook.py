@@ -0,0 +1,181 @@
+# webhook.py
+import hmac
+import json
+import queue
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_BATCH_SIZE,
+)
+
+
+class UpdateDeduplicator:
+    # تلگرام در صورت timeout یک update را دوباره می‌فرستد؛ آخرین update_idها را نگه می‌داریم
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, update_id):
+        with self._lock:
+            if update_id in self._seen:
+                return False
+            self._seen[update_id] = None
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return True
+
+    def forget(self, update_id):
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+
+class WebhookServer:
+    def __init__(self, dispatch, host="0.0.0.0", port=8443, path="/telegram", secret=None,
+                 queue_size=1000, workers=4, batch_size=32, retry_after=1):
+        self.dispatch = dispatch
+        self.path = path
+        self.secret = secret
+        self.batch_size = batch_size
+        self.retry_after = retry_after
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dedup = UpdateDeduplicator()
+        self.stats = {"accepted": 0, "duplicates": 0, "rejected_full": 0, "dispatched": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status, headers = server.receive(self.path, self.headers, self._body())
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def receive(self, path, headers, body):
+        if path != self.path:
+            return 404, {}
+        if self.secret:
+            token = headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+            if not hmac.compare_digest(token, self.secret):
+                return 403, {}
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {}
+        # تلگرام همیشه یک update می‌فرستد؛ لیست برای replay آپدیت‌های ضبط‌شده است
+        updates = payload if isinstance(payload, list) else [payload]
+        # JSON معتبر ولی غیر از شیء (عدد، null، ...) هیچ‌وقت درست نمی‌شود؛ 400 تا تلگرام دوباره نفرستد
+        if not all(isinstance(update, dict) for update in updates):
+            return 400, {}
+
+        for i, update in enumerate(updates):
+            update_id = update.get("update_id")
+            if update_id is not None and not self.dedup.add(update_id):
+                self._count("duplicates")
+                continue
+            try:
+                self.queue.put_nowait(update)
+            except queue.Full:
+                # backpressure: این update و باقی‌مانده دوباره ارسال می‌شوند، پس نباید duplicate حساب شوند
+                for pending in updates[i:]:
+                    if pending.get("update_id") is not None:
+                        self.dedup.forget(pending["update_id"])
+                self._count("rejected_full", len(updates) - i)
+                return 429, {"Retry-After": str(self.retry_after)}
+            self._count("accepted")
+        return 200, {}
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self.dispatch([types.Update.de_json(u) for u in batch])
+                self._count("dispatched", len(batch))
+            except Exception as e:
+                self._count("errors")
+                print(f"webhook dispatch failed: {e!r}")
+            if stop:
+                return
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self.httpd.serve_forever, name="webhook-http", daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+def build_server(dispatch):
+    return WebhookServer(
+        dispatch,
+        host=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET or None,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        # فقط deserialize و تحویل به dispatcher؛ یک worker تا ترتیب صف وب‌هوک به هم نخورد
+        workers=1,
+        batch_size=WEBHOOK_BATCH_SIZE,
+    )
+
+
+def public_url():
+    if not WEBHOOK_URL:
+        return None
+    return WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
@@ -0,0 +1,69 @@
+# webhook_replay.py
+# جایگزین محلی تلگرام برای تست حالت webhook: update‌های ضبط‌شده را به سرور محلی POST می‌کند
+#
+#   python webhook_replay.py updates.jsonl --url http://127.0.0.1:8443/telegram --secret s3cret
+#
+# فایل ورودی می‌تواند JSONL (یک update در هر خط) یا یک آرایه JSON باشد.
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def post_update(url, update, secret=None, retries=5):
+    body = json.dumps(update).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+
+    statuses = []
+    for _ in range(retries + 1):
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                statuses.append(resp.status)
+                return statuses
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+            if e.code != 429:
+                return statuses
+            # مثل تلگرام: بعد از 429 صبر کن و همان update را دوباره بفرست
+            time.sleep(float(e.headers.get("Retry-After") or 1))
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST recorded Telegram updates to a local webhook")
+    parser.add_argument("file")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="ارسال دوباره هر update برای تست حذف تکراری‌ها")
+    args = parser.parse_args()
+
+    updates = load_updates(args.file) * args.repeat
+    counts = Counter()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for statuses in pool.map(lambda u: post_update(args.url, u, args.secret), updates):
+            counts.update(statuses)
+    elapsed = time.perf_counter() - started
+
+    print(f"sent {len(updates)} updates in {elapsed:.2f}s")
+    for status, n in sorted(counts.items()):
+        print(f"  HTTP {status}: {n}")
+
+
+if __name__ == "__main__":
+    main()